@@ -1,10 +1,16 @@
 from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import FileResponse, JSONResponse
 from typing import Dict, Any, List, Optional
+import asyncio
 import logging
-from app.models.schemas import GraphDefinition, WorkflowState, WorkflowStateWithLogs, ExecutionStep
-from app.core.engine import WorkflowEngine
+from app.models.schemas import GraphDefinition, WorkflowState, WorkflowStateWithLogs, ExecutionStep, BatchRunRequest
+from app.core.engine import WorkflowEngine, TERMINAL_STATUSES
+from app.core.scheduler import RunScheduler, SchedulerFull
+from app.core.persistence import PersistenceQueue
+from app.core.run_queue import RunQueue
+from app.core.executors import executor_pools, process_pool
 from app.core.storage import BaseStorage, InMemoryStorage, SQLiteStorage
-from app.core.websocket_manager import manager as ws_manager
+from app.core.websocket_manager import ConnectionManager, manager as ws_manager
 
 logger = logging.getLogger(__name__)
 
@@ -24,14 +30,51 @@ def get_storage() -> BaseStorage:
     
     if storage_type == "sqlite":
         db_url = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./workflow.db")
-        _storage_instance = SQLiteStorage(db_url)
+        # Front-ends and workers write the same file concurrently in queue mode
+        _storage_instance = SQLiteStorage(db_url, wal=get_execution_mode() == "queue")
     else:
         _storage_instance = InMemoryStorage()
     
     return _storage_instance
 
-def get_engine():
-    return WorkflowEngine(get_storage())
+def get_execution_mode() -> str:
+    """'local': runs execute in this process. 'queue': they go to worker processes (see app.worker)."""
+    mode = os.getenv("EXECUTION_MODE", "local").lower()
+    if mode not in ("local", "queue"):
+        raise ValueError(f"Unknown EXECUTION_MODE '{mode}' (expected 'local' or 'queue').")
+    return mode
+
+def open_run_queue() -> RunQueue:
+    """The run queue shared by front-ends and workers on this host."""
+    return RunQueue(
+        os.getenv("RUN_QUEUE_PATH", "./run_queue.db"),
+        lease_seconds=float(os.getenv("RUN_LEASE_SECONDS", "30")),
+        poll_interval=float(os.getenv("RUN_QUEUE_POLL_MS", "50")) / 1000,
+    )
+
+def create_engine(run_queue: Optional[RunQueue] = None) -> WorkflowEngine:
+    """An engine on the shared storage, configured from the environment."""
+    scheduler = RunScheduler(
+        max_concurrent_runs=int(os.getenv("MAX_CONCURRENT_RUNS", "64")),
+        max_queue_size=int(os.getenv("MAX_QUEUED_RUNS", "10000")),
+    )
+    persistence = PersistenceQueue(
+        get_storage(),
+        mode=os.getenv("PERSISTENCE_MODE", "batched").lower(),
+        flush_interval=float(os.getenv("PERSISTENCE_FLUSH_MS", "50")) / 1000,
+        batch_size=int(os.getenv("PERSISTENCE_BATCH_SIZE", "500")),
+    )
+    return WorkflowEngine(get_storage(), scheduler, persistence=persistence, run_queue=run_queue)
+
+_engine_instance = None
+
+def get_engine() -> WorkflowEngine:
+    # Shared so compiled plans stay cached across requests
+    global _engine_instance
+    if _engine_instance:
+        return _engine_instance
+    _engine_instance = create_engine(open_run_queue() if get_execution_mode() == "queue" else None)
+    return _engine_instance
 
 @router.post("/create", response_model=Dict[str, str])
 async def create_graph(definition: GraphDefinition, engine: WorkflowEngine = Depends(get_engine)):
@@ -41,9 +84,13 @@ async def create_graph(definition: GraphDefinition, engine: WorkflowEngine = Dep
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@router.post("/run", response_model=Dict[str, str])
+@router.post("/run", responses={202: {"description": "wait=true and the timeout elapsed; poll /graph/state/{run_id}"}})
 async def run_graph(
     payload: Dict[str, Any], 
+    wait: bool = Query(False, description="Execute and return the final WorkflowState in this response"),
+    timeout: float = Query(30.0, gt=0, le=300, description="With wait=true, seconds to wait before answering 202 with the run_id"),
+    persist: bool = Query(True, description="Persist state on every transition. false writes the run only when queued and when finished."),
+    profile: bool = Query(False, description="Profile every tool call; artifacts are served under /graph/profile/{run_id}"),
     engine: WorkflowEngine = Depends(get_engine)
 ):
     """
@@ -60,36 +107,149 @@ async def run_graph(
         raise HTTPException(status_code=400, detail="graph_id is required")
 
     try:
-        run_id = await engine.start_run(graph_id, initial_state)
+        run_id = await engine.start_run(graph_id, initial_state, persist_intermediate=persist, profile=profile)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except SchedulerFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    if not wait:
         return {"run_id": run_id, "status": "started"}
+
+    final_state = await engine.wait_for_run(run_id, timeout)
+    if final_state is None:
+        return JSONResponse(status_code=202, content={"run_id": run_id, "status": "running"})
+    return final_state
+
+@router.post("/run/batch")
+async def run_graph_batch(
+    request: BatchRunRequest,
+    wait: bool = Query(False, description="Wait for the runs and include a per-status summary"),
+    timeout: float = Query(30.0, gt=0, le=300, description="With wait=true, seconds to wait for the whole batch"),
+    persist: bool = Query(True, description="Persist state on every transition. false writes each run only when queued and when finished."),
+    engine: WorkflowEngine = Depends(get_engine)
+):
+    """Start one run of a graph per initial state. Returns run_ids in the order of initial_states."""
+    try:
+        run_ids = await engine.start_runs(request.graph_id, request.initial_states, persist_intermediate=persist)
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
+    except SchedulerFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    response: Dict[str, Any] = {"run_ids": run_ids, "status": "started"}
+    if wait:
+        # wait_for_run returns None for runs still going when the timeout elapses
+        results = await asyncio.gather(*(engine.wait_for_run(run_id, timeout) for run_id in run_ids))
+        summary: Dict[str, int] = {}
+        for result in results:
+            status = result.status if result else "running"
+            summary[status] = summary.get(status, 0) + 1
+        response["summary"] = summary
+        response["status"] = "running" if "running" in summary else "finished"
+    return response
+
+@router.post("/run/{run_id}/cancel", response_model=WorkflowState)
+async def cancel_run(run_id: str, engine: WorkflowEngine = Depends(get_engine)):
+    """Cancel a queued or running run. Returns its final state (status 'cancelled')."""
+    run = await engine.get_run(run_id)
+    if not run:
+        raise HTTPException(status_code=404, detail="Run not found")
+    if run.status in TERMINAL_STATUSES:
+        raise HTTPException(status_code=409, detail=f"Run already {run.status}")
+    return await engine.cancel_run(run_id)
+
+@router.get("/scheduler/stats")
+async def scheduler_stats(engine: WorkflowEngine = Depends(get_engine)):
+    """Run scheduler state: active runs, queue depth and queue wait times."""
+    return engine.scheduler.stats()
+
+@router.get("/queue/stats")
+async def queue_stats(engine: WorkflowEngine = Depends(get_engine)):
+    """Shared run queue (EXECUTION_MODE=queue): queued and leased runs, runs per worker, expired leases."""
+    if engine.run_queue is None:
+        raise HTTPException(status_code=404, detail="Runs execute in this process (EXECUTION_MODE=local)")
+    return await engine.run_queue.stats()
+
+@router.get("/executors/stats")
+async def executor_stats():
+    """Per-pool active/queued sync tool calls; the process pool is reported as 'process'."""
+    stats = executor_pools.stats()
+    stats["process"] = process_pool.stats()
+    return stats
+
+@router.get("/persistence/stats")
+async def persistence_stats(engine: WorkflowEngine = Depends(get_engine)):
+    """Write-behind queue: durability mode, queued writes and flush counts."""
+    return engine.persistence.stats()
+
+@router.get("/cache/stats")
+async def cache_stats(engine: WorkflowEngine = Depends(get_engine)):
+    """Per-tool hits, misses and evictions of the pure tool result cache."""
+    return engine.cache.stats()
+
+@router.get("/batching/stats")
+async def batching_stats(engine: WorkflowEngine = Depends(get_engine)):
+    """Per batch tool: batch counts, mean size and wait, and a batch size histogram."""
+    return engine.batcher.stats()
+
+@router.get("/trace/{run_id}")
+async def get_trace(run_id: str, engine: WorkflowEngine = Depends(get_engine)):
+    """Span tree of the run's most recent trace, if the run was sampled and its trace is still buffered."""
+    trace = engine.tracer.get_trace(run_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="No trace for this run (not sampled, or no longer buffered)")
+    return trace
+
+@router.get("/profile/{run_id}")
+async def get_profile(run_id: str, engine: WorkflowEngine = Depends(get_engine)):
+    """Per-node profile summary of a run started with profile=true: calls, wall time and top functions."""
+    summary = engine.profiles.get_summary(run_id)
+    if summary is None:
+        raise HTTPException(status_code=404, detail="No profile for this run")
+    return summary
+
+@router.get("/profile/{run_id}/{kind}")
+async def download_profile(run_id: str, kind: str, engine: WorkflowEngine = Depends(get_engine)):
+    """Download a profile artifact: 'pstats' (for pstats/snakeviz) or 'collapsed' (for flame graphs)."""
+    if kind not in ("pstats", "collapsed"):
+        raise HTTPException(status_code=404, detail="Unknown artifact (expected 'pstats' or 'collapsed')")
+    path = engine.profiles.path(run_id, kind)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="No profile for this run")
+    media_type = "application/octet-stream" if kind == "pstats" else "text/plain"
+    return FileResponse(path, media_type=media_type, filename=f"{run_id}.{kind}")
 
 @router.get("/state/{run_id}")
 async def get_state(
     run_id: str, 
     include_logs: Optional[bool] = Query(False, description="Include execution logs in response"),
+    expand: Optional[bool] = Query(False, description="Rebuild full input/output snapshots for delta-mode logs"),
     engine: WorkflowEngine = Depends(get_engine)
 ):
     """Get workflow state, optionally including execution logs."""
-    state = await engine.storage.get_run(run_id)
+    state = await engine.get_run(run_id)
     if not state:
         raise HTTPException(status_code=404, detail="Run not found")
     
     if include_logs:
-        logs = await engine.storage.get_logs(run_id)
+        logs = await engine.storage.get_logs(run_id, expand=expand)
         # Return WorkflowStateWithLogs
         return WorkflowStateWithLogs(**state.model_dump(), logs=logs)
     
     return state
 
-@router.get("/logs/{run_id}", response_model=List[ExecutionStep])
-async def get_logs(run_id: str, engine: WorkflowEngine = Depends(get_engine)):
+@router.get("/logs/{run_id}", response_model=List[ExecutionStep], response_model_exclude_none=True)
+async def get_logs(
+    run_id: str,
+    expand: Optional[bool] = Query(False, description="Rebuild full input/output snapshots for delta-mode logs"),
+    engine: WorkflowEngine = Depends(get_engine)
+):
     """Get execution logs for a specific workflow run."""
-    logs = await engine.storage.get_logs(run_id)
+    logs = await engine.storage.get_logs(run_id, expand=expand)
     if not logs:
         # Check if run exists
-        run = await engine.storage.get_run(run_id)
+        run = await engine.get_run(run_id)
         if not run:
             raise HTTPException(status_code=404, detail="Run not found")
         # Run exists but no logs yet
@@ -104,12 +264,55 @@ async def get_graph(graph_id: str, engine: WorkflowEngine = Depends(get_engine))
         raise HTTPException(status_code=404, detail="Graph not found")
     return graph
 
+# Relays of stored events to WebSocket clients, for runs executed by worker processes
+_relays: Dict[str, asyncio.Task] = {}
+
+async def _relay_stored_events(run_id: str, engine: WorkflowEngine, manager: ConnectionManager = ws_manager):
+    """
+    Broadcasts a worker-executed run's logs and status changes as they reach
+    storage, until the run finishes. Workers have no WebSocket clients of their
+    own, so this is how clients of a front-end follow the run.
+    """
+    sent, started = 0, False
+    try:
+        while True:
+            # Read the run before its logs, so a finished run's logs are all there
+            run = await engine.get_run(run_id)
+            logs = await engine.storage.get_logs(run_id)
+            if not started and (logs or (run is not None and run.status == "running")):
+                started = True
+                await manager.broadcast_status(run_id, "running", "Workflow execution started")
+            for log in logs[sent:]:
+                await manager.broadcast_log(run_id, {
+                    "type": "log",
+                    "run_id": run_id,
+                    "node_id": log.node_id,
+                    "data": log.model_dump(mode="json", exclude_none=True)
+                })
+            sent = len(logs)
+            if run is None:
+                return
+            if run.status in TERMINAL_STATUSES:
+                await manager.broadcast_status(run_id, run.status, run.message)
+                return
+            await asyncio.sleep(engine.run_queue.poll_interval)
+    except Exception as e:
+        logger.error(f"Relaying events of run {run_id} failed: {e}")
+    finally:
+        _relays.pop(run_id, None)
+
 @router.websocket("/ws/run/{run_id}")
-async def websocket_endpoint(websocket: WebSocket, run_id: str, engine: WorkflowEngine = Depends(get_engine)):
+async def websocket_endpoint(
+    websocket: WebSocket,
+    run_id: str,
+    last_seq: int = Query(0, description="Replay only events with a higher sequence number (for reconnects)"),
+    engine: WorkflowEngine = Depends(get_engine)
+):
     """
     WebSocket endpoint for streaming workflow execution logs in real-time.
     
     Connect to ws://localhost:8000/graph/ws/run/{run_id} to receive:
+    - Events emitted before the client connected (replayed from a per-run buffer)
     - Execution step logs as they happen
     - Status updates (running, completed, failed)
     - Real-time workflow progress
@@ -117,39 +320,48 @@ async def websocket_endpoint(websocket: WebSocket, run_id: str, engine: Workflow
     Message format:
     {
         "type": "log" | "status",
+        "seq": 1,          # per-run sequence number (absent on the connect greeting)
         "run_id": "...",
         "node_id": "...",  # for type=log
         "status": "...",   # for type=status
         "data": {...}      # execution step data or state
     }
     """
-    # Accept connection first
-    await ws_manager.connect(websocket, run_id)
-    
-    # Check if run exists
-    run = await engine.storage.get_run(run_id)
+    # Check if run exists before anything is buffered for it
+    run = await engine.get_run(run_id)
     if not run:
-        await ws_manager.disconnect(websocket, run_id)
+        await websocket.accept()
         await websocket.close(code=1008, reason="Run not found")
         return
+
+    # Buffered events are replayed before any live ones
+    complete = await ws_manager.connect(websocket, run_id, last_seq)
     
     try:
-        # Send initial status
-        await ws_manager.broadcast_status(
-            run_id, 
-            run.status, 
-            f"Connected to workflow {run_id}"
-        )
-        
-        # Send existing logs if any
-        logs = await engine.storage.get_logs(run_id)
-        for log in logs:
-            await ws_manager.broadcast_log(run_id, {
-                "type": "log",
-                "run_id": run_id,
-                "node_id": log.node_id,
-                "data": log.model_dump(mode="json")
-            })
+        if not complete:
+            # Buffer doesn't cover this run (trimmed, evicted or from a previous process): send stored logs
+            logs = await engine.storage.get_logs(run_id)
+            for log in logs:
+                await websocket.send_json({
+                    "type": "log",
+                    "run_id": run_id,
+                    "node_id": log.node_id,
+                    "data": log.model_dump(mode="json", exclude_none=True)
+                })
+
+        # Send current status to this client only
+        await websocket.send_json({
+            "type": "status",
+            "run_id": run_id,
+            "status": run.status,
+            "message": f"Connected to workflow {run_id}"
+        })
+
+        # A worker process executes the run: follow it through storage, unless
+        # a relay already is or has already filled the event buffer
+        buffer = ws_manager.buffers.get(run_id)
+        if engine.run_queue is not None and run_id not in _relays and (buffer is None or not buffer.events):
+            _relays[run_id] = asyncio.create_task(_relay_stored_events(run_id, engine))
         
         # Keep connection alive and listen for client messages
         while True:
@@ -167,4 +379,3 @@ async def websocket_endpoint(websocket: WebSocket, run_id: str, engine: Workflow
     
     finally:
         await ws_manager.disconnect(websocket, run_id)
-
@@ -0,0 +1,156 @@
+"""Cross-run micro-batching for batch tools.
+
+A tool registered with ``batch=True`` takes a list of states and returns a
+list of results, one per state and in the same order::
+
+    @ToolRegistry.register(batch=True, inputs=["text"], max_batch_size=64, max_batch_wait_ms=5)
+    def score_texts(states, model="small"):
+        scores = load_model(model).score([s["text"] for s in states])
+        return [{"score": score} for score in scores]
+
+Concurrent invocations of the tool with the same params and dispatch
+settings (the engine passes the node's execution mode and executor pool),
+from any number of runs, are collected into one call. A batch is dispatched when it holds
+``max_batch_size`` states, or ``max_batch_wait_ms`` after its first state
+arrived, whichever comes first. Each waiting node gets its own result back.
+
+Batch sizes are recorded per tool (``MicroBatcher.stats``) to help tune
+the two limits.
+"""
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the batch size histogram buckets
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+
+class _OpenBatch:
+    """States waiting for the next call of one tool with one set of params."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, tool: str):
+        self.loop = loop
+        self.tool = tool
+        self.states: List[Any] = []
+        self.futures: List[asyncio.Future] = []
+        self.opened = time.monotonic()
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class _BatchStats:
+    def __init__(self):
+        self.batches = 0
+        self.items = 0
+        self.full = 0 # Dispatched because max_batch_size was reached
+        self.wait_ms = 0.0
+        self.buckets = [0] * (len(BATCH_SIZE_BUCKETS) + 1)
+
+    def record(self, size: int, full: bool, wait_ms: float):
+        self.batches += 1
+        self.items += size
+        self.full += full
+        self.wait_ms += wait_ms
+        for i, bound in enumerate(BATCH_SIZE_BUCKETS):
+            if size <= bound:
+                self.buckets[i] += 1
+                return
+        self.buckets[-1] += 1
+
+
+class MicroBatcher:
+    """Groups concurrent calls of batch tools. Must be used from the event loop."""
+
+    def __init__(self):
+        self._open: Dict[Tuple[str, Tuple, str], _OpenBatch] = {}
+        self._stats: Dict[str, _BatchStats] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    @staticmethod
+    def _params_key(params: Mapping[str, Any]) -> str:
+        return json.dumps(dict(params), sort_keys=True, default=repr)
+
+    def submit(
+        self,
+        tool: str,
+        params: Mapping[str, Any],
+        state: Any,
+        max_batch_size: int,
+        max_batch_wait_ms: float,
+        dispatch: Callable[[List[Any]], Awaitable[List[Any]]],
+        group: Tuple = (),
+    ) -> "asyncio.Future":
+        """
+        Adds state to the tool's open batch and returns a future for its
+        result. dispatch(states) performs the batch call, and the first
+        caller's is used for the whole batch, so group must hold everything
+        else dispatch depends on: only calls with the same tool, params and
+        group share a batch.
+        """
+        loop = asyncio.get_running_loop()
+        key = (tool, group, self._params_key(params))
+        batch = self._open.get(key)
+        if batch is None or batch.loop is not loop:
+            batch = _OpenBatch(loop, tool)
+            self._open[key] = batch
+            batch.timer = loop.call_later(max_batch_wait_ms / 1000, self._dispatch, key, batch, dispatch, False)
+        future = loop.create_future()
+        batch.states.append(state)
+        batch.futures.append(future)
+        if len(batch.states) >= max_batch_size:
+            self._dispatch(key, batch, dispatch, True)
+        return future
+
+    def _dispatch(self, key: Tuple[str, Tuple, str], batch: _OpenBatch, dispatch, full: bool):
+        if self._open.get(key) is batch:
+            del self._open[key]
+        batch.timer.cancel()
+        # Callers that timed out or were cancelled while waiting drop out
+        waiting = [(state, future) for state, future in zip(batch.states, batch.futures) if not future.done()]
+        if not waiting:
+            return
+        self._stats.setdefault(batch.tool, _BatchStats()).record(
+            len(waiting), full, (time.monotonic() - batch.opened) * 1000
+        )
+        task = batch.loop.create_task(self._run(batch.tool, waiting, dispatch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    @staticmethod
+    async def _run(tool: str, waiting: List[Tuple[Any, asyncio.Future]], dispatch):
+        try:
+            results = await dispatch([state for state, _ in waiting])
+            if not isinstance(results, (list, tuple)) or len(results) != len(waiting):
+                count = len(results) if isinstance(results, (list, tuple)) else type(results).__name__
+                raise ValueError(f"Batch tool '{tool}' returned {count} results for {len(waiting)} states")
+        except Exception as e:
+            for _, future in waiting:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(waiting, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per tool: batch count, items, mean size and wait, and a batch size histogram (count per bucket)."""
+        report = {}
+        for tool, stats in self._stats.items():
+            histogram = {str(bound): count for bound, count in zip(BATCH_SIZE_BUCKETS, stats.buckets)}
+            histogram["+Inf"] = stats.buckets[-1]
+            report[tool] = {
+                "batches": stats.batches,
+                "items": stats.items,
+                "full_batches": stats.full,
+                "mean_batch_size": stats.items / stats.batches,
+                "mean_wait_ms": stats.wait_ms / stats.batches,
+                "batch_size_histogram": histogram,
+            }
+        return report
+
+
+# Global instance
+micro_batcher = MicroBatcher()
@@ -0,0 +1,322 @@
+"""Result cache for pure tools.
+
+Tools registered with ``pure=True`` are deterministic functions of their
+declared ``inputs`` and params, so the engine can reuse an earlier result
+instead of calling them again. Entries are keyed by tool name, tool
+version, params and a hash of the declared input values.
+
+Results are stored pickled, so a cached value can't be changed through a
+state that later mutates it, and sizes are known for the memory bound. The
+cache is made of tiers that are checked in order: an in-process LRU
+(``MemoryCacheTier``) and optionally an on-disk tier (``DiskCacheTier``).
+A hit in a lower tier is promoted to the tiers above it. The engine goes
+through ``lookup`` and ``store``, which call tiers doing file I/O on a
+worker thread so they don't block the event loop.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import pickle
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class _NotCanonical(TypeError):
+    """A value _encode can't encode."""
+
+
+def _encode(value: Any) -> Any:
+    """
+    JSON-ready form of value that keeps types apart: scalars stay as they
+    are (JSON already tells 1, 1.0, "1" and true apart) and every container
+    becomes a tagged list, with dict items and set members sorted.
+    """
+    if value is None or isinstance(value, (str, bool, int, float)):
+        return value
+    if isinstance(value, dict):
+        items = [[_encode(key), _encode(item)] for key, item in value.items()]
+        if all(isinstance(key, str) for key in value):
+            items.sort(key=lambda pair: pair[0])
+        else:
+            items.sort(key=lambda pair: json.dumps(pair[0]))
+        return ["d", items]
+    if isinstance(value, list):
+        return ["l", [_encode(item) for item in value]]
+    if isinstance(value, tuple):
+        return ["t", [_encode(item) for item in value]]
+    if isinstance(value, (set, frozenset)):
+        return ["s", sorted((_encode(item) for item in value), key=json.dumps)]
+    raise _NotCanonical(type(value).__name__)
+
+
+class CacheTier(ABC):
+    """One storage level of the result cache. Values are pickled bytes."""
+
+    blocking = False # True if get/set do I/O; ResultCache.lookup/store then call them off the event loop
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[bytes]: pass
+
+    @abstractmethod
+    def set(self, key: str, tool: str, blob: bytes): pass
+
+
+class MemoryCacheTier(CacheTier):
+    """LRU bounded by total size in bytes, with an optional TTL (seconds, 0 = none)."""
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, ttl: float = 0, on_evict: Optional[Callable[[str], None]] = None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self.size = 0
+        # key -> (tool, blob, expires_at)
+        self._entries: "OrderedDict[str, Tuple[str, bytes, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            tool, blob, expires_at = entry
+            if expires_at and expires_at < time.monotonic():
+                self._remove(key, evicted=True)
+                return None
+            self._entries.move_to_end(key)
+            return blob
+
+    def set(self, key: str, tool: str, blob: bytes):
+        if len(blob) > self.max_bytes:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl else 0.0
+        with self._lock:
+            if key in self._entries:
+                self._remove(key, evicted=False)
+            self._entries[key] = (tool, blob, expires_at)
+            self.size += len(blob)
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)), evicted=True)
+
+    def _remove(self, key: str, evicted: bool):
+        tool, blob, _ = self._entries.pop(key)
+        self.size -= len(blob)
+        if evicted and self.on_evict:
+            self.on_evict(tool)
+
+
+class DiskCacheTier(CacheTier):
+    """
+    One file per entry under a directory, bounded by total size in bytes,
+    with an optional TTL (seconds, 0 = none). Reads refresh a file's mtime,
+    and eviction removes the least recently used files first.
+    """
+
+    blocking = True
+
+    def __init__(self, directory: str, ttl: float = 0, max_bytes: int = 1024 * 1024 * 1024):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self.size = sum(size for _, size, _ in self._scan())
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def _scan(self) -> List[Tuple[float, int, str]]:
+        """(mtime, size, path) of every entry file, oldest first."""
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.startswith("."):
+                    continue # Being written
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+        return entries
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            if self.ttl:
+                stat = os.stat(path)
+                if time.time() - stat.st_mtime > self.ttl:
+                    os.remove(path)
+                    with self._lock:
+                        self.size -= stat.st_size
+                    return None
+            with open(path, "rb") as f:
+                blob = f.read()
+            if not self.ttl:
+                # Marks the entry as recently used (with a TTL, mtime is the write time)
+                os.utime(path)
+            return blob
+        except OSError:
+            return None
+
+    def set(self, key: str, tool: str, blob: bytes):
+        if len(blob) > self.max_bytes:
+            return
+        path = self._path(key)
+        # Write-then-rename so readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(blob)
+            try:
+                replaced = os.path.getsize(path) # Rewriting a key replaces its file
+            except OSError:
+                replaced = 0
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write result cache entry: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+        with self._lock:
+            self.size += len(blob) - replaced
+            if self.size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Removes the least recently used files until the tier is 10% under max_bytes."""
+        # Rescanned rather than tracked: other processes may share the directory
+        entries = self._scan()
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self.size = total
+
+
+class ResultCache:
+    """Tiered cache of pure tool results with per-tool hit/miss/eviction counters."""
+
+    def __init__(self, tiers: Optional[Sequence[CacheTier]] = None):
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+        self.set_tiers(tiers if tiers is not None else [MemoryCacheTier()])
+
+    def set_tiers(self, tiers: Sequence[CacheTier]):
+        """Replaces the cache tiers (first is checked first). Existing entries in dropped tiers are lost."""
+        for tier in tiers:
+            if isinstance(tier, MemoryCacheTier) and tier.on_evict is None:
+                tier.on_evict = lambda tool: self._count(tool, "evictions")
+        self.tiers: List[CacheTier] = list(tiers)
+
+    def configure(
+        self,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl: float = 0,
+        directory: Optional[str] = None,
+        disk_max_bytes: int = 1024 * 1024 * 1024,
+    ):
+        """Memory LRU of max_bytes, plus a disk tier of disk_max_bytes under directory if given."""
+        tiers: List[CacheTier] = [MemoryCacheTier(max_bytes, ttl)]
+        if directory:
+            tiers.append(DiskCacheTier(directory, ttl, disk_max_bytes))
+        self.set_tiers(tiers)
+
+    @staticmethod
+    def make_key(tool: str, version: str, params: Mapping[str, Any], inputs: Mapping[str, Any]) -> Optional[str]:
+        """
+        Stable key from the tool identity, its params and its declared input
+        values. Values that differ in type (1 and "1" as dict keys, tuples and
+        lists) get different keys. None if the values can't be serialized
+        (the call is not cached).
+        """
+        try:
+            material = [tool, version, _encode(dict(params)), _encode(dict(inputs))]
+            payload = json.dumps(material, separators=(",", ":")).encode()
+        except _NotCanonical:
+            # Custom objects: fall back to pickle
+            try:
+                payload = pickle.dumps((tool, version, sorted(params.items()), sorted(inputs.items())), protocol=4)
+            except Exception:
+                return None
+        return hashlib.blake2b(payload, digest_size=20).hexdigest()
+
+    def get(self, tool: str, key: str) -> Tuple[bool, Any]:
+        """Returns (hit, value)."""
+        for depth, tier in enumerate(self.tiers):
+            blob = tier.get(key)
+            if blob is not None:
+                for upper in self.tiers[:depth]:
+                    upper.set(key, tool, blob)
+                self._count(tool, "hits")
+                return True, pickle.loads(blob)
+        self._count(tool, "misses")
+        return False, None
+
+    def set(self, tool: str, key: str, value: Any):
+        blob = self._dumps(tool, value)
+        if blob is not None:
+            for tier in self.tiers:
+                tier.set(key, tool, blob)
+
+    async def lookup(self, tool: str, key: str) -> Tuple[bool, Any]:
+        """get() for callers on the event loop: blocking tiers are called on a worker thread."""
+        for depth, tier in enumerate(self.tiers):
+            blob = await asyncio.to_thread(tier.get, key) if tier.blocking else tier.get(key)
+            if blob is not None:
+                for upper in self.tiers[:depth]:
+                    await self._tier_set(upper, key, tool, blob)
+                self._count(tool, "hits")
+                return True, pickle.loads(blob)
+        self._count(tool, "misses")
+        return False, None
+
+    async def store(self, tool: str, key: str, value: Any):
+        """set() for callers on the event loop."""
+        blob = self._dumps(tool, value)
+        if blob is not None:
+            for tier in self.tiers:
+                await self._tier_set(tier, key, tool, blob)
+
+    @staticmethod
+    async def _tier_set(tier: CacheTier, key: str, tool: str, blob: bytes):
+        if tier.blocking:
+            await asyncio.to_thread(tier.set, key, tool, blob)
+        else:
+            tier.set(key, tool, blob)
+
+    @staticmethod
+    def _dumps(tool: str, value: Any) -> Optional[bytes]:
+        try:
+            return pickle.dumps(value, protocol=4)
+        except Exception as e:
+            logger.warning(f"Result of tool '{tool}' is not cacheable: {e}")
+            return None
+
+    def _count(self, tool: str, field: str):
+        with self._lock:
+            stats = self._stats.setdefault(tool, {"hits": 0, "misses": 0, "evictions": 0})
+            stats[field] += 1
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {tool: dict(counts) for tool, counts in self._stats.items()}
+
+
+# Global instance
+result_cache = ResultCache()
@@ -0,0 +1,65 @@
+"""Cooperative cancellation for tools.
+
+Async tools are cancelled by the event loop, but a sync tool running on a
+thread (or in a worker process) can't be interrupted from outside. Tools
+that declare a ``cancel_token`` parameter receive a ``CancelToken`` and
+should check it in long loops::
+
+    @ToolRegistry.register()
+    def crunch(state, cancel_token=None):
+        for chunk in chunks:
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+            ...
+
+A token is cancelled when its run is cancelled or the node's ``timeout_ms``
+deadline passes. Only the deadline reaches worker processes: the explicit
+cancel flag lives in the API process and is dropped when the token is
+pickled.
+"""
+import threading
+import time
+from typing import Optional
+
+
+class ToolCancelled(Exception):
+    """Raised by CancelToken.raise_if_cancelled()."""
+
+
+class CancelToken:
+    """Cancelled explicitly, through its parent, or once its deadline (time.time()) passes."""
+
+    def __init__(self, deadline: Optional[float] = None, parent: Optional["CancelToken"] = None):
+        self.deadline = deadline
+        self.parent = parent
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        if self._event.is_set():
+            return True
+        if self.deadline is not None and time.time() >= self.deadline:
+            return True
+        return self.parent is not None and self.parent.cancelled
+
+    def raise_if_cancelled(self):
+        if self.cancelled:
+            raise ToolCancelled("Tool call was cancelled")
+
+    def __getstate__(self):
+        # Events can't cross processes; fold the parent chain into one deadline
+        deadline = self.deadline
+        parent = self.parent
+        while parent is not None:
+            if parent.deadline is not None:
+                deadline = parent.deadline if deadline is None else min(deadline, parent.deadline)
+            parent = parent.parent
+        return {"deadline": deadline}
+
+    def __setstate__(self, state):
+        self.deadline = state["deadline"]
+        self.parent = None
+        self._event = threading.Event()
@@ -0,0 +1,59 @@
+"""Pre-parsed edge conditions.
+
+Conditions are parsed into an AST once (per distinct expression text, shared
+across graphs) and evaluated by walking that AST with a reusable simpleeval
+evaluator, instead of calling ``simple_eval`` and re-parsing on every step.
+"""
+import functools
+import threading
+from typing import Any, Dict
+from simpleeval import SimpleEval, InvalidExpression
+
+# Functions available inside conditions. Shared by every evaluator.
+CONDITION_FUNCTIONS = {"len": len, "max": max, "min": min, "abs": abs, "sum": sum}
+
+_local = threading.local()
+
+
+def _evaluator() -> SimpleEval:
+    # SimpleEval keeps per-call state (names, expr) on the instance, so each
+    # thread gets its own. In practice conditions run on the event loop thread.
+    evaluator = getattr(_local, "evaluator", None)
+    if evaluator is None:
+        evaluator = SimpleEval(functions=CONDITION_FUNCTIONS)
+        _local.evaluator = evaluator
+    return evaluator
+
+
+class CompiledCondition:
+    """A condition expression parsed once and evaluated many times."""
+    __slots__ = ("expression", "_parsed")
+
+    def __init__(self, expression: str):
+        self.expression = expression
+        # Raises SyntaxError / InvalidExpression for malformed expressions
+        self._parsed = SimpleEval.parse(expression)
+
+    def evaluate(self, state: Dict[str, Any]) -> Any:
+        # Allowed: basic comparisons, arithmetic, dict/list access.
+        # Blocked: imports, file operations, exec, eval, __builtins__.
+        evaluator = _evaluator()
+        evaluator.names = {"state": state}
+        return evaluator.eval(self.expression, previously_parsed=self._parsed)
+
+    def __repr__(self) -> str:
+        return f"CompiledCondition({self.expression!r})"
+
+
+@functools.lru_cache(maxsize=1024)
+def compile_condition(expression: str) -> CompiledCondition:
+    """Returns the (cached) compiled form of a condition expression."""
+    return CompiledCondition(expression)
+
+
+def parse_condition(expression: str) -> CompiledCondition:
+    """Like compile_condition, but reports malformed expressions as ValueError."""
+    try:
+        return compile_condition(expression)
+    except (SyntaxError, InvalidExpression) as e:
+        raise ValueError(f"Invalid condition '{expression}': {e}") from e
@@ -0,0 +1,128 @@
+"""Delta-encoded execution logs.
+
+In ``delta`` log mode an ``ExecutionStep`` records only the keys a step set
+and the keys it removed, with a full input/output snapshot every
+``log_snapshot_every`` steps. ``expand_steps`` rebuilds full snapshots from
+such a log when a caller asks for them.
+
+Tools may change containers in the state in place without returning them,
+so steps are diffed against a ``delta_baseline``, in which container
+values are copies. The engine keeps one baseline per run and brings it up
+to date with ``advance_baseline`` after each step, so only the values a
+step changed are copied.
+"""
+import copy
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+_CONTAINERS = (dict, list, set)
+_ATOMIC = (str, int, float, bool, type(None), bytes)
+_MISSING = object()
+
+
+def detach(value: Any) -> Any:
+    """
+    Deep copy of a state value. Plain dicts, lists, tuples and sets of JSON-like
+    values are copied directly, several times faster than copy.deepcopy; other
+    types fall back to it. Objects shared within the value are copied once
+    per reference.
+    """
+    kind = type(value)
+    if kind in _ATOMIC:
+        return value
+    if kind is dict:
+        return {key: detach(item) for key, item in value.items()}
+    if kind is list:
+        return [detach(item) for item in value]
+    if kind is tuple:
+        return tuple(detach(item) for item in value)
+    if kind is set:
+        return set(value) # Elements are hashable, so not changed in place
+    return copy.deepcopy(value)
+
+
+def _detach(value: Any) -> Any:
+    return detach(value) if isinstance(value, _CONTAINERS) else value
+
+
+def delta_baseline(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Copy of state to diff a step against: container values are deep copies, the rest is shared."""
+    return {key: _detach(value) for key, value in state.items()}
+
+
+def advance_baseline(baseline: Dict[str, Any], state: Dict[str, Any]) -> Tuple[Dict[str, Any], List[str]]:
+    """Returns (changed, removed) between baseline and state, and updates baseline to match state.
+
+    Changed container values are copied once and shared by the returned
+    delta and the baseline. Neither is mutated afterwards: the baseline's
+    values are replaced, never changed in place, so later in-place changes
+    to the state reach neither.
+    """
+    changed: Dict[str, Any] = {}
+    for key, value in state.items():
+        old = baseline.get(key, _MISSING)
+        if old is not value and (old is _MISSING or old != value):
+            changed[key] = baseline[key] = _detach(value)
+    removed = [key for key in baseline if key not in state]
+    for key in removed:
+        del baseline[key]
+    return changed, removed
+
+
+def state_delta(
+    before: Dict[str, Any],
+    after: Dict[str, Any],
+    returned: Optional[Dict[str, Any]] = None,
+) -> Tuple[Dict[str, Any], List[str]]:
+    """Returns (changed, removed) between two top-level state dicts.
+
+    ``before`` should come from ``delta_baseline``. With a plain shallow
+    copy, a container mutated in place is the same object on both sides and
+    compares equal; it is then only treated as changed if the tool returned it.
+    """
+    returned = returned or {}
+    changed: Dict[str, Any] = {}
+    for key, value in after.items():
+        if key not in before:
+            changed[key] = value
+            continue
+        old = before[key]
+        if old is value:
+            if key in returned and isinstance(value, (dict, list, set)):
+                changed[key] = value
+        elif old != value:
+            changed[key] = value
+    removed = [key for key in before if key not in after]
+    return changed, removed
+
+
+def is_snapshot(step) -> bool:
+    """True if the step carries full input/output state (full mode or a delta-mode checkpoint)."""
+    return step.output_state is not None
+
+
+def _expand(steps: Iterable) -> Iterator:
+    # Steps of subgraphs ('node/sub_node') describe their own state, so each
+    # nesting scope is rebuilt separately
+    current: Dict[str, Dict[str, Any]] = {}
+    for step in steps:
+        scope = step.node_id.rpartition("/")[0]
+        if is_snapshot(step):
+            current[scope] = step.output_state
+            yield step
+            continue
+        input_state = dict(current.get(scope) or {})
+        output_state = dict(input_state)
+        output_state.update(step.delta or {})
+        for key in step.removed_keys or ():
+            output_state.pop(key, None)
+        current[scope] = output_state
+        yield step.model_copy(update={"input_state": input_state, "output_state": output_state})
+
+
+def expand_steps(steps: Iterable) -> List:
+    """Returns the steps with full input/output snapshots reconstructed.
+
+    Steps must be in execution order for a single run. Full-mode logs are
+    returned unchanged.
+    """
+    return list(_expand(steps))
@@ -1,24 +1,75 @@
 import asyncio
+import dataclasses
+import time
 import uuid
 import logging
-from typing import Dict, Any, Optional
+from typing import Callable, Dict, Any, List, Mapping, Optional, Tuple
 from datetime import datetime, timezone
-from simpleeval import simple_eval, NameNotDefined
 from app.models.schemas import GraphDefinition, WorkflowState, ExecutionStep, NodeDefinition
 from app.core.registry import ToolRegistry
 from app.core.storage import BaseStorage
+from app.core.plan import CompiledPlan, CompiledNode, compile_graph
+from app.core.conditions import parse_condition
+from app.core.deltas import advance_baseline, delta_baseline
+from app.core.parallel import merge_branches, MergeConflictError
+from app.core.scheduler import RunScheduler
+from app.core.executors import executor_pools, process_pool
+from app.core.cache import ResultCache, result_cache
+from app.core.batching import MicroBatcher, micro_batcher
+from app.core.metrics import RUNS_FINISHED, TOOL_DURATION
+from app.core.tracing import Tracer, span, tracer as default_tracer
+from app.core.profiling import NodeProfiler, ProfileStore, RunProfiler, profile_store
+from app.core.persistence import PersistenceQueue
+from app.core.run_queue import QueuedRun, RunQueue
+from app.core.cancellation import CancelToken
 
 logger = logging.getLogger(__name__)
 
+TERMINAL_STATUSES = ("completed", "failed", "cancelled")
+RECOVERY_MODES = ("at_least_once", "at_most_once")
+
 class WorkflowEngine:
-    def __init__(self, storage: BaseStorage):
+    def __init__(
+        self,
+        storage: BaseStorage,
+        scheduler: Optional[RunScheduler] = None,
+        cache: Optional[ResultCache] = None,
+        persistence: Optional[PersistenceQueue] = None,
+        batcher: Optional[MicroBatcher] = None,
+        tracer: Optional[Tracer] = None,
+        profiles: Optional[ProfileStore] = None,
+        run_queue: Optional[RunQueue] = None,
+    ):
         self.storage = storage
+        self.scheduler = scheduler or RunScheduler()
+        # Writes made while runs execute go through the write-behind queue;
+        # admission writes (start_run) go straight to storage
+        self.persistence = persistence or PersistenceQueue(storage)
+        # Results of pure tools (see app.core.cache)
+        self.cache = cache or result_cache
+        # Groups concurrent calls of batch tools across runs (see app.core.batching)
+        self.batcher = batcher or micro_batcher
+        # Samples runs for tracing and exports their spans (see app.core.tracing)
+        self.tracer = tracer or default_tracer
+        # Artifacts of runs started with profile=True (see app.core.profiling)
+        self.profiles = profiles or profile_store
+        # When set, runs are handed to worker processes through this queue
+        # instead of executing here (see app.core.run_queue and app.worker)
+        self.run_queue = run_queue
+        # Compiled plans keyed by graph_id. Graphs are immutable once created,
+        # so a plan never needs invalidating.
+        self.plans: Dict[str, CompiledPlan] = {}
+        # Futures resolved with the final WorkflowState, for callers blocked in wait_for_run
+        self._waiters: Dict[str, asyncio.Future] = {}
+        # Runs executing in this process. Checkpoints may be sparse, so reads
+        # of a running run are served from here rather than storage.
+        self.live_runs: Dict[str, "_RunContext"] = {}
 
     async def validate_graph(self, definition: GraphDefinition):
         """Validates the graph definition."""
         # 1. Check tools exist
         for node in definition.nodes:
-            if not ToolRegistry.exists(node.tool):
+            if node.tool is not None and not ToolRegistry.exists(node.tool):
                 raise ValueError(f"Tool '{node.tool}' not found in registry (Node: {node.id}).")
 
         # 2. Check edges point to valid nodes
@@ -31,170 +82,1027 @@ class WorkflowEngine:
                 raise ValueError(f"Edge source '{edge.from_node}' does not exist.")
             if edge.to_node not in node_ids:
                 raise ValueError(f"Edge target '{edge.to_node}' does not exist.")
+            # 3. Parse conditions now so syntax errors are reported at creation time
+            if edge.condition:
+                try:
+                    parse_condition(edge.condition)
+                except ValueError as e:
+                    raise ValueError(f"Edge {edge.from_node}->{edge.to_node}: {e}")
 
-        # 3. Validation passed
+        # 4. Validation passed
 
     async def create_graph(self, definition: GraphDefinition) -> str:
         await self.validate_graph(definition)
         graph_id = str(uuid.uuid4())
+        plan = compile_graph(graph_id, definition, await self._resolve_subplans(definition))
         await self.storage.save_graph(graph_id, definition)
+        self.plans[graph_id] = plan
         return graph_id
 
-    async def start_run(self, graph_id: str, initial_state: Dict[str, Any]) -> str:
-        graph = await self.storage.get_graph(graph_id)
-        if not graph:
+    async def get_plan(self, graph_id: str) -> Optional[CompiledPlan]:
+        """Returns the compiled plan for a graph, compiling it from storage on a cache miss."""
+        plan = self.plans.get(graph_id)
+        if plan is None:
+            graph = await self.storage.get_graph(graph_id)
+            if not graph:
+                return None
+            plan = compile_graph(graph_id, graph, await self._resolve_subplans(graph))
+            self.plans[graph_id] = plan
+        return plan
+
+    async def _resolve_subplans(self, definition: GraphDefinition) -> Dict[str, CompiledPlan]:
+        """Plans of the graphs referenced by subgraph nodes. They must already exist."""
+        subplans: Dict[str, CompiledPlan] = {}
+        for node in definition.nodes:
+            if node.subgraph is not None and node.subgraph not in subplans:
+                subplan = await self.get_plan(node.subgraph)
+                if subplan is None:
+                    raise ValueError(f"Subgraph '{node.subgraph}' not found (Node: {node.id}).")
+                subplans[node.subgraph] = subplan
+        return subplans
+
+    async def start_run(
+        self, graph_id: str, initial_state: Dict[str, Any], persist_intermediate: bool = True, profile: bool = False
+    ) -> str:
+        """
+        Queues a run and returns its id. With persist_intermediate=False the run
+        is only written to storage when queued and when it finishes (its logs in
+        one batch at the end), not on every transition. With profile=True its
+        tool calls are profiled (see app.core.profiling).
+        """
+        plan = await self.get_plan(graph_id)
+        if not plan:
             raise ValueError(f"Graph {graph_id} not found.")
 
+        # Reject before persisting anything if the admission queue is full
+        self.scheduler.check_capacity()
+
         run_id = str(uuid.uuid4())
         state = WorkflowState(
             run_id=run_id,
             graph_id=graph_id,
-            status="running",
-            current_node=graph.start_node,
+            status="pending",
+            current_node=plan.start_node,
             state=initial_state
         )
         await self.storage.save_run(state)
-        
-        # Start execution in background (fire and forget or monitored externally)
-        # For this async implementation, we'll return run_id immediately and let the caller 
-        # await the execution or spawn a task. 
-        # Ideally, we spawn a background task here.
-        asyncio.create_task(self._execute_workflow(run_id, graph, state))
+
+        if self.run_queue is not None:
+            await self.run_queue.enqueue([self._queued(plan, state, persist_intermediate, profile)])
+            return run_id
+
+        # Execution starts in the background once the scheduler has a free slot;
+        # the caller gets the run_id immediately.
+        self.scheduler.submit(
+            run_id, graph_id,
+            lambda: self._execute_workflow(run_id, plan, state, persist_intermediate, profile=profile),
+            priority=plan.priority
+        )
         
         return run_id
 
-    async def _execute_workflow(self, run_id: str, graph: GraphDefinition, run_state: WorkflowState):
+    async def start_runs(
+        self, graph_id: str, initial_states: List[Dict[str, Any]], persist_intermediate: bool = True
+    ) -> List[str]:
+        """
+        Queues one run per initial state and returns their ids in the same order.
+        The graph is resolved once and all runs are stored in a single batch.
+        """
+        plan = await self.get_plan(graph_id)
+        if not plan:
+            raise ValueError(f"Graph {graph_id} not found.")
+
+        # All-or-nothing admission
+        self.scheduler.check_capacity(len(initial_states))
+
+        runs = [
+            WorkflowState(
+                run_id=str(uuid.uuid4()),
+                graph_id=graph_id,
+                status="pending",
+                current_node=plan.start_node,
+                state=initial_state
+            )
+            for initial_state in initial_states
+        ]
+        await self.storage.save_runs(runs)
+
+        if self.run_queue is not None:
+            await self.run_queue.enqueue([self._queued(plan, run, persist_intermediate) for run in runs])
+            return [run.run_id for run in runs]
+
+        for run in runs:
+            self.scheduler.submit(
+                run.run_id, graph_id,
+                lambda run=run: self._execute_workflow(run.run_id, plan, run, persist_intermediate),
+                priority=plan.priority
+            )
+        return [run.run_id for run in runs]
+
+    @staticmethod
+    def _queued(plan: CompiledPlan, run: WorkflowState, persist_intermediate: bool, profile: bool = False) -> QueuedRun:
+        return QueuedRun(
+            run.run_id, run.graph_id, plan.priority,
+            {"persist_intermediate": persist_intermediate, "profile": profile},
+        )
+
+    async def cancel_run(self, run_id: str) -> Optional[WorkflowState]:
+        """
+        Cancels a queued or executing run and returns its final state (None if
+        the run doesn't exist; finished runs are returned unchanged). Sync tools
+        are signalled through their cancel token but not waited for.
+        """
+        ctx = self.live_runs.get(run_id)
+        if ctx is not None:
+            if not ctx.finishing:
+                ctx.cancel_requested = True
+                ctx.cancel_token.cancel()
+                task = self.scheduler.get_task(run_id)
+                if task is not None:
+                    task.cancel()
+            return await self.wait_for_run(run_id)
+
+        if self.run_queue is not None and await self.run_queue.request_cancel(run_id) == "leased":
+            # A worker is executing it and cancels it on its next heartbeat
+            return await self.wait_for_run(run_id)
+
+        # Not executing: drop it from the queue (or cancel a task that hasn't
+        # started its first step) before anything can start it
+        self.scheduler.cancel(run_id)
+        run = await self.persistence.get_run(run_id)
+        if run is None or run.status in TERMINAL_STATUSES:
+            return run
+        ctx = _RunContext(run_id, await self.get_plan(run.graph_id), run)
+        await self._finish(ctx, "cancelled", "Run cancelled")
+        return run
+
+    async def get_run(self, run_id: str) -> Optional[WorkflowState]:
+        """Current state of a run: live if it is executing here, else the latest saved."""
+        ctx = self.live_runs.get(run_id)
+        if ctx is not None:
+            # Copy so the caller sees a consistent view while the run moves on
+            live = ctx.run_state
+            return live.model_copy(update={"state": dict(live.state)})
+        return await self.persistence.get_run(run_id)
+
+    async def recover_runs(self, mode: str = "at_least_once") -> List[str]:
+        """
+        Resubmits runs that a previous process left pending or running, and
+        returns their ids. Execution resumes after the last node whose
+        completion was logged. The node after it may have been in flight when
+        the process died: with mode="at_least_once" it runs again, with
+        "at_most_once" the run is failed instead unless that node's tool is pure.
+        """
+        if mode not in RECOVERY_MODES:
+            raise ValueError(f"Unknown recovery mode '{mode}' (expected one of {', '.join(RECOVERY_MODES)}).")
+        resumed = []
+        for run in await self.storage.get_runs_by_status(("pending", "running")):
+            if run.run_id in self.live_runs or self.scheduler.get_task(run.run_id):
+                continue
+            if await self.submit_stored_run(run, mode):
+                resumed.append(run.run_id)
+        return resumed
+
+    async def submit_stored_run(
+        self,
+        run: WorkflowState,
+        mode: str = "at_least_once",
+        persist_intermediate: bool = True,
+        profile: bool = False,
+    ) -> bool:
+        """
+        Queues a run loaded from storage for execution here, resuming after its
+        last logged step if any step was logged (see recover_runs for mode).
+        Returns False if the run can't be resumed and was failed instead.
+        """
+        plan = await self.get_plan(run.graph_id)
+        steps: List[ExecutionStep] = []
+        try:
+            if plan is None:
+                raise StepFailed(f"Graph {run.graph_id} not found")
+            # A run can have logged steps while its stored status is still
+            # "pending": the terminal checkpoint policy skips the "running" save
+            steps = await self.storage.get_logs(run.run_id, expand=True)
+            if steps or run.status == "running":
+                self._resume_point(plan, run, steps)
+                next_node = plan.get_node(run.current_node) if run.current_node else None
+                if mode == "at_most_once" and next_node is not None and not next_node.pure:
+                    raise StepFailed(
+                        f"Interrupted at node {next_node.id}, which may have partially run (at-most-once recovery)"
+                    )
+        except (StepFailed, ValueError) as e:
+            ctx = _RunContext(run.run_id, plan, run)
+            await self._finish(ctx, "failed", str(e))
+            return False
+
+        if steps:
+            logger.info(f"Resuming run {run.run_id} at node {run.current_node}")
+        self.scheduler.submit(
+            run.run_id, run.graph_id,
+            lambda: self._execute_workflow(
+                run.run_id, plan, run, persist_intermediate, resumed_steps=steps, profile=profile
+            ),
+            priority=plan.priority
+        )
+        return True
+
+    def abandon_run(self, run_id: str):
+        """
+        Stops executing a run in this process without recording anything, for
+        when another process takes it over. The run stays as last checkpointed,
+        and callers waiting on it here get None.
+        """
+        self.scheduler.cancel(run_id)
+        waiter = self._waiters.pop(run_id, None)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    async def fail_run(self, run_id: str, message: str) -> Optional[WorkflowState]:
+        """Records a stored run that isn't executing here as failed. Finished runs are returned unchanged."""
+        run = await self.persistence.get_run(run_id)
+        if run is None or run.status in TERMINAL_STATUSES:
+            return run
+        ctx = _RunContext(run_id, await self.get_plan(run.graph_id), run)
+        await self._finish(ctx, "failed", message)
+        return run
+
+    def _resume_point(self, plan: CompiledPlan, run: WorkflowState, steps: List[ExecutionStep]):
+        """
+        Moves run.state/current_node past the last logged step. Runs with
+        parallel branches keep their last checkpoint: branch steps run on
+        copies of the state, so the last log doesn't describe the run's state.
+        """
+        if any(node.fan_out for node in plan.nodes.values()):
+            return
+        # Steps of a subgraph ('node/sub_node') don't describe the parent's state;
+        # resume after the last top-level step, re-running an unfinished subgraph
+        top_level = [step for step in steps if plan.get_node(step.node_id) is not None]
+        if not top_level or top_level[-1].output_state is None:
+            return
+        last = top_level[-1]
+        node_def = plan.get_node(last.node_id)
+        state = dict(last.output_state)
+        if last.loop is not None:
+            # A fast_loop step is logged under its head node but left from another one
+            run.current_node = last.loop.get("exit_node")
+        else:
+            next_ids = self._route(node_def, state)
+            run.current_node = next_ids[0] if next_ids else None
+        run.state = state
+
+    async def wait_for_run(self, run_id: str, timeout: Optional[float] = None) -> Optional[WorkflowState]:
+        """
+        Waits until the run reaches a terminal status and returns its final state.
+        Returns None if the timeout elapses first or the run does not exist.
+        """
+        if self.run_queue is not None and run_id not in self.live_runs:
+            return await self._poll_run(run_id, timeout)
+        # Register before checking storage so a completion in between isn't missed
+        waiter = self._waiters.get(run_id)
+        if waiter is None:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters[run_id] = waiter
+        run = await self.get_run(run_id)
+        if run is None or run.status in TERMINAL_STATUSES:
+            # Nothing to wait for; don't leave the waiter behind
+            if self._waiters.get(run_id) is waiter and not waiter.done():
+                del self._waiters[run_id]
+            return run
+        try:
+            return await asyncio.wait_for(asyncio.shield(waiter), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def _poll_run(self, run_id: str, timeout: Optional[float]) -> Optional[WorkflowState]:
+        """wait_for_run for a run a worker process executes: polls storage until it finishes."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            run = await self.persistence.get_run(run_id)
+            if run is None or run.status in TERMINAL_STATUSES:
+                return run
+            delay = self.run_queue.poll_interval
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                delay = min(delay, remaining)
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    def _input_snapshot(ctx: "_RunContext", state: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        State before a step. In delta mode this is the context's baseline, in
+        which containers are copies, so in-place changes show up in the delta.
+        The baseline carries over from the previous step on the same state
+        and is only rebuilt, at O(state), for another state dict.
+        """
+        if ctx.plan.log_mode != "delta":
+            return state.copy()
+        if ctx.delta_state is not state:
+            ctx.delta_state, ctx.delta_base = state, delta_baseline(state)
+        return ctx.delta_base
+
+    @staticmethod
+    def _build_step(
+        plan: CompiledPlan,
+        run_id: str,
+        node_id: str,
+        step_index: int,
+        input_snapshot: Dict[str, Any],
+        state: Dict[str, Any],
+        timestamp: datetime,
+        duration: float,
+        force_snapshot: bool = False,
+    ) -> ExecutionStep:
+        """Builds the log entry for a step according to the graph's log mode."""
+        if plan.log_mode == "delta":
+            # input_snapshot is the baseline from _input_snapshot; it is advanced to state here
+            snapshot = force_snapshot or step_index % plan.log_snapshot_every == 0
+            input_state = dict(input_snapshot) if snapshot else None
+            changed, removed = advance_baseline(input_snapshot, state)
+            if snapshot:
+                return ExecutionStep(
+                    run_id=run_id,
+                    node_id=node_id,
+                    input_state=input_state,
+                    output_state=dict(input_snapshot),
+                    step_index=step_index,
+                    timestamp=timestamp,
+                    duration_ms=duration
+                )
+            return ExecutionStep(
+                run_id=run_id,
+                node_id=node_id,
+                delta=changed,
+                removed_keys=removed,
+                step_index=step_index,
+                timestamp=timestamp,
+                duration_ms=duration
+            )
+        return ExecutionStep(
+            run_id=run_id,
+            node_id=node_id,
+            input_state=input_snapshot,
+            output_state=state.copy(), # Snapshot
+            step_index=step_index,
+            timestamp=timestamp,
+            duration_ms=duration
+        )
+
+    async def _execute_workflow(
+        self,
+        run_id: str,
+        plan: CompiledPlan,
+        run_state: WorkflowState,
+        persist_intermediate: bool = True,
+        resumed_steps: Optional[List[ExecutionStep]] = None,
+        profile: bool = False,
+    ):
         # Import here to avoid circular dependency
         from app.core.websocket_manager import manager as ws_manager
-        
+
+        ctx = _RunContext(run_id, plan, run_state, persist_intermediate)
+        if profile:
+            ctx.profiler = RunProfiler(run_id)
+        if resumed_steps:
+            # Carry on the step numbering and loop limits of the interrupted run
+            ctx.step_index = max((s.step_index or 0 for s in resumed_steps), default=-1) + 1
+            for step in resumed_steps:
+                ctx.loop_counters[step.node_id] = ctx.loop_counters.get(step.node_id, 0) + 1
+            # The resumed state may not be the last logged one (runs with parallel
+            # branches restart from their checkpoint), so don't log a delta against it
+            ctx.snapshot_next = True
+        self.live_runs[run_id] = ctx
+        root_span = self.tracer.start_run(run_id, graph_id=plan.graph_id, resumed=bool(resumed_steps))
+        try:
+            with root_span:
+                try:
+                    await self._run_workflow(ctx, ws_manager)
+                finally:
+                    root_span.set("status", run_state.status)
+        finally:
+            self.live_runs.pop(run_id, None)
+
+    async def _run_workflow(self, ctx: "_RunContext", ws_manager):
+        run_id = ctx.run_id
+        run_state = ctx.run_state
         try:
-            # Small delay to allow WebSocket clients to connect before execution starts
-            await asyncio.sleep(0.1)
+            # No startup delay needed: events are buffered per run and replayed
+            # to WebSocket clients that connect after execution has started
+            run_state.status = "running"
+            if ctx.plan.checkpoint_policy != "terminal":
+                await self._save_intermediate(ctx)
             
             # Broadcast workflow started
-            await ws_manager.broadcast_status(run_id, "running", "Workflow execution started")
+            with span("broadcast_log", type="status"):
+                await ws_manager.broadcast_status(run_id, "running", "Workflow execution started")
+
+            await self._run_path(ctx, run_state.current_node, run_state.state)
+
+            # No outgoing edges -> End of workflow
+            run_state.current_node = None
+            await self._finish(ctx, "completed", "Workflow completed successfully")
+
+        except StepFailed as e:
+            await self._finish(ctx, "failed", str(e))
+
+        except Exception as e:
+            logger.exception("Workflow execution failed")
+            await self._finish(ctx, "failed", str(e))
+
+        except asyncio.CancelledError:
+            if not ctx.cancel_requested:
+                # Shutdown: leave the run as last checkpointed
+                raise
+            await self._finish(ctx, "cancelled", "Run cancelled")
+
+    async def _save_intermediate(self, ctx: "_RunContext"):
+        """Persists in-flight run state, unless the run opted out of intermediate persistence."""
+        if ctx.persist_intermediate:
+            ctx.steps_since_checkpoint = 0
+            ctx.last_checkpoint = time.monotonic()
+            with span("save_run"):
+                await self.persistence.save_run(ctx.run_state)
+
+    async def _checkpoint(self, ctx: "_RunContext", node_def: CompiledNode):
+        """Persists run state after a transition if the graph's checkpoint policy calls for it."""
+        plan = ctx.plan
+        ctx.steps_since_checkpoint += 1
+        policy = plan.checkpoint_policy
+        if (
+            node_def.checkpoint
+            or policy == "every_step"
+            or (policy == "every_n_steps" and ctx.steps_since_checkpoint >= plan.checkpoint_every)
+            or (policy == "interval" and (time.monotonic() - ctx.last_checkpoint) * 1000 >= plan.checkpoint_interval_ms)
+        ):
+            await self._save_intermediate(ctx)
+
+    async def _finish(self, ctx: "_RunContext", status: str, message: Optional[str]):
+        """Records a terminal status, flushes deferred logs and wakes anyone waiting on the run."""
+        from app.core.websocket_manager import manager as ws_manager
+
+        ctx.finishing = True
+        RUNS_FINISHED.inc(status)
+        run_state = ctx.run_state
+        try:
+            if ctx.profiler is not None:
+                # Written before the status turns terminal (in-memory storage
+                # shares run_state) and waiters wake, so a wait=true caller
+                # can fetch it
+                try:
+                    await asyncio.to_thread(self.profiles.save, ctx.profiler)
+                except Exception:
+                    logger.exception(f"Could not save the profile of run {ctx.run_id}")
+            run_state.status = status
+            if status != "completed":
+                run_state.message = message
+            try:
+                if ctx.pending_logs:
+                    with span("add_log", count=len(ctx.pending_logs)):
+                        await self.persistence.add_logs(ctx.pending_logs)
+                    ctx.pending_logs = []
+                with span("save_run", final=True):
+                    await self.persistence.save_run(run_state, final=True)
+            except Exception:
+                # The run did finish; batched writes stay queued and are retried
+                logger.exception(f"Run {ctx.run_id} finished {status} but its final state is not written yet")
+        finally:
+            waiter = self._waiters.pop(ctx.run_id, None)
+            if waiter is not None and not waiter.done():
+                waiter.set_result(run_state)
+        with span("broadcast_log", type="status"):
+            await ws_manager.broadcast_status(ctx.run_id, status, message)
+
+    async def _run_path(
+        self, ctx: "_RunContext", node_id: Optional[str], state: Dict[str, Any], branch: bool = False
+    ) -> Optional[str]:
+        """
+        Executes nodes starting at node_id until the path ends.
+
+        The main path (branch=False) owns the run's state and records transitions
+        in storage. A parallel branch (branch=True) runs on its own copy of the
+        state and stops when it reaches a join node, returning that node's id.
+        """
+        at_join = False # True right after a nested fan-in, so the join node itself runs
+        while node_id:
+            # 1. Get Node (O(1) lookup in the compiled plan, tool already resolved)
+            node_def = ctx.plan.get_node(node_id)
+            if not node_def:
+                raise ValueError(f"Node {node_id} definition missing during execution.")
+            if branch and node_def.join and not at_join:
+                return node_id
+
+            # 2-4. Execute, log and route
+            with span("node", node_id=node_def.id):
+                if node_def.subplan is not None:
+                    next_ids = await self._run_subgraph(ctx, node_def, state, force_snapshot=branch or node_def.join)
+                elif node_def.loop_body:
+                    next_node_id = await self._run_fast_loop(ctx, node_def, state)
+                    next_ids = [next_node_id] if next_node_id else []
+                else:
+                    next_ids = await self._run_node(ctx, node_def, state, force_snapshot=branch or node_def.join)
+
+            if node_def.fan_out and next_ids:
+                next_node_id = await self._fan_out(ctx, node_def, next_ids, state)
+                at_join = next_node_id is not None
+            else:
+                next_node_id = next_ids[0] if next_ids else None
+                at_join = False
+
+            # Transition (a subgraph's path leaves the run's current_node alone)
+            if not branch and ctx.parent is None and next_node_id:
+                ctx.run_state.current_node = next_node_id
+                # Live state is always visible through get_run; storage only
+                # sees the checkpoints the graph's policy asks for
+                await self._checkpoint(ctx, node_def)
+            node_id = next_node_id
+        return None
+
+    async def _run_node(
+        self, ctx: "_RunContext", node_def: CompiledNode, state: Dict[str, Any], force_snapshot: bool = False
+    ) -> List[str]:
+        """Runs one node against state and returns the ids of the next node(s) to visit."""
+        # Capture input state before execution
+        input_snapshot = self._input_snapshot(ctx, state)
+        start_time = datetime.now(timezone.utc)
+
+        _, cached = await self._invoke(ctx, node_def, state)
+
+        end_time = datetime.now(timezone.utc)
+        duration = (end_time - start_time).total_seconds() * 1000
+        TOOL_DURATION.observe(duration / 1000, node_def.tool_name)
+
+        # 3. Log Step
+        log = self._build_step(
+            ctx.plan, ctx.run_id, ctx.log_id(node_def.id), ctx.next_step_index(), input_snapshot, state,
+            end_time, duration,
+            force_snapshot=ctx.consume_snapshot(force_snapshot)
+        )
+        if cached:
+            log.cached = True
+        await self._record_step(ctx, log)
+
+        # 4. Determine Next Node(s) (Routing)
+        next_ids = self._route(node_def, state)
+        self._count_visit(ctx, node_def)
+        return next_ids
+
+    async def _run_subgraph(
+        self, ctx: "_RunContext", node_def: CompiledNode, state: Dict[str, Any], force_snapshot: bool = False
+    ) -> List[str]:
+        """
+        Runs a subgraph node's plan inline, in this run's task, on a mapped copy
+        of state, then maps its outputs back. The subgraph's steps are logged as
+        '<node id>/<subgraph node id>', followed by a step for the node itself.
+        """
+        subplan = node_def.subplan
+        input_snapshot = self._input_snapshot(ctx, state)
+        start_time = datetime.now(timezone.utc)
+
+        if node_def.input_map:
+            sub_state = {key: state[parent_key] for key, parent_key in node_def.input_map.items() if parent_key in state}
+        else:
+            sub_state = state.copy()
+        path = self._run_path(ctx.nested(node_def.id, subplan), subplan.start_node, sub_state)
+        if node_def.timeout_ms is None:
+            await path
+        else:
+            try:
+                await asyncio.wait_for(path, node_def.timeout_ms / 1000)
+            except asyncio.TimeoutError:
+                raise StepFailed(f"Node {ctx.log_id(node_def.id)} timed out after {node_def.timeout_ms} ms")
+
+        if node_def.output_map:
+            outputs = {parent_key: sub_state[key] for key, parent_key in node_def.output_map.items() if key in sub_state}
+        else:
+            outputs = sub_state
+        state.update(outputs)
+
+        end_time = datetime.now(timezone.utc)
+        log = self._build_step(
+            ctx.plan, ctx.run_id, ctx.log_id(node_def.id), ctx.next_step_index(), input_snapshot, state,
+            end_time, (end_time - start_time).total_seconds() * 1000,
+            force_snapshot=ctx.consume_snapshot(force_snapshot)
+        )
+        await self._record_step(ctx, log)
+
+        next_ids = self._route(node_def, state)
+        self._count_visit(ctx, node_def)
+        return next_ids
+
+    async def _invoke(self, ctx: "_RunContext", node_def: CompiledNode, state: Dict[str, Any]):
+        """Runs a node's tool (or reuses a cached result) and merges the result into state. Returns (result, cached)."""
+        # NOTE: Tools receive the shared state dict plus the node's static params.
+        try:
+            if node_def.map_over is not None:
+                result, cached = await self._run_map(ctx, node_def, state), False
+            else:
+                result, cached = await self._call_cached(ctx, node_def, state)
+            
+            # Update state
+            if isinstance(result, dict):
+                state.update(result)
             
-            loop_counters: Dict[str, int] = {} # Track node visits for loop updates if needed, primarily for infinite loop protection
-
-            while run_state.current_node:
-                # 1. Get Node
-                node_def = next((n for n in graph.nodes if n.id == run_state.current_node), None)
-                if not node_def:
-                    raise ValueError(f"Node {run_state.current_node} definition missing during execution.")
-
-                # 2. Execute Tool
-                tool_func = ToolRegistry.get_tool(node_def.tool)
-                if not tool_func:
-                    raise ValueError(f"Tool {node_def.tool} missing.")
-
-                # Capture input state before execution
-                input_snapshot = run_state.state.copy()
-                start_time = datetime.now(timezone.utc)
-                
-                # Combine state and params. State keys overwrite params if collision (or vice-versa depending on design).
-                # Here: Pass 'state' as a generic argument, or unpack? 
-                # Requirement: "modify a shared state".
-                # Let's pass the state dict to the function. 
-                # NOTE: Tools should accept 'state' and optionally other params.
-                
+        except StepFailed:
+            raise
+        except Exception as e:
+            raise StepFailed(f"Error in node {node_def.id}: {str(e)}") from e
+        return result, cached
+
+    async def _call_cached(
+        self, ctx: "_RunContext", node_def: CompiledNode, state: Dict[str, Any], parent_token: Optional[CancelToken] = None
+    ):
+        """Calls a node's tool, going through the result cache for pure tools. Returns (result, cached)."""
+        token = CancelToken(parent=parent_token or ctx.cancel_token) if node_def.cancellable else None
+        cached = False
+        cache_key = None
+        if node_def.pure:
+            cache_key = self.cache.make_key(
+                node_def.tool_name, node_def.version, node_def.params, self._tool_inputs(node_def, state)
+            )
+        if cache_key is not None:
+            cached, result = await self.cache.lookup(node_def.tool_name, cache_key)
+
+        if not cached:
+            profiler = ctx.profiler and ctx.profiler.node(ctx.log_id(node_def.id))
+            result = await self._call_tool(node_def, state, token, profiler)
+            if cache_key is not None:
+                await self.cache.store(node_def.tool_name, cache_key, result)
+        return result, cached
+
+    async def _run_map(self, ctx: "_RunContext", node_def: CompiledNode, state: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Calls a map node's tool once per item of state[map_over], with at most
+        map_concurrency calls in flight. Each call gets a copy of state with
+        the item under map_item_key. Returns the results in item order (None
+        for failed items) and the failures as {"index", "error"} entries.
+
+        timeout_ms bounds the whole map, not each item: when it passes, the
+        calls still in flight are cancelled and the node fails.
+        """
+        items = state.get(node_def.map_over)
+        if not isinstance(items, (list, tuple)):
+            raise StepFailed(f"Map node {node_def.id}: state['{node_def.map_over}'] is not a list")
+        results: List[Any] = [None] * len(items)
+        errors: List[Dict[str, Any]] = []
+        pending = iter(range(len(items)))
+        map_token = None
+        item_def = node_def
+        if node_def.timeout_ms is not None:
+            map_token = CancelToken(deadline=time.time() + node_def.timeout_ms / 1000, parent=ctx.cancel_token)
+            item_def = dataclasses.replace(node_def, timeout_ms=None)
+
+        async def worker():
+            # Workers share one index iterator, so items start in order
+            for index in pending:
+                item_state = dict(state)
+                item_state[node_def.map_item_key] = items[index]
                 try:
-                    # Execute tool
-                    # Support both async and sync tools
-                    # Production fix: Run sync tools in thread pool to avoid blocking the event loop
-                    if asyncio.iscoroutinefunction(tool_func):
-                        result = await tool_func(run_state.state, **node_def.params)
-                    else:
-                        result = await asyncio.get_running_loop().run_in_executor(
-                            None, 
-                            lambda: tool_func(run_state.state, **node_def.params)
-                        )
-                    
-                    # Update state
-                    if isinstance(result, dict):
-                        run_state.state.update(result)
-                    
+                    results[index], _ = await self._call_cached(ctx, item_def, item_state, map_token)
                 except Exception as e:
-                    run_state.status = "failed"
-                    run_state.message = f"Error in node {node_def.id}: {str(e)}"
-                    await self.storage.save_run(run_state)
-                    await ws_manager.broadcast_status(run_id, "failed", run_state.message)
-                    return
+                    errors.append({"index": index, "error": str(e)})
 
-                end_time = datetime.now(timezone.utc)
-                duration = (end_time - start_time).total_seconds() * 1000
+        workers = asyncio.gather(*(worker() for _ in range(min(node_def.map_concurrency, len(items)))))
+        if map_token is None:
+            await workers
+        else:
+            try:
+                await asyncio.wait_for(workers, node_def.timeout_ms / 1000)
+            except asyncio.TimeoutError:
+                map_token.cancel()
+                raise StepFailed(f"Node {ctx.log_id(node_def.id)} timed out after {node_def.timeout_ms} ms")
+        errors.sort(key=lambda error: error["index"])
+        return {node_def.map_output: results, f"{node_def.map_output}_errors": errors}
 
-                # 3. Log Step
-                log = ExecutionStep(
-                    run_id=run_id,
-                    node_id=node_def.id,
-                    input_state=input_snapshot,
-                    output_state=run_state.state.copy(), # Snapshot
-                    timestamp=end_time,
-                    duration_ms=duration
+    async def _record_step(self, ctx: "_RunContext", log: ExecutionStep):
+        """Stores (or defers) a step's log entry and broadcasts it to WebSocket clients."""
+        from app.core.websocket_manager import manager as ws_manager
+
+        if ctx.persist_intermediate:
+            with span("add_log"):
+                await self.persistence.add_log(log)
+        else:
+            ctx.pending_logs.append(log)
+        
+        # Broadcast log to WebSocket clients
+        with span("broadcast_log", type="log"):
+            await ws_manager.broadcast_log(ctx.run_id, {
+                "type": "log",
+                "run_id": ctx.run_id,
+                "node_id": log.node_id,
+                "data": log.model_dump(mode="json", exclude_none=True)
+            })
+
+    @staticmethod
+    def _count_visit(ctx: "_RunContext", node_def: CompiledNode):
+        # Loop safety
+        ctx.loop_counters[node_def.id] = ctx.loop_counters.get(node_def.id, 0) + 1
+        if ctx.loop_counters[node_def.id] > ctx.plan.max_loops:
+            raise StepFailed(f"Max loops exceeded at node {node_def.id}")
+
+    async def _run_fast_loop(self, ctx: "_RunContext", head: CompiledNode, state: Dict[str, Any]) -> Optional[str]:
+        """
+        Runs a fast_loop cycle starting at head with nothing but in-memory state
+        changes: no per-step logs, broadcasts or checkpoints. When the path leaves
+        the cycle, one aggregated step is logged under the head node's id.
+        Returns the node the path continues with.
+
+        Async tools without a timeout are called directly, skipping the per-call
+        tracing spans and cancel tokens; tool durations reach the metrics when
+        the loop exits. Pure tools still go through the result cache. Routing
+        inside the loop is not traced.
+        """
+        input_snapshot = self._input_snapshot(ctx, state)
+        start_time = datetime.now(timezone.utc)
+        get_node = ctx.plan.get_node
+        body = head.loop_body
+        direct = {} if ctx.profiler is not None else {
+            node_id: self._direct_call(ctx, get_node(node_id)) for node_id in body
+        }
+        counters = ctx.loop_counters
+        max_loops = ctx.plan.max_loops
+        # node id -> list of call durations (seconds)
+        timings: Dict[str, List[float]] = {node_id: [] for node_id in body}
+        iterations = 0
+        node_def = head
+        perf_counter = time.perf_counter
+        while True:
+            if node_def is head:
+                iterations += 1
+            call = direct.get(node_def.id)
+            started = perf_counter()
+            if call is None:
+                await self._invoke(ctx, node_def, state)
+            else:
+                try:
+                    result = await call[0](state, **call[1])
+                except Exception as e:
+                    raise StepFailed(f"Error in node {node_def.id}: {str(e)}") from e
+                if isinstance(result, dict):
+                    state.update(result)
+            timings[node_def.id].append(perf_counter() - started)
+
+            next_node_id = self._first_match(node_def, state)
+            # Loop safety (as _count_visit)
+            visits = counters[node_def.id] = counters.get(node_def.id, 0) + 1
+            if visits > max_loops:
+                self._observe_loop(body, get_node, timings)
+                raise StepFailed(f"Max loops exceeded at node {node_def.id}")
+            if next_node_id is None or next_node_id not in body:
+                break
+            node_def = get_node(next_node_id)
+
+        self._observe_loop(body, get_node, timings)
+        end_time = datetime.now(timezone.utc)
+        log = self._build_step(
+            ctx.plan, ctx.run_id, ctx.log_id(head.id), ctx.next_step_index(), input_snapshot, state,
+            end_time, (end_time - start_time).total_seconds() * 1000,
+            force_snapshot=ctx.consume_snapshot()
+        )
+        log.loop = {
+            "iterations": iterations,
+            "exit_node": next_node_id,
+            "nodes": {
+                node_id: {"calls": len(durations), "total_ms": sum(durations) * 1000, "mean_ms": sum(durations) * 1000 / len(durations)}
+                for node_id, durations in timings.items() if durations
+            },
+        }
+        await self._record_step(ctx, log)
+        return next_node_id
+
+    @staticmethod
+    def _direct_call(ctx: "_RunContext", node_def: CompiledNode) -> Optional[Tuple[Callable, Mapping[str, Any]]]:
+        """(func, params) for a loop node whose async tool can be awaited directly, else None."""
+        if (
+            not node_def.is_async or node_def.batch or node_def.map_over is not None
+            or node_def.timeout_ms is not None or node_def.pure
+        ):
+            return None
+        if node_def.cancellable:
+            # Without a deadline the per-call token only follows the run's,
+            # so one token serves every call of this loop
+            return node_def.func, {**node_def.params, "cancel_token": CancelToken(parent=ctx.cancel_token)}
+        return node_def.func, node_def.params
+
+    @staticmethod
+    def _observe_loop(body, get_node, timings: Dict[str, List[float]]):
+        for node_id in body:
+            tool_name = get_node(node_id).tool_name
+            for duration in timings[node_id]:
+                TOOL_DURATION.observe(duration, tool_name)
+
+    @staticmethod
+    def _first_match(node_def: CompiledNode, state: Dict[str, Any]) -> Optional[str]:
+        """_route for a node without fan-out, minus the tracing spans."""
+        for edge in node_def.edges:
+            if edge.condition is not None:
+                try:
+                    if not edge.condition.evaluate(state):
+                        continue
+                except Exception as e:
+                    logger.error(f"Condition evaluation failed for edge {edge.from_node}->{edge.to_node}: {e}")
+                    continue
+            return edge.to_node
+        return None
+
+    async def _call_tool(
+        self,
+        node_def: CompiledNode,
+        state: Dict[str, Any],
+        token: Optional[CancelToken] = None,
+        profiler: Optional[NodeProfiler] = None,
+    ) -> Any:
+        """Calls a node's tool on the right executor, enforcing the node's timeout. Batch tools aren't profiled."""
+        tool_func = node_def.func
+        params = node_def.params
+        if token is not None:
+            if node_def.timeout_ms is not None:
+                token.deadline = time.time() + node_def.timeout_ms / 1000
+            params = {**params, "cancel_token": token}
+        with span("tool", tool=node_def.tool_name, execution="async" if node_def.is_async else node_def.execution) as tool_span:
+            # Support both async and sync tools
+            # Sync tools run on their named thread pool to avoid blocking the event loop
+            if node_def.batch:
+                tool_span.set("batched", True)
+                call = self.batcher.submit(
+                    node_def.tool_name, params, self._tool_inputs(node_def, state),
+                    node_def.max_batch_size, node_def.max_batch_wait_ms,
+                    lambda states: self._call_batch(node_def, params, states),
+                    # Everything _call_batch takes from node_def besides params
+                    group=(node_def.func, node_def.execution, node_def.executor),
                 )
-                await self.storage.add_log(log)
-                
-                # Broadcast log to WebSocket clients
-                await ws_manager.broadcast_log(run_id, {
-                    "type": "log",
-                    "run_id": run_id,
-                    "node_id": node_def.id,
-                    "data": log.model_dump(mode="json")
-                })
-
-                # 4. Determine Next Node (Routing)
-                next_node_id = None
-                
-                # Find edges from current node
-                edges = [e for e in graph.edges if e.from_node == run_state.current_node]
-                
-                for edge in edges:
-                    if edge.condition:
-                        # Safe Evaluation using simpleeval (no access to __builtins__, imports, etc.)
-                        try:
-                            # simpleeval provides safe evaluation without access to dangerous functions
-                            # Allowed: Basic comparisons, arithmetic, dict/list access
-                            # Blocked: imports, file operations, exec, eval, __builtins__
-                            names = {"state": run_state.state}
-                            functions = {"len": len, "max": max, "min": min, "abs": abs, "sum": sum}
-                            
-                            result = simple_eval(edge.condition, names=names, functions=functions)
-                            if result:
-                                next_node_id = edge.to_node
-                                break
-                        except (NameNotDefined, SyntaxError, KeyError, Exception) as e:
-                            logger.error(f"Condition evaluation failed for edge {edge.from_node}->{edge.to_node}: {e}")
-                            continue # Try next edge
-                    else:
-                        # Unconditional edge (default)
-                        next_node_id = edge.to_node
-                        break # Take first unconditional edge found
-                
-                # Loop safety
-                loop_counters[run_state.current_node] = loop_counters.get(run_state.current_node, 0) + 1
-                if loop_counters[run_state.current_node] > graph.max_loops:
-                    run_state.status = "failed"
-                    run_state.message = f"Max loops exceeded at node {run_state.current_node}"
-                    await self.storage.save_run(run_state)
-                    await ws_manager.broadcast_status(run_id, "failed", run_state.message)
-                    return
-
-                # Transition
-                if next_node_id:
-                    run_state.current_node = next_node_id
-                    # Save intermediate state? Optional, but good for "GET state".
-                    await self.storage.save_run(run_state)
-                else:
-                    # No outgoing edges -> End of workflow
-                    run_state.current_node = None
-                    run_state.status = "completed"
-                    await self.storage.save_run(run_state)
-                    await ws_manager.broadcast_status(run_id, "completed", "Workflow completed successfully")
-                    break
-                    
-        except Exception as e:
-            logger.exception("Workflow execution failed")
-            run_state.status = "failed"
-            run_state.message = str(e)
-            await self.storage.save_run(run_state)
-            await ws_manager.broadcast_status(run_id, "failed", str(e))
+            elif node_def.is_async:
+                call = tool_func(state, **params)
+                if profiler is not None:
+                    call = profiler.wrap_coroutine(call)
+            elif node_def.execution == "process":
+                # CPU-bound tools run in a worker process; only the declared inputs are shipped
+                call = process_pool.run(
+                    tool_func.__module__, tool_func.__qualname__,
+                    self._tool_inputs(node_def, state), dict(params), profile=profiler is not None
+                )
+                if profiler is not None:
+                    call = profiler.collect_process(call)
+            else:
+                tool_span.set("executor", node_def.executor)
+
+                def run_in_thread():
+                    tool_span.mark_started() # Time spent queued for a pool thread
+                    return tool_func(state, **params)
+                if profiler is not None:
+                    run_in_thread = profiler.wrap_sync(run_in_thread)
+                call = executor_pools.run(node_def.executor, run_in_thread)
+            if node_def.timeout_ms is None:
+                return await call
+            try:
+                # Cancels async tools outright; threads and processes can only be
+                # signalled, and keep their worker until the tool returns
+                return await asyncio.wait_for(call, node_def.timeout_ms / 1000)
+            except asyncio.TimeoutError:
+                if token is not None:
+                    token.cancel()
+                raise StepFailed(f"Node {node_def.id} timed out after {node_def.timeout_ms} ms")
+
+    @staticmethod
+    async def _call_batch(node_def: CompiledNode, params: Mapping[str, Any], states: List[Dict[str, Any]]) -> Any:
+        """Calls a batch tool once with the states of several waiting nodes."""
+        tool_func = node_def.func
+        if node_def.is_async:
+            return await tool_func(states, **params)
+        if node_def.execution == "process":
+            return await process_pool.run(tool_func.__module__, tool_func.__qualname__, states, dict(params))
+        return await executor_pools.run(node_def.executor, lambda: tool_func(states, **params))
+
+    @staticmethod
+    def _tool_inputs(node_def: CompiledNode, state: Dict[str, Any]) -> Dict[str, Any]:
+        """The part of state a tool declared it reads (all of it if it declared nothing)."""
+        if node_def.inputs is None:
+            return state
+        return {key: state[key] for key in node_def.inputs if key in state}
+
+    @staticmethod
+    def _route(node_def: CompiledNode, state: Dict[str, Any]) -> List[str]:
+        """
+        Evaluates outgoing edges in declaration order. Returns the first match,
+        or every match for fan-out nodes. An empty list ends the path.
+        """
+        next_ids: List[str] = []
+        for edge in node_def.edges:
+            if edge.condition:
+                # Safe evaluation of the pre-parsed condition (simpleeval AST walk)
+                with span("condition", edge=f"{edge.from_node}->{edge.to_node}") as condition_span:
+                    try:
+                        matched = bool(edge.condition.evaluate(state))
+                    except Exception as e:
+                        logger.error(f"Condition evaluation failed for edge {edge.from_node}->{edge.to_node}: {e}")
+                        matched = False # Try next edge
+                    condition_span.set("matched", matched)
+                if not matched:
+                    continue
+            # Condition matched, or unconditional edge (default)
+            next_ids.append(edge.to_node)
+            if not node_def.fan_out:
+                break
+        return next_ids
+
+    async def _fan_out(
+        self, ctx: "_RunContext", node_def: CompiledNode, targets: List[str], state: Dict[str, Any]
+    ) -> Optional[str]:
+        """
+        Runs one branch per target concurrently, each on a shallow copy of state,
+        then merges their changes into state. Returns the join node the branches
+        converged on (None if they all ran to the end of the graph).
+        """
+        fork = state.copy()
+        branch_states = [state.copy() for _ in targets]
+        tasks = [
+            asyncio.create_task(self._run_path(ctx, target, branch_state, branch=True))
+            for target, branch_state in zip(targets, branch_states)
+        ]
+        try:
+            # Wall-clock approaches the slowest branch; the first failure cancels the rest
+            done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            for task in pending:
+                task.cancel()
+            for task in tasks:
+                if task in done and task.exception():
+                    raise task.exception()
+        finally:
+            for task in tasks:
+                task.cancel()
+        join_ids = {task.result() for task in tasks}
+
+        if len(join_ids) != 1:
+            raise StepFailed(f"Parallel branches from node {node_def.id} did not converge on a single join node")
+        join_id = join_ids.pop()
+        policy = ctx.plan.get_node(join_id).merge_policy if join_id else "error"
+
+        try:
+            changed, removed = merge_branches(fork, branch_states, targets, policy)
+        except MergeConflictError as e:
+            raise StepFailed(f"Merge conflict at {join_id or 'end of graph'}: {e}") from e
+        state.update(changed)
+        for key in removed:
+            state.pop(key, None)
+        # Changed outside a step: the next delta-mode step rebuilds its baseline
+        ctx.delta_state = None
+        return join_id
+
+
+class StepFailed(Exception):
+    """A node failed; the run is marked failed with this message."""
+
+
+class _RunContext:
+    """Per-run bookkeeping shared by the main path and any parallel branches."""
+
+    def __init__(self, run_id: str, plan: CompiledPlan, run_state: WorkflowState, persist_intermediate: bool = True):
+        self.run_id = run_id
+        self.plan = plan
+        self.run_state = run_state
+        self.persist_intermediate = persist_intermediate
+        self.pending_logs: List[ExecutionStep] = [] # Deferred until the run finishes
+        self.loop_counters: Dict[str, int] = {} # Node visits, for infinite loop protection
+        self.step_index = 0
+        self.steps_since_checkpoint = 0
+        self.last_checkpoint = time.monotonic()
+        self.cancel_token = CancelToken() # Parent of every tool call's token
+        self.profiler: Optional[RunProfiler] = None # Set for runs started with profile=True
+        self.cancel_requested = False
+        self.finishing = False
+        self.parent: Optional["_RunContext"] = None # Set for subgraphs run inline
+        self.log_prefix = ""
+        self.snapshot_next = False
+        # Delta log mode: copy of delta_state as of the last step logged on it
+        self.delta_state: Optional[Dict[str, Any]] = None
+        self.delta_base: Dict[str, Any] = {}
+
+    def next_step_index(self) -> int:
+        if self.parent is not None:
+            return self.parent.next_step_index()
+        index = self.step_index
+        self.step_index += 1
+        return index
+
+    def log_id(self, node_id: str) -> str:
+        """Node id as logged: prefixed with the enclosing subgraph nodes' ids."""
+        return self.log_prefix + node_id if self.log_prefix else node_id
+
+    def nested(self, node_id: str, plan: CompiledPlan) -> "_RunContext":
+        """Context for a subgraph run inline by node_id: own plan and loop limits, shared logs and step numbers."""
+        child = _RunContext(self.run_id, plan, self.run_state, self.persist_intermediate)
+        child.parent = self
+        child.log_prefix = f"{self.log_prefix}{node_id}/"
+        child.pending_logs = self.pending_logs
+        child.cancel_token = self.cancel_token
+        child.profiler = self.profiler
+        # The subgraph's state starts fresh, so its first step can't be a delta
+        child.snapshot_next = True
+        return child
+
+    def consume_snapshot(self, force: bool = False) -> bool:
+        """Whether the step being logged must be a full snapshot."""
+        if self.snapshot_next:
+            self.snapshot_next = False
+            return True
+        return force
@@ -0,0 +1,210 @@
+"""Named thread pools for synchronous tools.
+
+Sync tools used to run on the event loop's default executor, shared with
+everything else in the process. Tools now name a pool at registration
+(``@ToolRegistry.register(executor="io")``) and each pool is a dedicated
+``ThreadPoolExecutor``, so slow tools can't starve quick ones.
+
+Pools are configured at startup, e.g. ``EXECUTOR_POOLS="io:32,cpu:4"``
+(``name:size[:thread_name_prefix]``). A pool that is used without being
+configured is created on first use with ``DEFAULT_POOL_SIZE`` threads.
+
+CPU-bound tools registered with ``execution="process"`` run on a shared
+``ProcessPoolExecutor`` instead (``PROCESS_POOL_SIZE``,
+``PROCESS_START_METHOD``), sidestepping the GIL.
+"""
+import asyncio
+import cProfile
+import importlib
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POOL = "default"
+DEFAULT_POOL_SIZE = min(32, (os.cpu_count() or 1) + 4)
+
+
+class ExecutorPool:
+    """A ThreadPoolExecutor that tracks how many calls are queued and running."""
+
+    def __init__(self, name: str, max_workers: int, thread_name_prefix: Optional[str] = None):
+        self.name = name
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix=thread_name_prefix or f"pool-{name}"
+        )
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.started = 0
+        self.completed = 0
+        self.active = 0
+
+    def run(self, fn: Callable[[], Any]) -> "asyncio.Future":
+        """Schedules fn on this pool and returns an awaitable for its result."""
+        with self._lock:
+            self.submitted += 1
+
+        def tracked():
+            with self._lock:
+                self.started += 1
+                self.active += 1
+            try:
+                return fn()
+            finally:
+                with self._lock:
+                    self.active -= 1
+                    self.completed += 1
+
+        return asyncio.get_running_loop().run_in_executor(self.executor, tracked)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "active": self.active,
+                "queued": self.submitted - self.started,
+                "completed": self.completed,
+            }
+
+    def shutdown(self, wait: bool = True):
+        self.executor.shutdown(wait=wait, cancel_futures=not wait)
+
+
+class ExecutorPools:
+    """Process-wide collection of named executor pools."""
+
+    def __init__(self):
+        self._pools: Dict[str, ExecutorPool] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, name: str, max_workers: int, thread_name_prefix: Optional[str] = None) -> ExecutorPool:
+        """Creates (or replaces) a named pool."""
+        if max_workers < 1:
+            raise ValueError(f"Pool '{name}' needs at least one worker.")
+        pool = ExecutorPool(name, max_workers, thread_name_prefix)
+        with self._lock:
+            old = self._pools.get(name)
+            self._pools[name] = pool
+        if old:
+            old.shutdown(wait=False)
+        return pool
+
+    def configure_from_spec(self, spec: str):
+        """Configures pools from a 'name:size[:prefix],...' string."""
+        for entry in filter(None, (part.strip() for part in spec.split(","))):
+            parts = entry.split(":")
+            if len(parts) not in (2, 3):
+                raise ValueError(f"Invalid executor pool spec '{entry}' (expected name:size[:prefix]).")
+            self.configure(parts[0], int(parts[1]), parts[2] if len(parts) == 3 else None)
+
+    def get(self, name: str = DEFAULT_POOL) -> ExecutorPool:
+        pool = self._pools.get(name)
+        if pool is None:
+            with self._lock:
+                pool = self._pools.get(name)
+                if pool is None:
+                    if name != DEFAULT_POOL:
+                        logger.warning(f"Executor pool '{name}' not configured; creating it with {DEFAULT_POOL_SIZE} threads")
+                    pool = ExecutorPool(name, DEFAULT_POOL_SIZE)
+                    self._pools[name] = pool
+        return pool
+
+    def run(self, name: str, fn: Callable[[], Any]) -> "asyncio.Future":
+        return self.get(name).run(fn)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {name: pool.stats() for name, pool in list(self._pools.items())}
+
+    def shutdown(self, wait: bool = True):
+        with self._lock:
+            pools = list(self._pools.values())
+            self._pools.clear()
+        for pool in pools:
+            pool.shutdown(wait=wait)
+
+
+def _call_tool(module_name: str, qualname: str, state: Dict[str, Any], params: Dict[str, Any]) -> Any:
+    """Runs in a worker process: imports the tool by name and calls it."""
+    target: Any = importlib.import_module(module_name)
+    for part in qualname.split("."):
+        target = getattr(target, part)
+    return target(state, **params)
+
+
+def _call_tool_profiled(module_name: str, qualname: str, state: Dict[str, Any], params: Dict[str, Any]):
+    """Like _call_tool, under cProfile. Returns (result, raw pstats dict)."""
+    profile = cProfile.Profile()
+    result = profile.runcall(_call_tool, module_name, qualname, state, params)
+    profile.create_stats()
+    return result, profile.stats
+
+
+class ProcessPool:
+    """Lazily started ProcessPoolExecutor for tools registered with execution='process'."""
+
+    def __init__(self, max_workers: Optional[int] = None, start_method: Optional[str] = None):
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.configure(max_workers, start_method)
+
+    def configure(self, max_workers: Optional[int] = None, start_method: Optional[str] = None):
+        """Sets the pool size and start method; running workers are replaced on the next call."""
+        self.shutdown(wait=False)
+        self.max_workers = max_workers or (os.cpu_count() or 1)
+        # forkserver/spawn don't inherit the parent's threads and locks, unlike fork
+        methods = multiprocessing.get_all_start_methods()
+        self.start_method = start_method or ("forkserver" if "forkserver" in methods else "spawn")
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.max_workers,
+                        mp_context=multiprocessing.get_context(self.start_method),
+                    )
+        return self._executor
+
+    def run(
+        self, module_name: str, qualname: str, state: Dict[str, Any], params: Dict[str, Any], profile: bool = False
+    ) -> "asyncio.Future":
+        """
+        Calls module_name.qualname(state, **params) in a worker process. Arguments
+        must be picklable. With profile=True the future's result is (result, raw pstats dict).
+        """
+        future = asyncio.get_running_loop().run_in_executor(
+            self._get_executor(), _call_tool_profiled if profile else _call_tool, module_name, qualname, state, params
+        )
+        self.submitted += 1
+        future.add_done_callback(self._on_done)
+        return future
+
+    def _on_done(self, _future):
+        self.completed += 1
+
+    def stats(self) -> Dict[str, int]:
+        in_flight = self.submitted - self.completed
+        return {
+            "max_workers": self.max_workers,
+            "active": min(in_flight, self.max_workers),
+            "queued": max(0, in_flight - self.max_workers),
+            "completed": self.completed,
+        }
+
+    def shutdown(self, wait: bool = True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=wait, cancel_futures=not wait)
+
+
+# Global instances
+executor_pools = ExecutorPools()
+process_pool = ProcessPool()
@@ -0,0 +1,189 @@
+"""Process metrics in the Prometheus text exposition format.
+
+A small, dependency-free subset of a Prometheus client: counters,
+histograms and gauges, rendered by ``MetricsRegistry.render`` for the
+``/metrics`` endpoint.
+
+Counters and histograms are updated on the hot path, so an update is a
+dict lookup and a couple of increments with no lock. Updates must come
+from the event loop thread, which is where every instrumented call site
+runs. Gauges cost nothing until scraped: they read their value from a
+callback, e.g. the scheduler's queue depth.
+"""
+import bisect
+import math
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds, from sub-millisecond tool calls up to long-running nodes
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self.samples()
+
+
+class Counter(_Metric):
+    """Monotonic count, optionally per label values."""
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in sorted(self._values.items())
+        ]
+
+
+class Histogram(_Metric):
+    """Distribution of observed values over fixed buckets, optionally per label values."""
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [count per bucket (last is +Inf), sum, count]; buckets
+        # are stored non-cumulative and summed up when rendered
+        self._series: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, *labels: str):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def count(self, *labels: str) -> int:
+        series = self._series.get(labels)
+        return series[2] if series else 0
+
+    def samples(self) -> List[str]:
+        lines = []
+        bucket_names = self.labelnames + ("le",)
+        for labels, (counts, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                lines.append(
+                    f"{self.name}_bucket{_labels(bucket_names, labels + (_format_value(bound),))} {cumulative}"
+                )
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class Gauge(_Metric):
+    """Current value read at scrape time from a callback returning {label values: value}."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._read: Optional[Callable[[], Dict[LabelValues, float]]] = None
+
+    def set_function(self, read: Callable[[], Dict[LabelValues, float]]):
+        self._read = read
+
+    def samples(self) -> List[str]:
+        if self._read is None:
+            return []
+        return [
+            f"{self.name}{_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in sorted(self._read().items())
+        ]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _add(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric '{metric.name}' is already registered.")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labelnames, buckets))
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._add(Gauge(name, help, labelnames))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Global registry and the engine's metrics
+metrics = MetricsRegistry()
+
+TOOL_DURATION = metrics.histogram(
+    "workflow_tool_duration_seconds", "Duration of node tool calls (a whole map node counts once).", ("tool",)
+)
+STORAGE_LATENCY = metrics.histogram(
+    "workflow_storage_operation_seconds", "Latency of storage backend operations.", ("backend", "method")
+)
+RUN_QUEUE_WAIT = metrics.histogram(
+    "workflow_run_queue_wait_seconds", "Time runs spent queued in the scheduler before starting."
+)
+RUNS_FINISHED = metrics.counter(
+    "workflow_runs_finished_total", "Runs that reached a terminal status.", ("status",)
+)
+RUNS_ACTIVE = metrics.gauge("workflow_runs_active", "Runs currently executing.")
+RUNS_QUEUED = metrics.gauge("workflow_runs_queued", "Runs waiting in the scheduler queue.")
+WS_CONNECTIONS = metrics.gauge("workflow_websocket_connections", "Open WebSocket connections.")
+WS_BROADCAST = metrics.histogram(
+    "workflow_websocket_broadcast_seconds", "Time to buffer an event and send it to a run's WebSocket clients."
+)
+EXECUTOR_QUEUED = metrics.gauge(
+    "workflow_executor_queued", "Sync tool calls waiting for a worker, per pool ('process' is the process pool).", ("pool",)
+)
+EXECUTOR_ACTIVE = metrics.gauge(
+    "workflow_executor_active", "Sync tool calls running, per pool ('process' is the process pool).", ("pool",)
+)
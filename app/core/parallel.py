@@ -0,0 +1,65 @@
+"""Fan-in merging for parallel branches.
+
+Each branch runs on its own shallow copy of the state taken at the fan-out
+node. At the join node the changes every branch made are merged back into
+the parent state. Keys changed by more than one branch (with different
+values) are resolved by the join node's merge policy:
+
+- ``error``: fail the run
+- ``first_wins`` / ``last_wins``: keep the value from the first/last branch,
+  in edge declaration order (not completion order)
+- ``collect``: store the list of values, in edge declaration order
+"""
+from typing import Any, Dict, List, Sequence, Tuple
+from app.core.deltas import state_delta
+
+MERGE_POLICIES = ("error", "first_wins", "last_wins", "collect")
+
+_REMOVED = object()
+
+
+class MergeConflictError(ValueError):
+    """Raised when branches disagree on a key and the policy is 'error'."""
+
+
+def merge_branches(
+    fork: Dict[str, Any],
+    branch_states: Sequence[Dict[str, Any]],
+    branch_names: Sequence[str],
+    policy: str = "error",
+) -> Tuple[Dict[str, Any], List[str]]:
+    """Returns (changed, removed) to apply to the parent state."""
+    # key -> [(branch name, value or _REMOVED)] in declaration order
+    writes: Dict[str, List[Tuple[str, Any]]] = {}
+    for name, branch_state in zip(branch_names, branch_states):
+        changed, removed = state_delta(fork, branch_state)
+        for key, value in changed.items():
+            writes.setdefault(key, []).append((name, value))
+        for key in removed:
+            writes.setdefault(key, []).append((name, _REMOVED))
+
+    merged: Dict[str, Any] = {}
+    removed_keys: List[str] = []
+    for key, values in writes.items():
+        distinct = []
+        for _, value in values:
+            if not any(value is d or (value is not _REMOVED and d is not _REMOVED and value == d) for d in distinct):
+                distinct.append(value)
+
+        if len(distinct) == 1:
+            chosen = distinct[0]
+        elif policy == "first_wins":
+            chosen = values[0][1]
+        elif policy == "last_wins":
+            chosen = values[-1][1]
+        elif policy == "collect":
+            chosen = [value for _, value in values if value is not _REMOVED]
+        else:
+            names = ", ".join(name for name, _ in values)
+            raise MergeConflictError(f"Branches {names} wrote conflicting values for '{key}'")
+
+        if chosen is _REMOVED:
+            removed_keys.append(key)
+        else:
+            merged[key] = chosen
+    return merged, removed_keys
@@ -0,0 +1,209 @@
+"""Write-behind persistence for run state and logs.
+
+Awaiting ``storage.save_run`` and ``storage.add_log`` inline costs every
+step one or two commits. ``PersistenceQueue`` sits between the engine and
+its storage and, depending on its durability mode:
+
+- ``sync``: writes straight through, as before.
+- ``batched``: queues writes and a background writer commits them in one
+  transaction every ``flush_interval`` seconds or ``batch_size`` writes.
+  A run's terminal state waits for the flush, so a finished run is durable
+  before it is reported finished.
+- ``none``: like ``batched``, but nothing waits for the flush. A crash can
+  lose the last ``flush_interval`` of writes, including final states.
+
+Only the latest queued state of each run is written, and batches are
+written one at a time, so each run's writes land in order. Reads made
+through ``get_run`` see queued states before they are flushed.
+
+States and logs are deep-copied when queued: the engine and its tools
+keep changing the run's containers in place, and the write happens later.
+A batch that fails to write stays queued, under any newer states of the
+same runs, and is retried with backoff; after ``max_attempts`` failures in
+a row it is dropped. The error is raised to a ``final=True`` caller.
+"""
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional
+
+from app.core.deltas import detach
+from app.core.storage import BaseStorage
+from app.models.schemas import WorkflowState, ExecutionStep
+
+logger = logging.getLogger(__name__)
+
+DURABILITY_MODES = ("sync", "batched", "none")
+
+
+def _detach_log(log: ExecutionStep) -> ExecutionStep:
+    return log.model_copy(update={
+        "input_state": detach(log.input_state),
+        "output_state": detach(log.output_state),
+        "delta": detach(log.delta),
+        "removed_keys": detach(log.removed_keys),
+        "loop": detach(log.loop),
+    })
+
+
+class PersistenceQueue:
+    """Buffers run state and log writes in front of a storage backend."""
+
+    def __init__(
+        self,
+        storage: BaseStorage,
+        mode: str = "batched",
+        flush_interval: float = 0.05,
+        batch_size: int = 500,
+        max_attempts: int = 8,
+        max_retry_delay: float = 5.0,
+    ):
+        if mode not in DURABILITY_MODES:
+            raise ValueError(f"Unknown durability mode '{mode}' (expected one of {', '.join(DURABILITY_MODES)}).")
+        self.storage = storage
+        self.mode = mode
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.max_retry_delay = max_retry_delay
+        # Latest unwritten state per run, and unwritten logs in order
+        self._runs: Dict[str, WorkflowState] = {}
+        self._logs: List[ExecutionStep] = []
+        self._pending = 0
+        self._failures = 0 # Failed flushes in a row
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._writer: Optional[asyncio.Task] = None
+
+        # Stats
+        self.flushes = 0
+        self.written = 0
+        self.errors = 0
+        self.dropped = 0
+        self._flush_time = 0.0
+
+    def _bind_loop(self):
+        # Locks and events belong to one event loop; tests and TestClient use several
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._lock = asyncio.Lock()
+            self._wakeup = asyncio.Event()
+            self._writer = None
+
+    async def save_run(self, run: WorkflowState, final: bool = False):
+        """Queues the run's current state. final=True marks a terminal state."""
+        if self.mode == "sync":
+            await self.storage.save_run(run)
+            return
+        # Snapshot: the engine keeps mutating run.state after this returns
+        self._runs[run.run_id] = run.model_copy(update={"state": detach(run.state)})
+        self._pending += 1
+        if final and self.mode == "batched":
+            await self.flush()
+        else:
+            self._schedule()
+
+    async def add_log(self, log: ExecutionStep):
+        if self.mode == "sync":
+            await self.storage.add_log(log)
+            return
+        self._logs.append(_detach_log(log))
+        self._pending += 1
+        self._schedule()
+
+    async def add_logs(self, logs: List[ExecutionStep]):
+        if self.mode == "sync":
+            await self.storage.add_logs(logs)
+            return
+        self._logs.extend(_detach_log(log) for log in logs)
+        self._pending += len(logs)
+        self._schedule()
+
+    async def get_run(self, run_id: str) -> Optional[WorkflowState]:
+        """The run's latest state, including a queued one that isn't written yet."""
+        queued = self._runs.get(run_id)
+        if queued is not None:
+            return queued
+        return await self.storage.get_run(run_id)
+
+    def _schedule(self):
+        self._bind_loop()
+        if self._pending >= self.batch_size:
+            self._wakeup.set()
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._write_loop(), name="persistence-writer")
+
+    async def _write_loop(self):
+        while self._pending:
+            if self._failures:
+                # Back off while storage is failing rather than waking per write
+                await asyncio.sleep(min(self.flush_interval * 2 ** self._failures, self.max_retry_delay))
+            else:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                pass # Logged by flush; the batch is still queued
+
+    async def flush(self):
+        """Writes everything queued so far. If a batch fails it stays queued and the error is raised."""
+        if self.mode == "sync":
+            return
+        self._bind_loop()
+        async with self._lock:
+            while self._pending:
+                runs, logs = self._runs, self._logs
+                self._runs, self._logs, self._pending = {}, [], 0
+                started = time.perf_counter()
+                try:
+                    await self.storage.write_batch(list(runs.values()), logs)
+                    self.written += len(runs) + len(logs)
+                    self._failures = 0
+                except Exception:
+                    self.errors += 1
+                    self._failures += 1
+                    if self._failures >= self.max_attempts:
+                        self._failures = 0
+                        self.dropped += len(runs) + len(logs)
+                        logger.exception(
+                            f"Dropped a batch of {len(runs)} run states and {len(logs)} logs "
+                            f"after {self.max_attempts} failed writes"
+                        )
+                    else:
+                        self._requeue(runs, logs)
+                        logger.exception(f"Could not write a batch of {len(runs)} run states and {len(logs)} logs; will retry")
+                    raise
+                finally:
+                    self.flushes += 1
+                    self._flush_time += time.perf_counter() - started
+
+    def _requeue(self, runs: Dict[str, WorkflowState], logs: List[ExecutionStep]):
+        """Puts a failed batch back in front of the writes queued since. A newer state of a run wins."""
+        for run_id, run in runs.items():
+            self._runs.setdefault(run_id, run)
+        self._logs[:0] = logs
+        self._pending = len(self._runs) + len(self._logs)
+        self._schedule()
+
+    async def close(self):
+        """Flushes queued writes; call on shutdown. Writes that still fail are logged and lost."""
+        if self._pending:
+            try:
+                await self.flush()
+            except Exception:
+                logger.error(f"Lost {self._pending} queued writes at shutdown")
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "mode": self.mode,
+            "pending": self._pending,
+            "flushes": self.flushes,
+            "written": self.written,
+            "errors": self.errors,
+            "dropped": self.dropped,
+            "flush_ms_mean": (self._flush_time / self.flushes * 1000) if self.flushes else 0.0,
+        }
@@ -0,0 +1,217 @@
+"""Compiled execution plans for workflow graphs.
+
+A ``GraphDefinition`` is convenient for the API but slow to execute from
+directly: finding a node or its outgoing edges means scanning lists on
+every step. ``compile_graph`` turns a validated definition into an
+immutable ``CompiledPlan`` with a node index, per-node adjacency lists
+(in declaration order), pre-parsed edge conditions and pre-resolved tool
+callables.
+"""
+import asyncio
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Any, Callable, Dict, FrozenSet, List, Mapping, Optional, Set, Tuple
+from app.models.schemas import GraphDefinition
+from app.core.registry import ToolRegistry
+from app.core.conditions import CompiledCondition, parse_condition
+
+
+@dataclass(frozen=True)
+class CompiledEdge:
+    """An outgoing edge with its condition pre-parsed (None = unconditional)."""
+    from_node: str
+    to_node: str
+    condition: Optional[CompiledCondition]
+
+
+@dataclass(frozen=True)
+class CompiledNode:
+    """A node with everything the executor needs resolved up front."""
+    id: str
+    tool_name: Optional[str]
+    func: Optional[Callable]
+    is_async: bool
+    executor: str
+    execution: str
+    inputs: Optional[Tuple[str, ...]]
+    pure: bool
+    version: str
+    params: Mapping[str, Any]
+    edges: Tuple[CompiledEdge, ...]
+    fan_out: bool = False
+    join: bool = False
+    merge_policy: str = "error"
+    checkpoint: bool = False
+    timeout_ms: Optional[int] = None
+    cancellable: bool = False
+    # For fast_loop nodes: ids of the nodes in the cycle (its strongly connected component)
+    loop_body: FrozenSet[str] = frozenset()
+    # Subgraph nodes: the referenced graph's plan, resolved when this plan is compiled
+    subplan: Optional["CompiledPlan"] = None
+    input_map: Mapping[str, str] = field(default_factory=lambda: MappingProxyType({}))
+    output_map: Mapping[str, str] = field(default_factory=lambda: MappingProxyType({}))
+    # Batch tools: concurrent calls are grouped into one (see app.core.batching)
+    batch: bool = False
+    max_batch_size: int = 1
+    max_batch_wait_ms: float = 0.0
+    # Map nodes: the tool runs once per item of state[map_over]
+    map_over: Optional[str] = None
+    map_item_key: str = "item"
+    map_output: Optional[str] = None
+    map_concurrency: int = 8
+
+
+@dataclass(frozen=True)
+class CompiledPlan:
+    """Immutable, executable form of a graph definition."""
+    graph_id: str
+    start_node: str
+    max_loops: int
+    log_mode: str
+    log_snapshot_every: int
+    priority: int
+    checkpoint_policy: str
+    checkpoint_every: int
+    checkpoint_interval_ms: int
+    nodes: Mapping[str, CompiledNode]
+    definition: GraphDefinition
+
+    def get_node(self, node_id: str) -> Optional[CompiledNode]:
+        return self.nodes.get(node_id)
+
+
+def compile_graph(
+    graph_id: str, definition: GraphDefinition, subplans: Optional[Mapping[str, "CompiledPlan"]] = None
+) -> CompiledPlan:
+    """
+    Builds a CompiledPlan. The definition is expected to be validated already;
+    subplans maps the graph_id of every referenced subgraph to its plan.
+    """
+    subplans = subplans or {}
+    adjacency: Dict[str, List[CompiledEdge]] = {n.id: [] for n in definition.nodes}
+    for edge in definition.edges:
+        condition = parse_condition(edge.condition) if edge.condition else None
+        adjacency.setdefault(edge.from_node, []).append(
+            CompiledEdge(from_node=edge.from_node, to_node=edge.to_node, condition=condition)
+        )
+
+    loop_bodies = {
+        node.id: _loop_body(definition, adjacency, node.id)
+        for node in definition.nodes if node.fast_loop
+    }
+
+    nodes: Dict[str, CompiledNode] = {}
+    for node in definition.nodes:
+        if node.id in nodes:
+            # Keep the first declaration, matching the old linear-scan lookup
+            continue
+        if node.subgraph is not None:
+            subplan = subplans.get(node.subgraph)
+            if subplan is None:
+                raise ValueError(f"Subgraph '{node.subgraph}' not found (Node: {node.id}).")
+            nodes[node.id] = CompiledNode(
+                id=node.id,
+                tool_name=None,
+                func=None,
+                is_async=False,
+                executor="default",
+                execution="thread",
+                inputs=None,
+                pure=False,
+                version="1",
+                params=MappingProxyType({}),
+                edges=tuple(adjacency.get(node.id, ())),
+                fan_out=node.fan_out,
+                join=node.join,
+                merge_policy=node.merge_policy,
+                checkpoint=node.checkpoint,
+                timeout_ms=node.timeout_ms,
+                loop_body=loop_bodies.get(node.id, frozenset()),
+                subplan=subplan,
+                input_map=MappingProxyType(dict(node.input_map)),
+                output_map=MappingProxyType(dict(node.output_map)),
+            )
+            continue
+        spec = ToolRegistry.get_spec(node.tool)
+        if spec is None:
+            raise ValueError(f"Tool '{node.tool}' not found in registry (Node: {node.id}).")
+        execution = node.execution or spec.execution
+        if execution == "process" and spec.execution != "process":
+            ToolRegistry.check_process_tool(node.tool, spec.func)
+        if node.map_over is not None and spec.inputs is not None and node.map_item_key not in spec.inputs:
+            raise ValueError(
+                f"Map node '{node.id}': tool '{node.tool}' doesn't declare '{node.map_item_key}' in its inputs."
+            )
+        nodes[node.id] = CompiledNode(
+            id=node.id,
+            tool_name=node.tool,
+            func=spec.func,
+            is_async=asyncio.iscoroutinefunction(spec.func),
+            executor=node.executor or spec.executor,
+            execution=execution,
+            inputs=spec.inputs,
+            pure=spec.pure,
+            version=spec.version,
+            params=MappingProxyType(dict(node.params)),
+            edges=tuple(adjacency.get(node.id, ())),
+            fan_out=node.fan_out,
+            join=node.join,
+            merge_policy=node.merge_policy,
+            checkpoint=node.checkpoint,
+            timeout_ms=node.timeout_ms,
+            cancellable=spec.cancellable,
+            loop_body=loop_bodies.get(node.id, frozenset()),
+            batch=spec.batch,
+            max_batch_size=spec.max_batch_size,
+            max_batch_wait_ms=spec.max_batch_wait_ms,
+            map_over=node.map_over,
+            map_item_key=node.map_item_key,
+            map_output=(node.map_output or f"{node.map_over}_results") if node.map_over is not None else None,
+            map_concurrency=node.map_concurrency,
+        )
+
+    return CompiledPlan(
+        graph_id=graph_id,
+        start_node=definition.start_node,
+        max_loops=definition.max_loops,
+        log_mode=definition.log_mode,
+        log_snapshot_every=definition.log_snapshot_every,
+        priority=definition.priority,
+        checkpoint_policy=definition.checkpoint_policy,
+        checkpoint_every=definition.checkpoint_every,
+        checkpoint_interval_ms=definition.checkpoint_interval_ms,
+        nodes=MappingProxyType(nodes),
+        definition=definition,
+    )
+
+
+def _loop_body(definition: GraphDefinition, adjacency: Dict[str, List[CompiledEdge]], head: str) -> FrozenSet[str]:
+    """Nodes on a cycle through head (reachable from it and able to reach it back)."""
+    reverse: Dict[str, List[str]] = {}
+    for edges in adjacency.values():
+        for edge in edges:
+            reverse.setdefault(edge.to_node, []).append(edge.from_node)
+
+    def reach(start: str, neighbours) -> Set[str]:
+        seen: Set[str] = set()
+        stack = [start]
+        while stack:
+            for nxt in neighbours(stack.pop()):
+                if nxt not in seen:
+                    seen.add(nxt)
+                    stack.append(nxt)
+        return seen
+
+    forward = reach(head, lambda n: [e.to_node for e in adjacency.get(n, ())])
+    if head not in forward:
+        raise ValueError(f"fast_loop node '{head}' is not part of a cycle.")
+    body = forward & reach(head, lambda n: reverse.get(n, ()))
+
+    by_id = {n.id: n for n in reversed(definition.nodes)}
+    for node_id in body:
+        node = by_id[node_id]
+        if node.fan_out or node.join or node.subgraph:
+            raise ValueError(f"fast_loop cycle at '{head}' can't contain fan-out, join or subgraph node '{node_id}'.")
+        if node.fast_loop and node_id != head:
+            raise ValueError(f"fast_loop cycle at '{head}' contains another fast_loop node '{node_id}'.")
+    return frozenset(body)
@@ -0,0 +1,320 @@
+"""On-demand profiling of a run's tool calls.
+
+A run started with ``profile=True`` (``POST /graph/run?profile=true``) wraps
+every tool call in ``cProfile``:
+
+- async tools are profiled only while their own coroutine is running, so
+  other tasks sharing the event loop don't show up in their stats
+- sync tools are profiled on the pool thread that runs them
+- process tools are profiled in the worker, which sends the raw stats back
+  with the result
+
+Batch tools serve several runs in one call and are not profiled.
+
+From Python 3.12 cProfile sits on ``sys.monitoring`` and only one profiler
+can be enabled in the interpreter at a time, so concurrent profiled runs
+(or a sync tool profiling on a pool thread while an async one runs) take
+turns through a shared slot. A call that finds the slot taken, or another
+profiling tool active, runs unprofiled and is counted in the node's
+``unprofiled_calls`` rather than failing the run.
+
+When the run finishes, the stats are aggregated per node (subgraph nodes
+as ``node/sub_node``) and written to the ``ProfileStore``. Each run gets a
+``.pstats`` file covering all nodes (``pstats.Stats(path)``), a
+``.collapsed`` file of collapsed stacks weighted in microseconds for
+flamegraph.pl or speedscope, and a ``.json`` per-node summary. Runs
+without the flag skip all of this; the engine checks one attribute per
+tool call.
+"""
+import cProfile
+import json
+import os
+import pstats
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+Function = Tuple[str, int, str] # pstats key: (file, line, function name)
+
+
+class _RawStats:
+    """Lets pstats.Stats load a stats dict sent back by a worker process."""
+
+    def __init__(self, stats: Dict[Function, tuple]):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+class _ProfilerSlot:
+    """
+    Enables profilers without overlapping them. Before 3.12 each thread has
+    its own profile hook, and async slices on one thread never overlap, so
+    only a failing enable() is caught; from 3.12 one profiler may be active
+    per interpreter and the slot is taken without blocking.
+    """
+
+    def __init__(self, exclusive: bool = sys.version_info >= (3, 12)):
+        self._lock = threading.Lock() if exclusive else None
+
+    def enable(self, profile: cProfile.Profile) -> bool:
+        if self._lock is not None and not self._lock.acquire(blocking=False):
+            return False
+        try:
+            profile.enable()
+        except ValueError: # Another profiling tool is already active
+            self._release()
+            return False
+        return True
+
+    def disable(self, profile: cProfile.Profile):
+        profile.disable()
+        self._release()
+
+    def _release(self):
+        if self._lock is not None:
+            self._lock.release()
+
+
+_slot = _ProfilerSlot()
+
+
+class _ProfiledAwaitable:
+    """Drives a coroutine, enabling the profiler only while the coroutine itself executes."""
+
+    def __init__(self, coro, profile: cProfile.Profile):
+        self.coro = coro
+        self.profile = profile
+        self.profiled = 0 # Slices run with the profiler on
+        self.skipped = 0 # Slices run without it because the slot was taken
+
+    def __await__(self):
+        coro, profile = self.coro, self.profile
+        value, error = None, None
+        while True:
+            enabled = _slot.enable(profile)
+            if enabled:
+                self.profiled += 1
+            else:
+                self.skipped += 1
+            try:
+                yielded = coro.send(value) if error is None else coro.throw(error)
+            except StopIteration as stop:
+                return stop.value
+            finally:
+                if enabled:
+                    _slot.disable(profile)
+            try:
+                value, error = (yield yielded), None
+            except GeneratorExit:
+                coro.close()
+                raise
+            except BaseException as e:
+                value, error = None, e
+
+
+class NodeProfiler:
+    """Profiles the tool calls of one node of a run."""
+
+    def __init__(self, run_profiler: "RunProfiler", node_id: str):
+        self.run_profiler = run_profiler
+        self.node_id = node_id
+
+    def _add(self, started: float, stats_source, complete: bool = True):
+        self.run_profiler.add(self.node_id, time.perf_counter() - started, stats_source, complete)
+
+    async def wrap_coroutine(self, coro) -> Any:
+        awaitable = _ProfiledAwaitable(coro, cProfile.Profile())
+        started = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            self._add(started, awaitable.profile if awaitable.profiled else None, not awaitable.skipped)
+
+    def wrap_sync(self, fn: Callable[[], Any]) -> Callable[[], Any]:
+        def profiled():
+            profile = cProfile.Profile()
+            started = time.perf_counter()
+            if not _slot.enable(profile):
+                try:
+                    return fn()
+                finally:
+                    self._add(started, None, complete=False)
+            try:
+                return fn()
+            finally:
+                _slot.disable(profile)
+                self._add(started, profile)
+        return profiled
+
+    async def collect_process(self, call: Awaitable[Tuple[Any, Dict[Function, tuple]]]) -> Any:
+        """Awaits a process pool call made with profile=True and keeps the worker's stats."""
+        started = time.perf_counter()
+        result, raw_stats = await call
+        self._add(started, _RawStats(raw_stats))
+        return result
+
+
+class RunProfiler:
+    """Per-node cProfile stats for one run. add() may be called from pool threads."""
+
+    def __init__(self, run_id: str):
+        self.run_id = run_id
+        self.stats: Dict[str, pstats.Stats] = {}
+        self.calls: Dict[str, int] = {}
+        self.wall: Dict[str, float] = {}
+        self.unprofiled: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def node(self, node_id: str) -> NodeProfiler:
+        return NodeProfiler(self, node_id)
+
+    def add(self, node_id: str, wall_seconds: float, stats_source, complete: bool = True):
+        """stats_source is None, and complete False, for a call that ran without the profiler."""
+        with self._lock:
+            if stats_source is not None:
+                if node_id in self.stats:
+                    self.stats[node_id].add(stats_source)
+                else:
+                    self.stats[node_id] = pstats.Stats(stats_source)
+            self.calls[node_id] = self.calls.get(node_id, 0) + 1
+            if not complete:
+                self.unprofiled[node_id] = self.unprofiled.get(node_id, 0) + 1
+            self.wall[node_id] = self.wall.get(node_id, 0.0) + wall_seconds
+
+    def combined(self) -> pstats.Stats:
+        combined = pstats.Stats()
+        for stats in self.stats.values():
+            combined.add(stats)
+        return combined
+
+    def summary(self, top: int = 15) -> Dict[str, Any]:
+        """Per node: calls, wall time and the functions with the most cumulative time."""
+        nodes = {}
+        for node_id, calls in self.calls.items():
+            stats = self.stats.get(node_id)
+            functions = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:top] if stats else []
+            nodes[node_id] = {
+                "calls": calls,
+                "unprofiled_calls": self.unprofiled.get(node_id, 0),
+                "total_ms": self.wall[node_id] * 1000,
+                "top_functions": [
+                    {
+                        "function": _label(func),
+                        "ncalls": nc,
+                        "tottime_ms": tt * 1000,
+                        "cumtime_ms": ct * 1000,
+                    }
+                    for func, (cc, nc, tt, ct, callers) in functions
+                ],
+            }
+        return {"run_id": self.run_id, "nodes": nodes}
+
+    def collapsed(self) -> List[str]:
+        """Collapsed stacks, 'node;caller;...;function microseconds', rebuilt from the call graph."""
+        lines: Dict[str, int] = {}
+        for node_id, stats in self.stats.items():
+            for stack, seconds in _stacks(stats.stats):
+                key = ";".join([node_id] + [_label(func) for func in stack])
+                lines[key] = lines.get(key, 0) + int(seconds * 1e6)
+        return [f"{stack} {micros}" for stack, micros in sorted(lines.items()) if micros > 0]
+
+
+def _label(func: Function) -> str:
+    filename, line, name = func
+    if filename == "~":
+        return name # Built-in, e.g. "<built-in method time.sleep>"
+    module = os.path.splitext(os.path.basename(filename))[0]
+    return f"{module}:{name}:{line}"
+
+
+def _stacks(raw: Dict[Function, tuple], max_depth: int = 64):
+    """
+    Yields (stack, self seconds) pairs. cProfile only records caller/callee
+    pairs, so a function's time is split between its callers in proportion to
+    the time each call edge accounts for.
+    """
+    callees: Dict[Function, List[Tuple[Function, float]]] = {}
+    for func, (cc, nc, tt, ct, callers) in raw.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((func, edge[3]))
+    roots = [func for func, value in raw.items() if not any(caller in raw for caller in value[4])]
+
+    def walk(func: Function, stack: List[Function], inclusive: float):
+        cc, nc, tt, ct, callers = raw[func]
+        share = inclusive / ct if ct > 0 else 0.0
+        yield stack, tt * share
+        if len(stack) >= max_depth:
+            return
+        for callee, edge_time in callees.get(func, ()):
+            if callee in raw and callee not in stack:
+                yield from walk(callee, stack + [callee], edge_time * share)
+
+    for root in roots:
+        yield from walk(root, [root], raw[root][3])
+
+
+class ProfileStore:
+    """
+    Profile artifacts on disk: <run_id>.pstats, <run_id>.collapsed and
+    <run_id>.json. Only the newest max_runs runs are kept (0 keeps all);
+    each save removes the artifacts of older runs.
+    """
+
+    KINDS = ("pstats", "collapsed", "json")
+
+    def __init__(self, directory: Optional[str] = None, max_runs: int = 100):
+        self.configure(directory, max_runs)
+
+    def configure(self, directory: Optional[str] = None, max_runs: int = 100):
+        self.directory = directory or os.path.join(tempfile.gettempdir(), "workflow-profiles")
+        self.max_runs = max_runs
+
+    def path(self, run_id: str, kind: str) -> str:
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown profile artifact '{kind}' (expected one of {', '.join(self.KINDS)}).")
+        return os.path.join(self.directory, f"{os.path.basename(run_id)}.{kind}")
+
+    def save(self, profiler: RunProfiler):
+        """Writes the run's artifacts. Blocking; call it off the event loop."""
+        os.makedirs(self.directory, exist_ok=True)
+        if profiler.stats:
+            profiler.combined().dump_stats(self.path(profiler.run_id, "pstats"))
+        with open(self.path(profiler.run_id, "collapsed"), "w", encoding="utf-8") as f:
+            f.write("".join(line + "\n" for line in profiler.collapsed()))
+        with open(self.path(profiler.run_id, "json"), "w", encoding="utf-8") as f:
+            json.dump(profiler.summary(), f)
+        if self.max_runs:
+            self._prune(keep=profiler.run_id)
+
+    def _prune(self, keep: str):
+        """Removes the artifacts of all but the newest max_runs runs, by summary mtime."""
+        runs = []
+        for entry in os.scandir(self.directory):
+            run_id, ext = os.path.splitext(entry.name)
+            if ext == ".json" and run_id != keep:
+                try:
+                    runs.append((entry.stat().st_mtime, run_id))
+                except FileNotFoundError:
+                    continue
+        runs.sort(reverse=True)
+        for _, run_id in runs[self.max_runs - 1:]:
+            for kind in self.KINDS:
+                try:
+                    os.remove(self.path(run_id, kind))
+                except FileNotFoundError:
+                    pass
+
+    def get_summary(self, run_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.path(run_id, "json"), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+
+# Global instance
+profile_store = ProfileStore()
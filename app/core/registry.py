@@ -1,31 +1,103 @@
-from typing import Callable, Dict, Any, Optional
+from typing import Callable, Dict, Any, Optional, Sequence, Tuple
+from dataclasses import dataclass
+import asyncio
 import functools
+import inspect
+
+@dataclass(frozen=True)
+class ToolSpec:
+    """A registered tool and its execution options."""
+    name: str
+    func: Callable
+    executor: str = "default" # Named thread pool for sync tools (see app.core.executors)
+    execution: str = "thread" # "thread" or "process" (CPU-bound sync tools, see app.core.executors)
+    inputs: Optional[Tuple[str, ...]] = None # State keys the tool reads; None = whole state
+    pure: bool = False # Output depends only on inputs and params, so results can be cached (see app.core.cache)
+    version: str = "1" # Bump when a pure tool's behaviour changes to invalidate cached results
+    cancellable: bool = False # Accepts a cancel_token argument (see app.core.cancellation)
+    batch: bool = False # Takes a list of states and returns a list of results (see app.core.batching)
+    max_batch_size: int = 32
+    max_batch_wait_ms: float = 5.0
 
 class ToolRegistry:
     _registry: Dict[str, Callable] = {}
+    _specs: Dict[str, ToolSpec] = {}
 
     @classmethod
-    def register(cls, name: Optional[str] = None):
+    def register(
+        cls,
+        name: Optional[str] = None,
+        executor: str = "default",
+        execution: str = "thread",
+        inputs: Optional[Sequence[str]] = None,
+        pure: bool = False,
+        version: str = "1",
+        batch: bool = False,
+        max_batch_size: int = 32,
+        max_batch_wait_ms: float = 5.0,
+    ):
+        if execution not in ("thread", "process"):
+            raise ValueError(f"Unknown execution mode '{execution}' (expected 'thread' or 'process').")
+        if pure and inputs is None:
+            raise ValueError("pure=True requires inputs, the state keys the cached result depends on.")
+        if batch and (max_batch_size < 1 or max_batch_wait_ms < 0):
+            raise ValueError("Batch tools need max_batch_size >= 1 and max_batch_wait_ms >= 0.")
+
         def decorator(func: Callable):
             tool_name = name or func.__name__
+            if execution == "process":
+                cls.check_process_tool(tool_name, func)
             cls._registry[tool_name] = func
+            cls._specs[tool_name] = ToolSpec(
+                name=tool_name,
+                func=func,
+                executor=executor,
+                execution=execution,
+                inputs=tuple(inputs) if inputs is not None else None,
+                pure=pure,
+                version=str(version),
+                # One call serves many nodes, so batch tools don't get a per-node token
+                cancellable=not batch and "cancel_token" in inspect.signature(func).parameters,
+                batch=batch,
+                max_batch_size=max_batch_size,
+                max_batch_wait_ms=max_batch_wait_ms,
+            )
             @functools.wraps(func)
             def wrapper(*args, **kwargs):
                 return func(*args, **kwargs)
             return wrapper
         return decorator
 
+    @staticmethod
+    def check_process_tool(tool_name: str, func: Callable):
+        """Raises ValueError unless func can run with execution='process'."""
+        # Worker processes import the tool by module and qualified name
+        if asyncio.iscoroutinefunction(func):
+            raise ValueError(f"Tool '{tool_name}': async tools cannot use execution='process'.")
+        if "<locals>" in func.__qualname__ or func.__module__ == "__main__":
+            raise ValueError(f"Tool '{tool_name}': execution='process' requires a module-level function in an importable module.")
+
     @classmethod
     def get_tool(cls, name: str) -> Optional[Callable]:
         return cls._registry.get(name)
 
+    @classmethod
+    def get_spec(cls, name: str) -> Optional[ToolSpec]:
+        return cls._specs.get(name)
+
     @classmethod
     def list_tools(cls) -> Dict[str, str]:
         return {name: func.__doc__ or "No description" for name, func in cls._registry.items()}
-    
+
     @classmethod
     def exists(cls, name: str) -> bool:
         return name in cls._registry
 
 # Global instance not strictly needed as methods are classmethods, but good for consistency if we want to instantiate later.
 registry = ToolRegistry()
+
+
+@ToolRegistry.register("passthrough")
+async def passthrough(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Leaves state unchanged. Useful for join and routing-only nodes."""
+    return {}
@@ -0,0 +1,212 @@
+"""Durable run queue shared by API front-ends and worker processes.
+
+With ``EXECUTION_MODE=queue`` the API process doesn't execute runs: it
+stores them and adds them to this queue, and worker processes
+(``python -m app.worker``) claim and execute them. The queue is a lease
+table in a local SQLite file that every process on the host opens:
+
+- ``claim`` takes the highest-priority unleased runs (FIFO within a
+  priority) and leases them to the worker for ``lease_seconds``
+- workers ``heartbeat`` their runs to extend the leases, and learn which
+  runs were cancelled and which leases they lost
+- ``complete`` removes a finished run; ``release`` hands runs back, e.g.
+  when a worker shuts down before they finish
+- a worker that crashes stops heartbeating, so its leases expire and the
+  runs become claimable again, with ``attempts`` counting the claims
+
+Each operation is one short ``BEGIN IMMEDIATE`` transaction, run off the
+event loop. Times are wall-clock (``time.time()``) because they are
+compared across processes.
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS run_queue (
+    run_id TEXT PRIMARY KEY,
+    graph_id TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    options TEXT NOT NULL DEFAULT '{}',
+    worker_id TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    enqueued_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS run_queue_order ON run_queue (priority DESC, enqueued_at);
+"""
+
+
+@dataclass
+class QueuedRun:
+    """A run waiting in, or leased from, the queue."""
+    run_id: str
+    graph_id: str
+    priority: int = 0
+    options: Dict[str, Any] = field(default_factory=dict) # start_run options, e.g. persist_intermediate
+    attempts: int = 0 # Times the run has been claimed, including the current claim
+    cancel_requested: bool = False
+
+
+class RunQueue:
+    """SQLite lease table of runs waiting for, or held by, a worker process."""
+
+    def __init__(self, path: str, lease_seconds: float = 30.0, poll_interval: float = 0.05):
+        self.path = path
+        # A worker that misses heartbeats for this long loses its runs
+        self.lease_seconds = lease_seconds
+        # How often idle workers look for new runs, and front-ends for finished ones
+        self.poll_interval = poll_interval
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def _transaction(self, fn, *args):
+        """Runs fn(conn, *args) in one write transaction (BEGIN IMMEDIATE takes the write lock up front)."""
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(conn, *args)
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            return result
+
+    async def _run(self, fn, *args):
+        return await asyncio.to_thread(self._transaction, fn, *args)
+
+    async def enqueue(self, runs: Sequence[QueuedRun]):
+        now = time.time()
+        rows = [(run.run_id, run.graph_id, run.priority, json.dumps(run.options), now) for run in runs]
+        await self._run(lambda conn: conn.executemany(
+            "INSERT INTO run_queue (run_id, graph_id, priority, options, enqueued_at) VALUES (?, ?, ?, ?, ?)", rows
+        ))
+
+    async def claim(self, worker_id: str, limit: int = 1) -> List[QueuedRun]:
+        """Leases up to limit runs to worker_id: unleased ones, or ones whose lease has expired."""
+        def claim(conn: sqlite3.Connection) -> List[QueuedRun]:
+            now = time.time()
+            rows = conn.execute(
+                "SELECT run_id, graph_id, priority, options, attempts, cancel_requested FROM run_queue "
+                "WHERE worker_id IS NULL OR lease_expires < ? ORDER BY priority DESC, enqueued_at LIMIT ?",
+                (now, limit),
+            ).fetchall()
+            conn.executemany(
+                "UPDATE run_queue SET worker_id = ?, lease_expires = ?, attempts = attempts + 1 WHERE run_id = ?",
+                [(worker_id, now + self.lease_seconds, row[0]) for row in rows],
+            )
+            return [
+                QueuedRun(run_id, graph_id, priority, json.loads(options), attempts + 1, bool(cancel))
+                for run_id, graph_id, priority, options, attempts, cancel in rows
+            ]
+        return await self._run(claim)
+
+    async def heartbeat(self, worker_id: str, run_ids: Sequence[str]) -> Tuple[Set[str], Set[str]]:
+        """
+        Extends worker_id's leases on run_ids. Returns (lost, cancelled): runs
+        no longer leased to this worker, and runs with a pending cancel request.
+        """
+        def heartbeat(conn: sqlite3.Connection):
+            conn.executemany(
+                "UPDATE run_queue SET lease_expires = ? WHERE run_id = ? AND worker_id = ?",
+                [(time.time() + self.lease_seconds, run_id, worker_id) for run_id in run_ids],
+            )
+            held, cancelled = set(), set()
+            for start in range(0, len(run_ids), 500):
+                chunk = list(run_ids[start:start + 500])
+                placeholders = ",".join("?" * len(chunk))
+                for run_id, cancel in conn.execute(
+                    f"SELECT run_id, cancel_requested FROM run_queue WHERE worker_id = ? AND run_id IN ({placeholders})",
+                    [worker_id, *chunk],
+                ):
+                    held.add(run_id)
+                    if cancel:
+                        cancelled.add(run_id)
+            return set(run_ids) - held, cancelled
+        return await self._run(heartbeat)
+
+    async def complete(self, worker_id: str, run_id: str) -> bool:
+        """Removes a finished run. False if the run isn't leased to worker_id (its lease was lost)."""
+        cursor = await self._run(lambda conn: conn.execute(
+            "DELETE FROM run_queue WHERE run_id = ? AND worker_id = ?", (run_id, worker_id)
+        ))
+        return cursor.rowcount > 0
+
+    async def release(self, worker_id: str, run_ids: Optional[Sequence[str]] = None) -> int:
+        """Returns worker_id's leased runs (all of them, or run_ids) to the queue. Returns how many."""
+        def release(conn: sqlite3.Connection) -> int:
+            if run_ids is None:
+                return conn.execute(
+                    "UPDATE run_queue SET worker_id = NULL, lease_expires = NULL WHERE worker_id = ?", (worker_id,)
+                ).rowcount
+            return sum(
+                conn.execute(
+                    "UPDATE run_queue SET worker_id = NULL, lease_expires = NULL WHERE run_id = ? AND worker_id = ?",
+                    (run_id, worker_id),
+                ).rowcount
+                for run_id in run_ids
+            )
+        return await self._run(release)
+
+    async def request_cancel(self, run_id: str) -> Optional[str]:
+        """
+        Cancels a queued run. Returns "queued" if it was waiting (it is removed
+        and the caller records the cancellation), "leased" if a worker holds it
+        (the worker is told on its next heartbeat), or None if it isn't queued.
+        """
+        def cancel(conn: sqlite3.Connection) -> Optional[str]:
+            row = conn.execute(
+                "SELECT worker_id, lease_expires FROM run_queue WHERE run_id = ?", (run_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            worker_id, lease_expires = row
+            if worker_id is None or lease_expires < time.time():
+                conn.execute("DELETE FROM run_queue WHERE run_id = ?", (run_id,))
+                return "queued"
+            conn.execute("UPDATE run_queue SET cancel_requested = 1 WHERE run_id = ?", (run_id,))
+            return "leased"
+        return await self._run(cancel)
+
+    async def stats(self) -> Dict[str, Any]:
+        def stats(conn: sqlite3.Connection) -> Dict[str, Any]:
+            now = time.time()
+            queued = conn.execute("SELECT COUNT(*) FROM run_queue WHERE worker_id IS NULL").fetchone()[0]
+            expired = conn.execute("SELECT COUNT(*) FROM run_queue WHERE lease_expires < ?", (now,)).fetchone()[0]
+            workers = dict(conn.execute(
+                "SELECT worker_id, COUNT(*) FROM run_queue WHERE lease_expires >= ? GROUP BY worker_id", (now,)
+            ).fetchall())
+            oldest = conn.execute("SELECT MIN(enqueued_at) FROM run_queue WHERE worker_id IS NULL").fetchone()[0]
+            return {
+                "queued": queued,
+                "leased": sum(workers.values()),
+                "expired_leases": expired,
+                "runs_by_worker": workers,
+                "oldest_queued_seconds": now - oldest if oldest is not None else 0.0,
+                "lease_seconds": self.lease_seconds,
+            }
+        return await self._run(stats)
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
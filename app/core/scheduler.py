@@ -0,0 +1,156 @@
+"""Bounded run scheduler.
+
+Runs are admitted into a priority queue and started only while fewer than
+``max_concurrent_runs`` are executing, so a burst of submissions queues up
+instead of spawning thousands of competing tasks. The scheduler keeps a
+reference to every task it starts (un-referenced asyncio tasks can be
+garbage collected mid-run).
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from app.core.metrics import RUN_QUEUE_WAIT
+
+logger = logging.getLogger(__name__)
+
+
+class SchedulerFull(RuntimeError):
+    """Raised when the admission queue is at capacity."""
+
+
+class RunScheduler:
+    """Starts queued runs in priority order (higher first, FIFO within a priority)."""
+
+    def __init__(self, max_concurrent_runs: int = 64, max_queue_size: int = 10000):
+        if max_concurrent_runs < 1:
+            raise ValueError("max_concurrent_runs must be at least 1")
+        self.max_concurrent_runs = max_concurrent_runs
+        self.max_queue_size = max_queue_size
+        # Heap entries: (-priority, sequence, run_id, graph_id, factory, enqueued_at)
+        self._queue: List[Tuple[int, int, str, str, Callable[[], Awaitable[Any]], float]] = []
+        self._sequence = itertools.count()
+        self._active: Dict[str, asyncio.Task] = {}
+        self._closed = False
+
+        # Stats
+        self.submitted = 0
+        self.started = 0
+        self.finished = 0
+        self.rejected = 0
+        self.cancelled = 0 # Queued runs dropped before they started
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._recent_waits: Deque[float] = deque(maxlen=1000)
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    @property
+    def active_count(self) -> int:
+        return len(self._active)
+
+    def open(self):
+        """Admits runs again after shutdown(), for an app started again in the same process."""
+        self._closed = False
+
+    def check_capacity(self, count: int = 1):
+        """Raises SchedulerFull if `count` new runs would not fit (free slots plus queue space)."""
+        if self._closed:
+            raise SchedulerFull("Scheduler is shutting down.")
+        free_slots = max(0, self.max_concurrent_runs - len(self._active))
+        queue_space = self.max_queue_size - len(self._queue)
+        if count > free_slots + queue_space:
+            self.rejected += count
+            raise SchedulerFull(f"Run queue is full ({len(self._queue)} of {self.max_queue_size} runs waiting).")
+
+    def submit(self, run_id: str, graph_id: str, factory: Callable[[], Awaitable[Any]], priority: int = 0):
+        """
+        Queues a run. factory() is called to create the run's coroutine when a
+        slot frees up, so nothing is allocated for runs still waiting.
+        """
+        self.submitted += 1
+        heapq.heappush(
+            self._queue,
+            (-priority, next(self._sequence), run_id, graph_id, factory, time.perf_counter())
+        )
+        self._pump()
+
+    def get_task(self, run_id: str) -> Optional[asyncio.Task]:
+        return self._active.get(run_id)
+
+    def cancel(self, run_id: str) -> bool:
+        """Drops a queued run or cancels its task. Returns False if the run isn't scheduled here."""
+        for i, entry in enumerate(self._queue):
+            if entry[2] == run_id:
+                self._queue[i] = self._queue[-1]
+                self._queue.pop()
+                heapq.heapify(self._queue)
+                self.cancelled += 1
+                return True
+        task = self._active.get(run_id)
+        if task is None:
+            return False
+        task.cancel()
+        return True
+
+    def _pump(self):
+        while self._queue and len(self._active) < self.max_concurrent_runs:
+            _, _, run_id, graph_id, factory, enqueued_at = heapq.heappop(self._queue)
+            wait = time.perf_counter() - enqueued_at
+            self._total_wait += wait
+            self._max_wait = max(self._max_wait, wait)
+            self._recent_waits.append(wait)
+            RUN_QUEUE_WAIT.observe(wait)
+            self.started += 1
+
+            task = asyncio.create_task(factory(), name=f"run-{run_id}")
+            self._active[run_id] = task
+            task.add_done_callback(lambda t, run_id=run_id: self._on_done(run_id, t))
+
+    def _on_done(self, run_id: str, task: asyncio.Task):
+        self._active.pop(run_id, None)
+        self.finished += 1
+        if not task.cancelled() and task.exception():
+            logger.error(f"Run {run_id} task raised: {task.exception()!r}")
+        self._pump()
+
+    def stats(self) -> Dict[str, Any]:
+        waits = sorted(self._recent_waits)
+        p95 = waits[int(len(waits) * 0.95) - 1] if waits else 0.0
+        return {
+            "max_concurrent_runs": self.max_concurrent_runs,
+            "max_queue_size": self.max_queue_size,
+            "active": len(self._active),
+            "queue_depth": len(self._queue),
+            "submitted": self.submitted,
+            "started": self.started,
+            "finished": self.finished,
+            "rejected": self.rejected,
+            "cancelled": self.cancelled,
+            "wait_ms": {
+                "mean": (self._total_wait / self.started * 1000) if self.started else 0.0,
+                "p95_recent": p95 * 1000,
+                "max": self._max_wait * 1000,
+            },
+        }
+
+    async def shutdown(self, timeout: float = 10.0):
+        """Stops admitting runs, drops the queue and waits for active runs (cancelling stragglers)."""
+        self._closed = True
+        if self._queue:
+            logger.warning(f"Dropping {len(self._queue)} queued runs on shutdown")
+            self._queue.clear()
+        tasks = list(self._active.values())
+        if not tasks:
+            return
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
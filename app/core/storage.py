@@ -1,12 +1,18 @@
 from abc import ABC, abstractmethod
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Sequence
 from datetime import datetime, timezone
 from app.models.schemas import GraphDefinition, WorkflowState, ExecutionStep
+from app.core.deltas import expand_steps
+from app.core.metrics import STORAGE_LATENCY
 import json
 import asyncio
+import contextvars
+import functools
+import time
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
-from sqlalchemy import Column, String, Integer, Text, Float, JSON, DateTime
+from sqlalchemy import Column, String, Integer, Text, Float, Boolean, JSON, DateTime, inspect, insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.future import select
 
 # --- SQLAlchemy Models for SQLite ---
@@ -33,13 +39,54 @@ class DBLog(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     run_id = Column(String)
     node_id = Column(String)
-    input_state = Column(JSON)
-    output_state = Column(JSON)
+    input_state = Column(JSON, nullable=True)
+    output_state = Column(JSON, nullable=True)
+    delta = Column(JSON, nullable=True)
+    removed_keys = Column(JSON, nullable=True)
+    step_index = Column(Integer, nullable=True)
+    cached = Column(Boolean, nullable=True)
+    loop = Column(JSON, nullable=True)
     timestamp = Column(DateTime)
     duration_ms = Column(Float)
 
 
+# Operations timed into workflow_storage_operation_seconds
+TIMED_METHODS = (
+    "save_graph", "get_graph", "save_run", "save_runs", "get_run", "get_runs_by_status",
+    "add_log", "add_logs", "write_batch", "get_logs",
+)
+
+
+# Set while a timed operation runs, so the operations it calls (write_batch's
+# default calling save_run, an override calling super()) aren't timed again
+_in_timed_call = contextvars.ContextVar("in_timed_storage_call", default=False)
+
+
+def _timed(backend: str, method: str, func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        if _in_timed_call.get():
+            return await func(*args, **kwargs)
+        token = _in_timed_call.set(True)
+        started = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            _in_timed_call.reset(token)
+            STORAGE_LATENCY.observe(time.perf_counter() - started, backend, method)
+    wrapper._timed = True
+    return wrapper
+
+
 class BaseStorage(ABC):
+    def __init_subclass__(cls, **kwargs):
+        # Time every operation of concrete backends, including inherited defaults
+        super().__init_subclass__(**kwargs)
+        for method in TIMED_METHODS:
+            func = getattr(cls, method, None)
+            if func is not None and not getattr(func, "__isabstractmethod__", False) and not getattr(func, "_timed", False):
+                setattr(cls, method, _timed(cls.__name__, method, func))
+
     @abstractmethod
     async def save_graph(self, graph_id: str, definition: GraphDefinition): pass
 
@@ -49,14 +96,36 @@ class BaseStorage(ABC):
     @abstractmethod
     async def save_run(self, run: WorkflowState): pass
 
+    async def save_runs(self, runs: List[WorkflowState]):
+        """Saves several new runs. Backends override this to insert them in one batch."""
+        for run in runs:
+            await self.save_run(run)
+
     @abstractmethod
     async def get_run(self, run_id: str) -> Optional[WorkflowState]: pass
 
+    @abstractmethod
+    async def get_runs_by_status(self, statuses: Sequence[str]) -> List[WorkflowState]:
+        """Runs whose status is one of statuses, oldest first."""
+
     @abstractmethod
     async def add_log(self, log: ExecutionStep): pass
 
+    async def add_logs(self, logs: List[ExecutionStep]):
+        """Adds several logs. Backends override this to write them in one batch."""
+        for log in logs:
+            await self.add_log(log)
+
+    async def write_batch(self, runs: List[WorkflowState], logs: List[ExecutionStep]):
+        """Saves (inserts or updates) runs and adds logs. Backends override this to commit once."""
+        for run in runs:
+            await self.save_run(run)
+        if logs:
+            await self.add_logs(logs)
+
     @abstractmethod
-    async def get_logs(self, run_id: str) -> List[ExecutionStep]: pass
+    async def get_logs(self, run_id: str, expand: bool = False) -> List[ExecutionStep]:
+        """Returns logs in execution order. With expand=True, delta-mode steps get full snapshots rebuilt."""
 
 
 class InMemoryStorage(BaseStorage):
@@ -74,28 +143,53 @@ class InMemoryStorage(BaseStorage):
     async def save_run(self, run: WorkflowState):
         self.runs[run.run_id] = run
 
+    async def save_runs(self, runs: List[WorkflowState]):
+        self.runs.update((run.run_id, run) for run in runs)
+
     async def get_run(self, run_id: str) -> Optional[WorkflowState]:
         return self.runs.get(run_id)
 
+    async def get_runs_by_status(self, statuses: Sequence[str]) -> List[WorkflowState]:
+        runs = [run for run in self.runs.values() if run.status in statuses]
+        return sorted(runs, key=lambda run: run.created_at)
+
     async def add_log(self, log: ExecutionStep):
         if log.run_id not in self.logs:
             self.logs[log.run_id] = []
         self.logs[log.run_id].append(log)
 
-    async def get_logs(self, run_id: str) -> List[ExecutionStep]:
-        return self.logs.get(run_id, [])
+    async def get_logs(self, run_id: str, expand: bool = False) -> List[ExecutionStep]:
+        logs = self.logs.get(run_id, [])
+        return expand_steps(logs) if expand else logs
 
 
 class SQLiteStorage(BaseStorage):
-    def __init__(self, db_url: str = "sqlite+aiosqlite:///./workflow.db"):
+    def __init__(self, db_url: str = "sqlite+aiosqlite:///./workflow.db", wal: bool = False):
         self.engine = create_async_engine(db_url, echo=False)
         self.async_session = sessionmaker(
             self.engine, expire_on_commit=False, class_=AsyncSession
         )
+        # Write-ahead logging lets readers in other processes proceed while one writes
+        self.wal = wal
     
     async def init_db(self):
+        if self.wal:
+            async with self.engine.connect() as conn:
+                await conn.exec_driver_sql("PRAGMA journal_mode=WAL")
         async with self.engine.begin() as conn:
             await conn.run_sync(Base.metadata.create_all)
+            await conn.run_sync(self._add_missing_columns)
+
+    @staticmethod
+    def _add_missing_columns(sync_conn):
+        """Adds columns introduced after a database file was created (create_all skips existing tables)."""
+        inspector = inspect(sync_conn)
+        for table in Base.metadata.sorted_tables:
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=sync_conn.dialect)
+                    sync_conn.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}')
 
     async def save_graph(self, graph_id: str, definition: GraphDefinition):
         async with self.async_session() as session:
@@ -139,6 +233,52 @@ class SQLiteStorage(BaseStorage):
                 session.add(db_run)
             await session.commit()
 
+    async def save_runs(self, runs: List[WorkflowState]):
+        # Brand-new runs: a single multi-row INSERT in one transaction, no existence checks
+        async with self.async_session() as session:
+            await session.execute(insert(DBRun), [
+                {
+                    "id": run.run_id,
+                    "graph_id": run.graph_id,
+                    "status": run.status,
+                    "current_node": run.current_node,
+                    "state": run.state,
+                    "created_at": run.created_at,
+                    "updated_at": run.updated_at,
+                } for run in runs
+            ])
+            await session.commit()
+
+    async def write_batch(self, runs: List[WorkflowState], logs: List[ExecutionStep]):
+        # Upserts and log inserts share one transaction (one commit per flush)
+        async with self.async_session() as session:
+            if runs:
+                stmt = sqlite_insert(DBRun)
+                await session.execute(
+                    stmt.on_conflict_do_update(
+                        index_elements=[DBRun.id],
+                        set_={
+                            "status": stmt.excluded.status,
+                            "current_node": stmt.excluded.current_node,
+                            "state": stmt.excluded.state,
+                            "updated_at": stmt.excluded.updated_at,
+                        },
+                    ),
+                    [
+                        {
+                            "id": run.run_id,
+                            "graph_id": run.graph_id,
+                            "status": run.status,
+                            "current_node": run.current_node,
+                            "state": run.state,
+                            "created_at": run.created_at,
+                            "updated_at": run.updated_at,
+                        } for run in runs
+                    ],
+                )
+            session.add_all([self._to_db_log(log) for log in logs])
+            await session.commit()
+
     async def get_run(self, run_id: str) -> Optional[WorkflowState]:
         async with self.async_session() as session:
             result = await session.execute(select(DBRun).where(DBRun.id == run_id))
@@ -155,30 +295,69 @@ class SQLiteStorage(BaseStorage):
                 )
             return None
 
-    async def add_log(self, log: ExecutionStep):
+    async def get_runs_by_status(self, statuses: Sequence[str]) -> List[WorkflowState]:
         async with self.async_session() as session:
-            db_log = DBLog(
-                run_id=log.run_id,
-                node_id=log.node_id,
-                input_state=log.input_state,
-                output_state=log.output_state,
-                timestamp=log.timestamp,
-                duration_ms=log.duration_ms
+            result = await session.execute(
+                select(DBRun).where(DBRun.status.in_(list(statuses))).order_by(DBRun.created_at)
             )
-            session.add(db_log)
+            return [
+                WorkflowState(
+                    run_id=db_run.id,
+                    graph_id=db_run.graph_id,
+                    status=db_run.status,
+                    current_node=db_run.current_node,
+                    state=db_run.state,
+                    created_at=db_run.created_at,
+                    updated_at=db_run.updated_at
+                ) for db_run in result.scalars().all()
+            ]
+
+    @staticmethod
+    def _to_db_log(log: ExecutionStep) -> DBLog:
+        return DBLog(
+            run_id=log.run_id,
+            node_id=log.node_id,
+            input_state=log.input_state,
+            output_state=log.output_state,
+            delta=log.delta,
+            removed_keys=log.removed_keys,
+            step_index=log.step_index,
+            cached=log.cached,
+            loop=log.loop,
+            timestamp=log.timestamp,
+            duration_ms=log.duration_ms
+        )
+
+    async def add_log(self, log: ExecutionStep):
+        async with self.async_session() as session:
+            session.add(self._to_db_log(log))
             await session.commit()
 
-    async def get_logs(self, run_id: str) -> List[ExecutionStep]:
+    async def add_logs(self, logs: List[ExecutionStep]):
+        # One transaction for the whole batch
         async with self.async_session() as session:
-            result = await session.execute(select(DBLog).where(DBLog.run_id == run_id).order_by(DBLog.timestamp))
+            session.add_all([self._to_db_log(log) for log in logs])
+            await session.commit()
+
+    async def get_logs(self, run_id: str, expand: bool = False) -> List[ExecutionStep]:
+        async with self.async_session() as session:
+            result = await session.execute(
+                select(DBLog).where(DBLog.run_id == run_id).order_by(DBLog.timestamp, DBLog.id)
+            )
             logs = result.scalars().all()
-            return [
+            steps = [
                 ExecutionStep(
                     run_id=l.run_id,
                     node_id=l.node_id,
                     input_state=l.input_state,
                     output_state=l.output_state,
+                    delta=l.delta,
+                    removed_keys=l.removed_keys,
+                    step_index=l.step_index,
+                    cached=l.cached,
+                    loop=l.loop,
                     timestamp=l.timestamp,
                     duration_ms=l.duration_ms
                 ) for l in logs
             ]
+            return expand_steps(steps) if expand else steps
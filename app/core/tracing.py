@@ -0,0 +1,371 @@
+"""Per-run tracing.
+
+A sampled run gets a trace: a root ``run`` span with child spans for each
+node, tool call (with the time it waited for an executor thread),
+condition evaluation, ``save_run``, ``add_log`` and ``broadcast_log``.
+Finished traces are handed to exporters:
+
+- ``MemoryExporter``: ring of recent traces, served by
+  ``GET /graph/trace/{run_id}``
+- ``JsonlExporter``: one JSON object per span, one line each
+- ``OtlpJsonExporter``: one OTLP/JSON ``ExportTraceServiceRequest`` per
+  line, the OpenTelemetry file exporter format, for any OTLP tooling
+
+File exporters write from a background thread; ``Tracer.close()`` on
+shutdown writes out what is still queued.
+
+The active span lives in a context variable, so spans opened in parallel
+branches nest under the right parent. ``span()`` returns a shared no-op
+span when the current run isn't traced, so unsampled runs pay for one
+context variable lookup per call site.
+"""
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = "workflow-engine"
+
+
+class _NoopSpan:
+    """Stands in for a span when nothing is being traced."""
+    recording = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, key: str, value: Any):
+        pass
+
+    def mark_started(self):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+class _Trace:
+    def __init__(self, tracer: "Tracer", run_id: str, max_spans: int):
+        self.tracer = tracer
+        self.run_id = run_id
+        self.trace_id = os.urandom(16).hex()
+        self.spans: List["Span"] = []
+        self.max_spans = max_spans
+        self.dropped = 0
+
+
+class Span:
+    """A timed operation in a run's trace. Times are time.time_ns()."""
+    recording = True
+    __slots__ = ("trace", "name", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "_token")
+
+    def __init__(self, trace: _Trace, name: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.trace = trace
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes
+        self._token = None
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end_ns = time.time_ns()
+        if exc_type is not None:
+            self.attributes["error"] = f"{exc_type.__name__}: {exc}" if str(exc) else exc_type.__name__
+        _current_span.reset(self._token)
+        if self.parent_id is None:
+            if self.trace.dropped:
+                self.attributes["dropped_spans"] = self.trace.dropped
+            self.trace.tracer._export(self.trace)
+        return False
+
+    def set(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def mark_started(self):
+        """Records how long the span waited before its work started (e.g. for an executor thread)."""
+        self.attributes["queue_ms"] = (time.time_ns() - self.start_ns) / 1e6
+
+    @property
+    def duration_ms(self) -> Optional[float]:
+        return None if self.end_ns is None else (self.end_ns - self.start_ns) / 1e6
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "run_id": self.trace.run_id,
+            "name": self.name,
+            "start_time_ns": self.start_ns,
+            "end_time_ns": self.end_ns,
+            "duration_ms": self.duration_ms,
+            "attributes": dict(self.attributes),
+        }
+
+
+def span(name: str, **attributes: Any):
+    """A child span of the current span, or NOOP_SPAN if the current run isn't traced. Use as a context manager."""
+    parent = _current_span.get()
+    if parent is None:
+        return NOOP_SPAN
+    trace = parent.trace
+    if len(trace.spans) >= trace.max_spans:
+        trace.dropped += 1
+        return NOOP_SPAN
+    child = Span(trace, name, parent.span_id, attributes)
+    trace.spans.append(child)
+    return child
+
+
+def span_tree(spans: Sequence[Span]) -> Optional[Dict[str, Any]]:
+    """Nests spans under their parents. Returns the root, or None if there is none."""
+    nodes = {}
+    for item in spans:
+        node = item.to_dict()
+        node["children"] = []
+        nodes[item.span_id] = node
+    root = None
+    for item in spans:
+        node = nodes[item.span_id]
+        parent = nodes.get(item.parent_id) if item.parent_id else None
+        if parent is not None:
+            parent["children"].append(node)
+        elif root is None:
+            root = node
+    return root
+
+
+class SpanExporter(ABC):
+    """Receives the spans of each finished trace, root first."""
+
+    @abstractmethod
+    def export(self, run_id: str, spans: List[Span]): pass
+
+    def flush(self, timeout: Optional[float] = None):
+        """Waits until exported traces are written out."""
+
+    def close(self):
+        """Writes out pending traces and releases resources."""
+
+
+class MemoryExporter(SpanExporter):
+    """Keeps the most recent traces, one per run."""
+
+    def __init__(self, max_traces: int = 100):
+        self.max_traces = max_traces
+        self._traces: "OrderedDict[str, List[Span]]" = OrderedDict()
+
+    def export(self, run_id: str, spans: List[Span]):
+        self._traces[run_id] = spans
+        self._traces.move_to_end(run_id)
+        while len(self._traces) > self.max_traces:
+            self._traces.popitem(last=False)
+
+    def get(self, run_id: str) -> Optional[List[Span]]:
+        return self._traces.get(run_id)
+
+
+class _FileExporter(SpanExporter):
+    """
+    Appends formatted traces to a file from a background thread, so neither
+    formatting nor disk latency stalls the event loop. Traces arriving while
+    max_pending are waiting are dropped (counted in dropped).
+    """
+
+    def __init__(self, path: str, max_pending: int = 1000):
+        self.path = path
+        self.max_pending = max_pending
+        self.dropped = 0
+        # (run_id, spans), or None to stop the writer
+        self._queue: "queue.Queue[Optional[Tuple[str, List[Span]]]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def export(self, run_id: str, spans: List[Span]):
+        if self._queue.qsize() >= self.max_pending:
+            self.dropped += 1
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._write_loop, name=f"trace-writer-{os.path.basename(self.path)}", daemon=True)
+                self._thread.start()
+        # Copy: straggling tasks of the run may still add spans
+        self._queue.put((run_id, list(spans)))
+
+    def _format(self, run_id: str, spans: List[Span]) -> List[str]:
+        raise NotImplementedError
+
+    def _write_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            lines = []
+            for item in batch:
+                if item is None:
+                    continue
+                try:
+                    lines.extend(self._format(*item))
+                except Exception:
+                    logger.exception(f"Could not format the trace of run {item[0]}")
+            if lines:
+                try:
+                    with open(self.path, "a", encoding="utf-8") as f:
+                        f.write("".join(line + "\n" for line in lines))
+                except OSError:
+                    logger.exception(f"Could not write traces to {self.path}")
+            for _ in batch:
+                self._queue.task_done()
+            if None in batch:
+                return
+
+    def flush(self, timeout: Optional[float] = None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        # Queue.join() has no timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return
+            time.sleep(0.005)
+
+    def close(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+
+
+class JsonlExporter(_FileExporter):
+    """Appends one JSON line per span."""
+
+    def _format(self, run_id: str, spans: List[Span]) -> List[str]:
+        return [json.dumps(item.to_dict(), default=str) for item in spans]
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class OtlpJsonExporter(_FileExporter):
+    """Appends one OTLP/JSON ExportTraceServiceRequest per trace."""
+
+    def _format(self, run_id: str, spans: List[Span]) -> List[str]:
+        otlp_spans = []
+        for item in spans:
+            otlp_span = {
+                "traceId": item.trace.trace_id,
+                "spanId": item.span_id,
+                "name": item.name,
+                "kind": 1, # SPAN_KIND_INTERNAL
+                "startTimeUnixNano": str(item.start_ns),
+                "endTimeUnixNano": str(item.end_ns),
+                "attributes": [
+                    {"key": key, "value": _otlp_value(value)}
+                    for key, value in {"run_id": run_id, **item.attributes}.items()
+                ],
+            }
+            if item.parent_id:
+                otlp_span["parentSpanId"] = item.parent_id
+            if "error" in item.attributes:
+                otlp_span["status"] = {"code": 2, "message": str(item.attributes["error"])}
+            otlp_spans.append(otlp_span)
+        request = {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{"scope": {"name": "app.core.tracing"}, "spans": otlp_spans}],
+        }]}
+        return [json.dumps(request)]
+
+
+class Tracer:
+    """Decides which runs are traced and exports their traces when they finish."""
+
+    def __init__(self, sample_rate: float = 0.0, exporters: Sequence[SpanExporter] = (), max_spans: int = 10000):
+        self.memory = MemoryExporter()
+        self.configure(sample_rate, exporters, max_spans)
+
+    def configure(
+        self,
+        sample_rate: Optional[float] = None,
+        exporters: Optional[Sequence[SpanExporter]] = None,
+        max_spans: Optional[int] = None,
+        buffer_size: Optional[int] = None,
+    ):
+        """Updates settings; the in-memory exporter is always kept, in addition to exporters."""
+        if sample_rate is not None:
+            self.sample_rate = sample_rate
+        if exporters is not None:
+            for exporter in getattr(self, "exporters", ()):
+                if exporter not in exporters:
+                    exporter.close()
+            self.exporters = list(exporters)
+        if max_spans is not None:
+            self.max_spans = max_spans
+        if buffer_size is not None:
+            self.memory.max_traces = buffer_size
+
+    def start_run(self, run_id: str, **attributes: Any):
+        """The root span of a new trace for run_id, or NOOP_SPAN if the run isn't sampled."""
+        if self.sample_rate <= 0 or (self.sample_rate < 1 and random.random() >= self.sample_rate):
+            return NOOP_SPAN
+        trace = _Trace(self, run_id, self.max_spans)
+        root = Span(trace, "run", None, {"run_id": run_id, **attributes})
+        trace.spans.append(root)
+        return root
+
+    def get_trace(self, run_id: str) -> Optional[Dict[str, Any]]:
+        """The span tree of the run's most recent trace still in memory."""
+        spans = self.memory.get(run_id)
+        return span_tree(spans) if spans else None
+
+    def flush(self, timeout: Optional[float] = None):
+        """Waits until the exporters have written out finished traces."""
+        for exporter in self.exporters:
+            exporter.flush(timeout)
+
+    def close(self):
+        """Writes out pending traces; called on shutdown."""
+        for exporter in self.exporters:
+            try:
+                exporter.close()
+            except Exception:
+                logger.exception(f"Trace exporter {type(exporter).__name__} failed to close")
+
+    def _export(self, trace: _Trace):
+        for exporter in [self.memory] + self.exporters:
+            try:
+                exporter.export(trace.run_id, trace.spans)
+            except Exception:
+                logger.exception(f"Trace exporter {type(exporter).__name__} failed")
+
+
+# Global instance
+tracer = Tracer()
@@ -1,30 +1,157 @@
 """WebSocket connection manager for streaming workflow execution logs."""
-from typing import Dict, List
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from collections import OrderedDict, deque
 from fastapi import WebSocket
 import asyncio
 import json
 import logging
+import os
+import time
+
+from app.core.metrics import WS_BROADCAST
 
 logger = logging.getLogger(__name__)
 
+TERMINAL_STATUSES = ("completed", "failed", "cancelled")
+
+
+class RunEventBuffer:
+    """Bounded ring of the most recent events for one run, numbered from 1."""
+
+    def __init__(self, maxlen: int, from_start: bool = True):
+        # Entries are [seq, message dict, JSON text]
+        self.events: Deque[List[Any]] = deque()
+        self.maxlen = maxlen
+        self.next_seq = 1
+        # False if the run may have had events before this buffer was created
+        # (it was evicted, or a client connected first)
+        self.from_start = from_start
+        self.bytes = 0 # Size of the buffered JSON texts
+        self.finished_at: Optional[float] = None
+        # Serializes broadcasts and subscriptions for this run so replayed and
+        # live events reach a new client in order
+        self.lock = asyncio.Lock()
+
+    def append(self, message: dict) -> Tuple[List[Any], int]:
+        """Buffers message. Returns its entry and the change in buffered bytes."""
+        message = {**message, "seq": self.next_seq}
+        entry = [self.next_seq, message, json.dumps(message)]
+        self.next_seq += 1
+        self.events.append(entry)
+        added = len(entry[2])
+        while len(self.events) > self.maxlen:
+            added -= len(self.events.popleft()[2])
+        self.bytes += added
+        return entry, added
+
+    def drop_oldest(self) -> int:
+        """Drops the oldest event. Returns its size."""
+        size = len(self.events.popleft()[2])
+        self.bytes -= size
+        return size
+
+    def since(self, last_seq: int):
+        """Returns (entries after last_seq, whether none of them were dropped)."""
+        entries = [e for e in self.events if e[0] > last_seq]
+        oldest = self.events[0][0] if self.events else self.next_seq
+        return entries, self.from_start and oldest <= last_seq + 1
+
 
 class ConnectionManager:
     """Manages WebSocket connections for workflow execution streaming."""
-    
-    def __init__(self):
+
+    def __init__(
+        self,
+        buffer_size: int = 256,
+        max_buffered_runs: int = 1000,
+        retention_seconds: float = 300.0,
+        tail_size: int = 16,
+        max_buffered_bytes: int = 64 * 1024 * 1024,
+    ):
         # Maps run_id to list of active WebSocket connections
         self.active_connections: Dict[str, List[WebSocket]] = {}
         self._lock = asyncio.Lock()
-    
-    async def connect(self, websocket: WebSocket, run_id: str):
-        """Accept a new WebSocket connection for a specific run."""
-        await websocket.accept()
-        async with self._lock:
+        # Recent events per run, so clients that connect late can catch up.
+        # Runs nobody watches keep a short tail; a subscriber raises the limit
+        # to buffer_size. All buffers together hold at most max_buffered_bytes.
+        self.buffer_size = buffer_size
+        self.tail_size = min(tail_size, buffer_size)
+        self.max_buffered_runs = max_buffered_runs
+        self.max_buffered_bytes = max_buffered_bytes
+        self.retention_seconds = retention_seconds
+        # Least recently active first
+        self.buffers: "OrderedDict[str, RunEventBuffer]" = OrderedDict()
+        self.buffered_bytes = 0
+        # (finished_at, run_id) in the order runs finished, for expiry
+        self._finished: Deque[Tuple[float, str]] = deque()
+
+    def _buffer(self, run_id: str) -> RunEventBuffer:
+        buffer = self.buffers.get(run_id)
+        if buffer is None:
+            maxlen = self.buffer_size if run_id in self.active_connections else self.tail_size
+            buffer = RunEventBuffer(maxlen, from_start=False)
+            self.buffers[run_id] = buffer
+            self._evict()
+        else:
+            self.buffers.move_to_end(run_id)
+        return buffer
+
+    def _evict(self):
+        """
+        Drops buffers of runs finished longer than retention_seconds ago, then
+        the least recently active buffers of unwatched runs while over the run
+        or byte limits. If only watched runs are left, their oldest events go.
+        """
+        now = time.monotonic()
+        while self._finished and now - self._finished[0][0] > self.retention_seconds:
+            finished_at, run_id = self._finished.popleft()
+            buffer = self.buffers.get(run_id)
+            if buffer is not None and buffer.finished_at == finished_at:
+                self._drop(run_id)
+
+        # Watched buffers are moved to the back, each at most once
+        skips = len(self.buffers)
+        while self.buffers and (
+            len(self.buffers) > self.max_buffered_runs or self.buffered_bytes > self.max_buffered_bytes
+        ):
+            run_id, buffer = next(iter(self.buffers.items()))
             if run_id not in self.active_connections:
-                self.active_connections[run_id] = []
-            self.active_connections[run_id].append(websocket)
-        logger.info(f"WebSocket client connected for run_id: {run_id}")
-    
+                self._drop(run_id)
+            elif skips > 0:
+                skips -= 1
+                self.buffers.move_to_end(run_id)
+            elif buffer.events and self.buffered_bytes > self.max_buffered_bytes:
+                self.buffered_bytes -= buffer.drop_oldest()
+            else:
+                break
+
+    def _drop(self, run_id: str):
+        self.buffered_bytes -= self.buffers.pop(run_id).bytes
+
+    async def connect(self, websocket: WebSocket, run_id: str, last_seq: int = 0) -> bool:
+        """
+        Accept a new WebSocket connection for a specific run and replay buffered
+        events with seq > last_seq. Returns False, without replaying anything,
+        if some of those events are no longer buffered, so the caller can fall
+        back to storage. The caller checks that the run exists first.
+        """
+        await websocket.accept()
+        buffer = self._buffer(run_id)
+        async with buffer.lock:
+            async with self._lock:
+                if run_id not in self.active_connections:
+                    self.active_connections[run_id] = []
+                self.active_connections[run_id].append(websocket)
+            # Watched from now on: keep its events for late and reconnecting clients
+            buffer.maxlen = self.buffer_size
+            entries, complete = buffer.since(last_seq)
+            if not complete:
+                entries = []
+            for entry in entries:
+                await websocket.send_text(entry[2])
+        logger.info(f"WebSocket client connected for run_id: {run_id} (replayed {len(entries)} events)")
+        return complete
+
     async def disconnect(self, websocket: WebSocket, run_id: str):
         """Remove a WebSocket connection."""
         async with self._lock:
@@ -35,28 +162,47 @@ class ConnectionManager:
                 if not self.active_connections[run_id]:
                     del self.active_connections[run_id]
         logger.info(f"WebSocket client disconnected for run_id: {run_id}")
-    
+
     async def broadcast_log(self, run_id: str, log_data: dict):
-        """Broadcast a log message to all connected clients for a run."""
-        if run_id not in self.active_connections:
-            return
-        
-        # Create a copy of connections to avoid modification during iteration
-        async with self._lock:
-            connections = self.active_connections.get(run_id, []).copy()
-        
-        # Prepare message
-        message = json.dumps(log_data)
-        
-        # Send to all connected clients
-        disconnected = []
-        for connection in connections:
-            try:
-                await connection.send_text(message)
-            except Exception as e:
-                logger.error(f"Error sending to WebSocket: {e}")
-                disconnected.append(connection)
-        
+        """Buffer an event for a run and send it to all connected clients."""
+        started = time.perf_counter()
+        try:
+            await self._broadcast(run_id, log_data)
+        finally:
+            WS_BROADCAST.observe(time.perf_counter() - started)
+
+    async def _broadcast(self, run_id: str, log_data: dict):
+        buffer = self._buffer(run_id)
+        async with buffer.lock:
+            if buffer.next_seq == 1 and log_data.get("type") == "status" and log_data.get("status") == "running":
+                # Every execution opens with this event, so nothing came before it
+                buffer.from_start = True
+            entry, added = buffer.append(log_data)
+            self.buffered_bytes += added
+            if self.buffered_bytes > self.max_buffered_bytes:
+                self._evict()
+            if log_data.get("type") == "status" and log_data.get("status") in TERMINAL_STATUSES:
+                buffer.finished_at = time.monotonic()
+                self._finished.append((buffer.finished_at, run_id))
+
+            if run_id not in self.active_connections:
+                return
+
+            # Create a copy of connections to avoid modification during iteration
+            async with self._lock:
+                connections = self.active_connections.get(run_id, []).copy()
+
+            message = entry[2]
+
+            # Send to all connected clients
+            disconnected = []
+            for connection in connections:
+                try:
+                    await connection.send_text(message)
+                except Exception as e:
+                    logger.error(f"Error sending to WebSocket: {e}")
+                    disconnected.append(connection)
+
         # Clean up disconnected clients
         if disconnected:
             async with self._lock:
@@ -66,7 +212,7 @@ class ConnectionManager:
                             self.active_connections[run_id].remove(conn)
                     if not self.active_connections[run_id]:
                         del self.active_connections[run_id]
-    
+
     async def broadcast_status(self, run_id: str, status: str, message: str = None):
         """Broadcast workflow status update."""
         status_data = {
@@ -76,7 +222,7 @@ class ConnectionManager:
             "message": message
         }
         await self.broadcast_log(run_id, status_data)
-    
+
     async def get_connection_count(self, run_id: str) -> int:
         """Get number of active connections for a run."""
         async with self._lock:
@@ -84,4 +230,9 @@ class ConnectionManager:
 
 
 # Global instance
-manager = ConnectionManager()
+manager = ConnectionManager(
+    buffer_size=int(os.getenv("WS_BUFFER_SIZE", "256")),
+    max_buffered_runs=int(os.getenv("WS_BUFFERED_RUNS", "1000")),
+    tail_size=int(os.getenv("WS_TAIL_SIZE", "16")),
+    max_buffered_bytes=int(os.getenv("WS_BUFFER_BYTES", str(64 * 1024 * 1024))),
+)
@@ -1,7 +1,7 @@
 from typing import Dict, Any
 from app.core.registry import ToolRegistry
 
-@ToolRegistry.register()
+@ToolRegistry.register(pure=True, inputs=["code"])
 def extract_functions(state: Dict[str, Any]) -> Dict[str, Any]:
     """Simulates extracting functions from code."""
     code = state.get("code", "")
@@ -9,7 +9,7 @@ def extract_functions(state: Dict[str, Any]) -> Dict[str, Any]:
     function_count = len(code.split("def ")) - 1
     return {"function_count": max(function_count, 1), "functions": ["func1", "func2"]}
 
-@ToolRegistry.register()
+@ToolRegistry.register(pure=True, inputs=["code"])
 def check_complexity(state: Dict[str, Any]) -> Dict[str, Any]:
     """Calculates complexity score."""
     # Mock complexity based on length
@@ -17,6 +17,17 @@ def check_complexity(state: Dict[str, Any]) -> Dict[str, Any]:
     complexity = code_len / 100
     return {"complexity_score": complexity}
 
+@ToolRegistry.register(execution="process", inputs=["code"], pure=True)
+def analyze_token_complexity(state: Dict[str, Any], rounds: int = 200) -> Dict[str, Any]:
+    """CPU-heavy complexity analysis over the code's tokens (runs in a worker process)."""
+    tokens = state.get("code", "").split()
+    # Deterministic, pure-Python busy work standing in for a real analyzer
+    score = 0
+    for r in range(rounds):
+        for i, token in enumerate(tokens):
+            score = (score * 31 + len(token) * (i + r + 1)) % 1000003
+    return {"token_complexity": score % 100}
+
 @ToolRegistry.register()
 def detect_issues(state: Dict[str, Any]) -> Dict[str, Any]:
     """Detects code smells and quality issues deterministically."""
@@ -1,6 +1,16 @@
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from app.api.routes import router as graph_router
 from app.core.registry import registry
+from app.core.executors import executor_pools, process_pool
+from app.core.cache import result_cache
+from app.core.tracing import tracer, JsonlExporter, OtlpJsonExporter
+from app.core.profiling import profile_store
+from app.core import metrics
+from app.core.websocket_manager import manager as ws_manager
+from app.core.storage import InMemoryStorage
+import importlib
+import os
 # Import examples to ensure tools are registered
 import app.examples.code_review 
 
@@ -12,14 +22,101 @@ app.include_router(graph_router, prefix="/graph", tags=["Graph"])
 def read_root():
     return {"message": "Welcome to the Workflow Engine. Use /docs for API documentation."}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def read_metrics():
+    """Engine, storage, scheduler, executor and WebSocket metrics in Prometheus text format."""
+    return PlainTextResponse(metrics.metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+def _executor_stat(key: str):
+    def read():
+        stats = executor_pools.stats()
+        stats["process"] = process_pool.stats()
+        return {(pool,): pool_stats[key] for pool, pool_stats in stats.items()}
+    return read
+
+# Gauges are read when /metrics is scraped
+metrics.EXECUTOR_QUEUED.set_function(_executor_stat("queued"))
+metrics.EXECUTOR_ACTIVE.set_function(_executor_stat("active"))
+metrics.WS_CONNECTIONS.set_function(
+    lambda: {(): sum(len(connections) for connections in ws_manager.active_connections.values())}
+)
+
+def configure_from_env():
+    """Tool modules, executors, result cache, tracing and profiling; shared by the API and worker processes."""
+    # Modules registering more tools, e.g. TOOL_MODULES="myapp.tools,myapp.ml_tools"
+    for module in os.getenv("TOOL_MODULES", "").split(","):
+        if module.strip():
+            importlib.import_module(module.strip())
+    # Named thread pools for sync tools, e.g. EXECUTOR_POOLS="io:32,cpu:4"
+    executor_pools.configure_from_spec(os.getenv("EXECUTOR_POOLS", ""))
+    # Worker processes for execution="process" tools (started lazily on first use)
+    process_pool.configure(
+        int(os.getenv("PROCESS_POOL_SIZE", "0")) or None,
+        os.getenv("PROCESS_START_METHOD") or None,
+    )
+    # Results of pure tools: in-memory LRU, plus a disk tier if RESULT_CACHE_DIR is set
+    result_cache.configure(
+        max_bytes=int(os.getenv("RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+        ttl=float(os.getenv("RESULT_CACHE_TTL", "0")),
+        directory=os.getenv("RESULT_CACHE_DIR") or None,
+        disk_max_bytes=int(os.getenv("RESULT_CACHE_DISK_MAX_BYTES", str(1024 * 1024 * 1024))),
+    )
+    # Tracing: fraction of runs traced, plus optional file exporters
+    exporters = []
+    if os.getenv("TRACE_JSONL_PATH"):
+        exporters.append(JsonlExporter(os.environ["TRACE_JSONL_PATH"]))
+    if os.getenv("TRACE_OTLP_PATH"):
+        exporters.append(OtlpJsonExporter(os.environ["TRACE_OTLP_PATH"]))
+    tracer.configure(
+        sample_rate=float(os.getenv("TRACE_SAMPLE_RATE", "0")),
+        exporters=exporters,
+        buffer_size=int(os.getenv("TRACE_BUFFER_SIZE", "100")),
+    )
+    # Artifacts of runs started with profile=true
+    profile_store.configure(
+        os.getenv("PROFILE_DIR") or None,
+        max_runs=int(os.getenv("PROFILE_MAX_RUNS", "100")),
+    )
+
 @app.on_event("startup")
 async def startup_event():
     """Initialize resources on startup."""
-    from app.api.routes import get_storage
+    configure_from_env()
+    from app.api.routes import get_storage, get_engine
+    engine = get_engine()
+    # The engine outlives the app; reopen it if an earlier shutdown closed it
+    engine.scheduler.open()
+    metrics.RUNS_ACTIVE.set_function(lambda: {(): engine.scheduler.active_count})
+    metrics.RUNS_QUEUED.set_function(lambda: {(): engine.scheduler.queue_depth})
     storage = get_storage()
     # Check if it has init_db method (Duck typing or specific check)
     if hasattr(storage, "init_db"):
         await storage.init_db()
+    if engine.run_queue is not None:
+        # Worker processes execute the runs and take over runs of crashed
+        # workers when their leases expire; nothing to recover here
+        if isinstance(storage, InMemoryStorage):
+            raise RuntimeError("EXECUTION_MODE=queue needs storage shared with the workers (STORAGE_TYPE=sqlite).")
+        return
+    # Resume runs a previous process left pending or running
+    recovery = os.getenv("RUN_RECOVERY", "at_least_once").lower()
+    if recovery != "off":
+        await engine.recover_runs(recovery)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Let in-flight runs finish before the process exits."""
+    from app.api.routes import get_engine
+    engine = get_engine()
+    await engine.scheduler.shutdown()
+    # Write out anything still queued in the write-behind queue
+    await engine.persistence.close()
+    if engine.run_queue is not None:
+        engine.run_queue.close()
+    # Write out traces still queued for the file exporters
+    tracer.close()
+    executor_pools.shutdown(wait=False)
+    process_pool.shutdown(wait=False)
 
 @app.get("/tools")
 def list_tools():
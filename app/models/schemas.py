@@ -1,5 +1,5 @@
-from typing import Dict, List, Any, Optional
-from pydantic import BaseModel, Field
+from typing import Dict, List, Any, Optional, Literal
+from pydantic import BaseModel, Field, model_validator
 from datetime import datetime, timezone
 
 class EdgeDefinition(BaseModel):
@@ -9,25 +9,58 @@ class EdgeDefinition(BaseModel):
 
 class NodeDefinition(BaseModel):
     id: str
-    tool: str = Field(..., description="Name of the registered tool function to execute.")
+    tool: Optional[str] = Field(None, description="Name of the registered tool function to execute. Required unless subgraph is set.")
     params: Dict[str, Any] = Field(default_factory=dict, description="Static parameters to pass to the tool.")
+    subgraph: Optional[str] = Field(None, description="graph_id of an existing graph to run inline as this node, instead of a tool.")
+    input_map: Dict[str, str] = Field(default_factory=dict, description="Subgraph inputs as {subgraph key: parent key}. Empty passes a copy of the whole state.")
+    output_map: Dict[str, str] = Field(default_factory=dict, description="Subgraph outputs as {subgraph key: parent key}. Empty merges the subgraph's whole final state.")
+    fan_out: bool = Field(False, description="Follow every matching outgoing edge concurrently instead of only the first.")
+    join: bool = Field(False, description="Fan-in point: parallel branches stop here and their changes are merged before this node runs.")
+    merge_policy: Literal["error", "first_wins", "last_wins", "collect"] = Field("error", description="How a join node resolves keys written with different values by several branches.")
+    checkpoint: bool = Field(False, description="Always persist run state after this node, whatever the graph's checkpoint policy.")
+    fast_loop: bool = Field(False, description="Run the cycle this node heads in memory, logging one aggregated step when the path leaves it.")
+    timeout_ms: Optional[int] = Field(None, ge=1, description="Fail the run if the tool takes longer than this. Sync tools are signalled through their cancel_token.")
+    executor: Optional[str] = Field(None, description="Named thread pool for this node's sync tool, overriding the tool's registration.")
+    execution: Optional[Literal["thread", "process"]] = Field(None, description="Run this node's sync tool on a thread or in a worker process, overriding the tool's registration.")
+    map_over: Optional[str] = Field(None, description="State key holding a list: the tool runs once per item instead of once per visit.")
+    map_item_key: str = Field("item", description="Key under which each item is added to the state the tool receives.")
+    map_output: Optional[str] = Field(None, description="State key for the list of per-item results, in item order. Defaults to '<map_over>_results'; errors go to '<map_output>_errors'.")
+    map_concurrency: int = Field(8, ge=1, description="Maximum number of items processed at once.")
+
+    @model_validator(mode="after")
+    def _tool_or_subgraph(self):
+        if (self.tool is None) == (self.subgraph is None):
+            raise ValueError(f"Node '{self.id}' needs exactly one of 'tool' or 'subgraph'.")
+        if self.subgraph is not None and (self.map_over is not None or self.execution is not None or self.executor is not None):
+            raise ValueError(f"Node '{self.id}': map_over, executor and execution apply to tool nodes only.")
+        return self
 
 class GraphDefinition(BaseModel):
     nodes: List[NodeDefinition]
     edges: List[EdgeDefinition]
     start_node: str
     max_loops: int = Field(100, description="Safety limit for loops")
+    priority: int = Field(0, description="Scheduling priority for this graph's runs. Higher values start first when runs are queued.")
+    log_mode: Literal["full", "delta"] = Field("full", description="'full' logs input/output state on every step; 'delta' logs only changed and removed keys plus periodic full snapshots.")
+    log_snapshot_every: int = Field(10, ge=1, description="In delta log mode, record a full snapshot every N steps.")
+    checkpoint_policy: Literal["every_step", "every_n_steps", "interval", "terminal", "flagged"] = Field("every_step", description="When in-flight run state is persisted: after every step, every checkpoint_every steps, at most every checkpoint_interval_ms, only when the run ends, or only after nodes with checkpoint=true.")
+    checkpoint_every: int = Field(10, ge=1, description="With checkpoint_policy 'every_n_steps', persist after every N steps.")
+    checkpoint_interval_ms: int = Field(1000, ge=0, description="With checkpoint_policy 'interval', persist at most this often.")
 
 class WorkflowState(BaseModel):
     run_id: str
     graph_id: str
-    status: str = "pending" # pending, running, completed, failed
+    status: str = "pending" # pending (queued), running, completed, failed, cancelled
     current_node: Optional[str] = None
     state: Dict[str, Any] = {}
     message: Optional[str] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+class BatchRunRequest(BaseModel):
+    graph_id: str
+    initial_states: List[Dict[str, Any]] = Field(..., min_length=1, description="One run is started per initial state, in order.")
+
 class WorkflowStateWithLogs(WorkflowState):
     """Extended workflow state that includes execution logs."""
     logs: List['ExecutionStep'] = Field(default_factory=list)
@@ -35,7 +68,12 @@ class WorkflowStateWithLogs(WorkflowState):
 class ExecutionStep(BaseModel):
     run_id: str
     node_id: str
-    input_state: Dict[str, Any]
-    output_state: Dict[str, Any]
+    input_state: Optional[Dict[str, Any]] = Field(None, description="Full state before the step. Omitted for delta-mode steps between snapshots.")
+    output_state: Optional[Dict[str, Any]] = Field(None, description="Full state after the step. Omitted for delta-mode steps between snapshots.")
+    delta: Optional[Dict[str, Any]] = Field(None, description="Keys set by the step (delta log mode).")
+    removed_keys: Optional[List[str]] = Field(None, description="Keys removed by the step (delta log mode).")
+    step_index: Optional[int] = None
+    cached: Optional[bool] = Field(None, description="True when a pure tool's result came from the result cache.")
+    loop: Optional[Dict[str, Any]] = Field(None, description="For a fast_loop cycle: iterations, exit_node and per-node calls/total_ms/mean_ms.")
     timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     duration_ms: float = 0.0
@@ -0,0 +1,254 @@
+"""Worker processes: execute runs from the shared run queue.
+
+API front-ends started with ``EXECUTION_MODE=queue`` store runs and queue
+them; workers claim them, execute them with the regular engine and keep
+their leases alive (see app.core.run_queue). Both sides must use the same
+SQLite storage and run queue files:
+
+    export STORAGE_TYPE=sqlite EXECUTION_MODE=queue
+    uvicorn app.main:app --workers 2
+    python -m app.worker --processes 4
+
+Each worker process runs its own event loop, so engine throughput grows
+with the number of processes up to the host's cores. Workers import
+app.main, so they know the same tools as the API. A worker stopped with
+SIGTERM or SIGINT stops claiming, lets its runs finish for up to
+--drain-timeout seconds and hands the rest back to the queue. A worker that
+crashes stops heartbeating; once its leases expire another worker resumes
+its runs after their last logged step.
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import uuid
+from typing import Dict, Optional, Set
+
+from app.core.engine import RECOVERY_MODES, TERMINAL_STATUSES, WorkflowEngine
+from app.core.run_queue import QueuedRun, RunQueue
+
+logger = logging.getLogger(__name__)
+
+
+class RunWorker:
+    """Claims runs from a RunQueue and executes them on a local engine, keeping their leases alive."""
+
+    def __init__(
+        self,
+        engine: WorkflowEngine,
+        queue: RunQueue,
+        worker_id: Optional[str] = None,
+        concurrency: Optional[int] = None,
+        max_attempts: int = 3,
+        recovery_mode: str = "at_least_once",
+    ):
+        if engine.run_queue is not None:
+            raise ValueError("A worker's engine must execute runs itself (run_queue=None).")
+        self.engine = engine
+        self.queue = queue
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        # Runs held at once; the engine's scheduler must allow as many
+        self.concurrency = concurrency or engine.scheduler.max_concurrent_runs
+        # A run claimed more often than this (its workers kept dying) is failed
+        self.max_attempts = max_attempts
+        self.recovery_mode = recovery_mode
+        self.heartbeat_interval = queue.lease_seconds / 3
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._cancels: Set[asyncio.Task] = set()
+        self._stopping = False
+        self._wake = asyncio.Event()
+
+        # Stats
+        self.claimed = 0
+        self.completed = 0
+        self.lost = 0
+
+    def stop(self):
+        """Stops claiming runs; run() then drains and returns."""
+        self._stopping = True
+        self._wake.set()
+
+    async def run(self, drain_timeout: float = 30.0):
+        """
+        Claims and executes runs until stop() is called, then waits up to
+        drain_timeout for the runs in flight and releases the rest to the queue.
+        """
+        heartbeat = asyncio.create_task(self._heartbeat_loop())
+        try:
+            await self._claim_loop()
+            if self._tasks:
+                await asyncio.wait(list(self._tasks.values()), timeout=drain_timeout)
+        finally:
+            await self._release_all()
+            heartbeat.cancel()
+
+    async def _claim_loop(self):
+        while not self._stopping:
+            free = self.concurrency - len(self._tasks)
+            claimed = await self.queue.claim(self.worker_id, free) if free > 0 else []
+            for queued in claimed:
+                self.claimed += 1
+                self._tasks[queued.run_id] = asyncio.create_task(self._execute(queued), name=f"claim-{queued.run_id}")
+            if free == 0 or len(claimed) < free:
+                # No free slot, or the queue is drained: wait for a finished run, the next poll or stop()
+                self._wake.clear()
+                if not self._stopping:
+                    try:
+                        await asyncio.wait_for(self._wake.wait(), self.queue.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+
+    async def _execute(self, queued: QueuedRun):
+        run_id = queued.run_id
+        try:
+            run = await self.engine.storage.get_run(run_id)
+            if run is None or run.status in TERMINAL_STATUSES:
+                # Deleted, or finished by a worker that died before completing it
+                pass
+            elif queued.cancel_requested:
+                await self.engine.cancel_run(run_id)
+            elif queued.attempts > self.max_attempts:
+                await self.engine.fail_run(run_id, f"Abandoned by {queued.attempts - 1} workers")
+            elif await self.engine.submit_stored_run(
+                run,
+                self.recovery_mode,
+                persist_intermediate=queued.options.get("persist_intermediate", True),
+                profile=queued.options.get("profile", False),
+            ):
+                if await self.engine.wait_for_run(run_id) is None:
+                    return # Abandoned: another worker holds the lease now, or it was released
+            if await self.queue.complete(self.worker_id, run_id):
+                self.completed += 1
+        except Exception:
+            logger.exception(f"Worker {self.worker_id} could not execute run {run_id}")
+            # Let another attempt take it; attempts are capped by max_attempts
+            await self.queue.release(self.worker_id, [run_id])
+        finally:
+            self._tasks.pop(run_id, None)
+            self._wake.set()
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            run_ids = list(self._tasks)
+            if not run_ids:
+                continue
+            try:
+                lost, cancelled = await self.queue.heartbeat(self.worker_id, run_ids)
+            except Exception:
+                logger.exception(f"Worker {self.worker_id} heartbeat failed")
+                continue
+            for run_id in lost:
+                # Stalled past the lease and another worker claimed the run
+                logger.warning(f"Worker {self.worker_id} lost its lease on run {run_id}; abandoning it")
+                self.lost += 1
+                self.engine.abandon_run(run_id)
+            for run_id in cancelled - lost:
+                task = asyncio.create_task(self.engine.cancel_run(run_id))
+                self._cancels.add(task)
+                task.add_done_callback(self._cancels.discard)
+
+    async def _release_all(self):
+        remaining = list(self._tasks)
+        if not remaining:
+            return
+        # Release before abandoning, so _execute doesn't complete them
+        released = await self.queue.release(self.worker_id, remaining)
+        for run_id in remaining:
+            self.engine.abandon_run(run_id)
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        logger.info(f"Worker {self.worker_id} released {released} unfinished runs")
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "worker_id": self.worker_id,
+            "active": len(self._tasks),
+            "concurrency": self.concurrency,
+            "claimed": self.claimed,
+            "completed": self.completed,
+            "lost": self.lost,
+        }
+
+
+async def serve(concurrency: Optional[int] = None, drain_timeout: float = 30.0):
+    """Runs one worker in this process until SIGTERM or SIGINT."""
+    from app.api.routes import create_engine, get_storage, open_run_queue
+    from app.core.executors import executor_pools, process_pool
+    from app.core.storage import InMemoryStorage
+    from app.core.tracing import tracer
+    from app.main import configure_from_env
+
+    configure_from_env()
+    storage = get_storage()
+    if isinstance(storage, InMemoryStorage):
+        raise SystemExit("Workers need storage shared with the API front-ends (STORAGE_TYPE=sqlite).")
+    await storage.init_db()
+    engine = create_engine()
+    queue = open_run_queue()
+    recovery = os.getenv("RUN_RECOVERY", "at_least_once").lower()
+    worker = RunWorker(
+        engine,
+        queue,
+        concurrency=concurrency,
+        max_attempts=int(os.getenv("RUN_MAX_ATTEMPTS", "3")),
+        recovery_mode=recovery if recovery in RECOVERY_MODES else "at_least_once",
+    )
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, worker.stop)
+
+    logger.info(f"Worker {worker.worker_id} started (concurrency {worker.concurrency})")
+    try:
+        await worker.run(drain_timeout)
+    finally:
+        await engine.persistence.close()
+        queue.close()
+        tracer.close()
+        executor_pools.shutdown(wait=False)
+        process_pool.shutdown(wait=False)
+    logger.info(f"Worker {worker.worker_id} stopped: {worker.stats()}")
+
+
+def _serve_process(concurrency: Optional[int], drain_timeout: float):
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(process)d %(levelname)s %(name)s: %(message)s")
+    asyncio.run(serve(concurrency, drain_timeout))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Execute runs from the shared run queue.")
+    parser.add_argument("--processes", type=int, default=1, help="Worker processes to start.")
+    parser.add_argument("--concurrency", type=int, help="Runs executed at once per process (default: MAX_CONCURRENT_RUNS, 64).")
+    parser.add_argument("--drain-timeout", type=float, default=30.0, help="Seconds to let runs finish on shutdown before releasing them.")
+    args = parser.parse_args(argv)
+    if args.concurrency:
+        # Read by the engine's scheduler in each process
+        os.environ["MAX_CONCURRENT_RUNS"] = str(args.concurrency)
+
+    if args.processes <= 1:
+        _serve_process(args.concurrency, args.drain_timeout)
+        return
+
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=_serve_process, args=(args.concurrency, args.drain_timeout), name=f"worker-{i}")
+        for i in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+
+    def forward(signum, frame):
+        for process in processes:
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, forward)
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()
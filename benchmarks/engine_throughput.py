@@ -0,0 +1,283 @@
+"""
+Benchmark: engine throughput on synthetic graphs, per storage backend.
+
+For each scenario (see benchmarks/graphs.py) and storage backend:
+
+- latency pass: LATENCY_RUNS runs executed one at a time. Step overhead is
+  the gap between the end of one logged step and the start of the next,
+  i.e. the engine's own time between tool calls (routing, logging,
+  persistence); tools are no-ops, so this is nearly all of a run's time.
+  Reported as p50/p95/p99 in milliseconds.
+- throughput pass: RUNS runs submitted at once and executed with up to
+  CONCURRENCY in flight. Reported as runs/sec and steps/sec.
+- peak RSS of the process while the scenario ran, sampled every 10 ms.
+
+Results can be written as JSON and compared against a stored baseline; a
+metric more than --tolerance worse than the baseline is a regression and
+makes the script exit with status 1.
+
+Usage:
+    python benchmarks/engine_throughput.py
+    python benchmarks/engine_throughput.py --json results.json
+    python benchmarks/engine_throughput.py --baseline baseline.json --tolerance 0.15
+    python benchmarks/engine_throughput.py --scenarios chain,loop --storage memory --runs 100
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.graphs import GENERATORS
+from app.core.engine import WorkflowEngine
+from app.core.persistence import DURABILITY_MODES, PersistenceQueue
+from app.core.scheduler import RunScheduler
+from app.core.storage import BaseStorage, InMemoryStorage, SQLiteStorage
+
+RUNS = 200
+LATENCY_RUNS = 20
+CONCURRENCY = 32
+SIZE = 20
+STORAGES = ["memory", "sqlite"]
+
+# Metrics compared against a baseline, and whether higher values are better
+COMPARED_METRICS = {
+    "runs_per_sec": True,
+    "steps_per_sec": True,
+    "overhead_p50_ms": False,
+    "overhead_p95_ms": False,
+    "overhead_p99_ms": False,
+    "peak_rss_mb": False,
+}
+
+
+def percentile(samples: List[float], q: float) -> float:
+    """Nearest-rank percentile of samples (0 <= q <= 100)."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(1, -(-len(ordered) * q // 100))
+    return ordered[int(rank) - 1]
+
+
+def _rss_mb() -> float:
+    """Current resident set size, or the process peak where /proc isn't available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        # ru_maxrss is in KiB on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+class RssSampler:
+    """Tracks peak RSS while a block runs, sampling from the event loop."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.peak_mb = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    async def _sample(self):
+        while True:
+            self.peak_mb = max(self.peak_mb, _rss_mb())
+            await asyncio.sleep(self.interval)
+
+    async def __aenter__(self):
+        self.peak_mb = _rss_mb()
+        self._task = asyncio.create_task(self._sample())
+        return self
+
+    async def __aexit__(self, *exc):
+        self._task.cancel()
+        self.peak_mb = max(self.peak_mb, _rss_mb())
+        return False
+
+
+async def make_storage(kind: str, directory: str) -> BaseStorage:
+    if kind == "memory":
+        return InMemoryStorage()
+    if kind == "sqlite":
+        storage = SQLiteStorage(f"sqlite+aiosqlite:///{os.path.join(directory, 'bench.db')}")
+        await storage.init_db()
+        return storage
+    raise ValueError(f"Unknown storage '{kind}' (expected one of {', '.join(STORAGES)}).")
+
+
+async def step_overheads(engine: WorkflowEngine, run_id: str) -> List[float]:
+    """Milliseconds between the end of each logged step and the start of the next."""
+    await engine.persistence.flush()
+    logs = sorted(await engine.storage.get_logs(run_id), key=lambda log: log.timestamp)
+    return [
+        max(0.0, (log.timestamp - previous.timestamp).total_seconds() * 1000 - log.duration_ms)
+        for previous, log in zip(logs, logs[1:])
+    ]
+
+
+async def measure(scenario: str, storage_kind: str, args: argparse.Namespace) -> Dict[str, Any]:
+    make_graph, make_state = GENERATORS[scenario]
+    with tempfile.TemporaryDirectory() as directory:
+        storage = await make_storage(storage_kind, directory)
+        engine = WorkflowEngine(
+            storage,
+            RunScheduler(max_concurrent_runs=args.concurrency, max_queue_size=max(args.runs, 10000)),
+            persistence=PersistenceQueue(storage, mode=args.durability),
+        )
+        graph_id = await engine.create_graph(make_graph(args.size))
+        initial_state = make_state(args.size)
+
+        async def run_one() -> str:
+            run_id = await engine.start_run(graph_id, dict(initial_state))
+            final = await engine.wait_for_run(run_id, timeout=60)
+            if final is None or final.status != "completed":
+                raise RuntimeError(f"{scenario}/{storage_kind} run did not complete: {final and final.message}")
+            return run_id
+
+        async with RssSampler() as rss:
+            await run_one()  # warm up: plan compilation, connection pool, persistence writer
+
+            overheads: List[float] = []
+            for _ in range(args.latency_runs):
+                overheads += await step_overheads(engine, await run_one())
+
+            started = time.perf_counter()
+            run_ids = await engine.start_runs(graph_id, [dict(initial_state) for _ in range(args.runs)])
+            finals = await asyncio.gather(*(engine.wait_for_run(run_id, timeout=300) for run_id in run_ids))
+            elapsed = time.perf_counter() - started
+            failed = [final for final in finals if final is None or final.status != "completed"]
+            if failed:
+                raise RuntimeError(f"{scenario}/{storage_kind}: {len(failed)} of {args.runs} runs did not complete")
+            await engine.persistence.flush()
+            steps = sum([len(await storage.get_logs(run_id)) for run_id in run_ids])
+
+        await engine.persistence.close()
+        if isinstance(storage, SQLiteStorage):
+            await storage.engine.dispose()
+
+    return {
+        "scenario": scenario,
+        "storage": storage_kind,
+        "runs": args.runs,
+        "steps": steps,
+        "elapsed_s": elapsed,
+        "runs_per_sec": args.runs / elapsed,
+        "steps_per_sec": steps / elapsed,
+        "overhead_p50_ms": percentile(overheads, 50),
+        "overhead_p95_ms": percentile(overheads, 95),
+        "overhead_p99_ms": percentile(overheads, 99),
+        "peak_rss_mb": rss.peak_mb,
+    }
+
+
+def compare(results: List[Dict[str, Any]], baseline: List[Dict[str, Any]], tolerance: float) -> List[Dict[str, Any]]:
+    """
+    Per scenario, storage and metric: baseline and current values, the
+    relative change, and whether it is worse than the baseline by more than
+    tolerance (a fraction, e.g. 0.1 for 10%). Entries missing from either
+    side are skipped.
+    """
+    previous = {(entry["scenario"], entry["storage"]): entry for entry in baseline}
+    rows = []
+    for entry in results:
+        base = previous.get((entry["scenario"], entry["storage"]))
+        if base is None:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            if metric not in base or not base[metric]:
+                continue
+            change = (entry[metric] - base[metric]) / base[metric]
+            worse = -change if higher_is_better else change
+            rows.append({
+                "scenario": entry["scenario"],
+                "storage": entry["storage"],
+                "metric": metric,
+                "baseline": base[metric],
+                "current": entry[metric],
+                "change": change,
+                "regression": worse > tolerance,
+            })
+    return rows
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--scenarios", default=",".join(GENERATORS), help="Comma-separated scenarios to run.")
+    parser.add_argument("--storage", default=",".join(STORAGES), help="Comma-separated storage backends.")
+    parser.add_argument("--size", type=int, default=SIZE, help="Chain length, fan-out width, loop iterations or condition depth.")
+    parser.add_argument("--runs", type=int, default=RUNS, help="Runs in the throughput pass.")
+    parser.add_argument("--latency-runs", type=int, default=LATENCY_RUNS, help="Sequential runs in the latency pass.")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="Scheduler max_concurrent_runs.")
+    parser.add_argument("--durability", choices=DURABILITY_MODES, default="batched", help="Persistence queue mode.")
+    parser.add_argument("--json", help="Write results to this file.")
+    parser.add_argument("--baseline", help="Compare against results previously written with --json.")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed relative regression against the baseline.")
+    args = parser.parse_args(argv)
+    args.scenarios = [name for name in args.scenarios.split(",") if name]
+    args.storage = [name for name in args.storage.split(",") if name]
+    for name in args.scenarios:
+        if name not in GENERATORS:
+            parser.error(f"unknown scenario '{name}' (expected one of {', '.join(GENERATORS)})")
+    for name in args.storage:
+        if name not in STORAGES:
+            parser.error(f"unknown storage '{name}' (expected one of {', '.join(STORAGES)})")
+    return args
+
+
+async def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    print(f"cpu_count={os.cpu_count()}  size={args.size}  runs={args.runs}  concurrency={args.concurrency}  durability={args.durability}")
+    print(f"{'scenario':>10} {'storage':>8} {'runs/sec':>10} {'steps/sec':>10} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'rss MB':>8}")
+    results = []
+    for scenario in args.scenarios:
+        for storage_kind in args.storage:
+            result = await measure(scenario, storage_kind, args)
+            results.append(result)
+            print(
+                f"{scenario:>10} {storage_kind:>8} {result['runs_per_sec']:>10.1f} {result['steps_per_sec']:>10.0f} "
+                f"{result['overhead_p50_ms']:>8.3f} {result['overhead_p95_ms']:>8.3f} {result['overhead_p99_ms']:>8.3f} "
+                f"{result['peak_rss_mb']:>8.1f}"
+            )
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "size": args.size,
+            "runs": args.runs,
+            "latency_runs": args.latency_runs,
+            "concurrency": args.concurrency,
+            "durability": args.durability,
+        },
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if not args.baseline:
+        return 0
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    rows = compare(results, baseline["results"], args.tolerance)
+    print(f"\nAgainst {args.baseline} (tolerance {args.tolerance:.0%}):")
+    print(f"{'scenario':>10} {'storage':>8} {'metric':>16} {'baseline':>10} {'current':>10} {'change':>8}")
+    for row in rows:
+        flag = "  REGRESSION" if row["regression"] else ""
+        print(
+            f"{row['scenario']:>10} {row['storage']:>8} {row['metric']:>16} "
+            f"{row['baseline']:>10.3f} {row['current']:>10.3f} {row['change']:>+8.1%}{flag}"
+        )
+    return 1 if any(row["regression"] for row in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,86 @@
+"""
+Synthetic graph generators shared by the benchmarks.
+
+Every generator returns a GraphDefinition built from no-op tools, so a run's
+wall time is almost entirely the engine's own per-step work. ``GENERATORS``
+maps scenario names to ``(graph factory, initial state factory)`` pairs; the
+factories take a single ``size`` argument.
+"""
+import os
+import sys
+from typing import Any, Callable, Dict, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.registry import ToolRegistry
+from app.models.schemas import GraphDefinition, NodeDefinition, EdgeDefinition
+
+CONDITION_BRANCHES = 8
+
+
+@ToolRegistry.register("bench_noop")
+async def bench_noop(state):
+    return None
+
+
+@ToolRegistry.register("bench_count")
+async def bench_count(state):
+    return {"count": state.get("count", 0) + 1}
+
+
+def chain_graph(length: int) -> GraphDefinition:
+    """n0 -> n1 -> ... -> n{length-1}, unconditional edges."""
+    nodes = [NodeDefinition(id=f"n{i}", tool="bench_noop") for i in range(length)]
+    edges = [EdgeDefinition(from_node=f"n{i}", to_node=f"n{i + 1}") for i in range(length - 1)]
+    return GraphDefinition(nodes=nodes, edges=edges, start_node="n0")
+
+
+def fan_out_graph(width: int) -> GraphDefinition:
+    """source fans out to `width` parallel branches that merge in a join node."""
+    nodes = [NodeDefinition(id="source", tool="bench_noop", fan_out=True)]
+    nodes += [NodeDefinition(id=f"b{i}", tool="bench_noop") for i in range(width)]
+    nodes.append(NodeDefinition(id="join", tool="bench_noop", join=True))
+    edges = [EdgeDefinition(from_node="source", to_node=f"b{i}") for i in range(width)]
+    edges += [EdgeDefinition(from_node=f"b{i}", to_node="join") for i in range(width)]
+    return GraphDefinition(nodes=nodes, edges=edges, start_node="source")
+
+
+def loop_graph(iterations: int) -> GraphDefinition:
+    """A single node looping on itself `iterations` times, then an exit node."""
+    return GraphDefinition(
+        nodes=[NodeDefinition(id="count", tool="bench_count"), NodeDefinition(id="done", tool="bench_noop")],
+        edges=[
+            EdgeDefinition(from_node="count", to_node="count", condition=f"state['count'] < {iterations}"),
+            EdgeDefinition(from_node="count", to_node="done"),
+        ],
+        start_node="count",
+        max_loops=iterations + 1,
+    )
+
+
+def conditions_graph(depth: int, branches: int = CONDITION_BRANCHES) -> GraphDefinition:
+    """
+    `depth` levels, each with `branches` conditional edges. Only the last edge
+    of each level matches (the initial state has route=branches-1), so every
+    step evaluates all of its conditions before routing to the next level.
+    """
+    nodes = [NodeDefinition(id=f"level{i}", tool="bench_noop") for i in range(depth)]
+    nodes.append(NodeDefinition(id="miss", tool="bench_noop"))
+    edges = []
+    for i in range(depth - 1):
+        edges += [
+            EdgeDefinition(from_node=f"level{i}", to_node="miss", condition=f"state['route'] == {k}")
+            for k in range(branches - 1)
+        ]
+        edges.append(
+            EdgeDefinition(from_node=f"level{i}", to_node=f"level{i + 1}", condition=f"state['route'] == {branches - 1}")
+        )
+    return GraphDefinition(nodes=nodes, edges=edges, start_node="level0")
+
+
+GENERATORS: Dict[str, Tuple[Callable[[int], GraphDefinition], Callable[[int], Dict[str, Any]]]] = {
+    "chain": (chain_graph, lambda size: {}),
+    "fan_out": (fan_out_graph, lambda size: {}),
+    "loop": (loop_graph, lambda size: {"count": 0}),
+    "conditions": (conditions_graph, lambda size: {"route": CONDITION_BRANCHES - 1}),
+}
@@ -0,0 +1,427 @@
+"""
+Load test: request latency and throughput of the HTTP API.
+
+Drives ``POST /graph/run``, ``GET /graph/state/{run_id}`` and
+``GET /graph/logs/{run_id}`` with a weighted request mix, either in-process
+through httpx's ASGI transport (default; the app's startup and shutdown
+hooks run as under uvicorn) or against a running server with --url.
+
+- closed loop (default): --concurrency workers each send their next
+  request as soon as the previous one returns.
+- open loop (--rate N): requests are scheduled at N per second in total.
+  Latency is measured from each request's scheduled send time, so a
+  server that falls behind shows up as queueing latency instead of as a
+  lower send rate (no coordinated omission).
+
+A sample of the runs started (--completion-sample, default 10%) is
+followed until it finishes by polling its state every --poll-interval
+seconds; the time from the POST to the first poll that sees a terminal
+status is the run's completion latency, accurate to the poll interval.
+Polls add load of their own and are reported separately (``state_poll``),
+not as part of the ``state`` mix.
+
+Latencies go into HDR-style log-linear histograms (under 1% relative
+error). The report gives, per endpoint, requests/sec, errors by status and
+p50/p90/p99/p99.9/max latency. --json writes it; --baseline compares
+against an earlier report and exits with status 1 on a regression beyond
+--tolerance.
+
+A single Python client tops out well below 10k requests/sec; for higher
+rates run several instances against one uvicorn server and add up their
+throughput.
+
+Usage:
+    python benchmarks/http_load.py
+    python benchmarks/http_load.py --rate 1000 --duration 30 --mix run=1,state=4,logs=1
+    python benchmarks/http_load.py --url http://127.0.0.1:8000 --concurrency 128 --json report.json
+    python benchmarks/http_load.py --baseline report.json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+ENDPOINTS = ("run", "state", "logs")
+TERMINAL_STATUSES = ("completed", "failed", "cancelled")
+DURATION = 10.0
+CONCURRENCY = 64
+SIZE = 5
+SEED_RUNS = 20
+MIX = "run=1,state=4,logs=1"
+PERCENTILES = (50, 90, 99, 99.9)
+
+# Report metrics compared against a baseline, and whether higher values are better
+COMPARED_METRICS = {"rps": True, "p50_ms": False, "p99_ms": False}
+
+
+class LatencyHistogram:
+    """
+    Log-linear histogram of latencies in whole microseconds, as in
+    HdrHistogram: values keep their top precision_bits significant bits, so
+    any recorded value is reported within 2**(1 - precision_bits) of its
+    true value (under 1% with the default 8 bits) at any magnitude, using a
+    few hundred buckets per decade at most. Buckets are kept sparse.
+    """
+
+    def __init__(self, precision_bits: int = 8):
+        self.precision_bits = precision_bits
+        self.counts: Dict[int, int] = {}
+        self.count = 0
+        self.total_us = 0
+        self.min_us: Optional[int] = None
+        self.max_us = 0
+
+    def _key(self, micros: int) -> int:
+        shift = max(0, micros.bit_length() - self.precision_bits)
+        return (shift << self.precision_bits) | (micros >> shift)
+
+    def _midpoint(self, key: int) -> float:
+        shift, mantissa = key >> self.precision_bits, key & ((1 << self.precision_bits) - 1)
+        low, high = mantissa << shift, ((mantissa + 1) << shift) - 1
+        return (low + high) / 2
+
+    def record(self, seconds: float):
+        micros = max(0, int(seconds * 1e6))
+        key = self._key(micros)
+        self.counts[key] = self.counts.get(key, 0) + 1
+        self.count += 1
+        self.total_us += micros
+        self.min_us = micros if self.min_us is None else min(self.min_us, micros)
+        self.max_us = max(self.max_us, micros)
+
+    def merge(self, other: "LatencyHistogram"):
+        if other.precision_bits != self.precision_bits:
+            raise ValueError("Cannot merge histograms with different precision.")
+        for key, count in other.counts.items():
+            self.counts[key] = self.counts.get(key, 0) + count
+        self.count += other.count
+        self.total_us += other.total_us
+        if other.min_us is not None:
+            self.min_us = other.min_us if self.min_us is None else min(self.min_us, other.min_us)
+        self.max_us = max(self.max_us, other.max_us)
+
+    def value_at(self, q: float) -> float:
+        """Latency in microseconds at percentile q (0-100), clamped to the recorded range."""
+        if not self.count:
+            return 0.0
+        rank = max(1, -(-self.count * q // 100))
+        seen = 0
+        for key in sorted(self.counts):
+            seen += self.counts[key]
+            if seen >= rank:
+                return min(max(self._midpoint(key), self.min_us), self.max_us)
+        return float(self.max_us)
+
+    def summary(self) -> Dict[str, float]:
+        summary = {
+            "count": self.count,
+            "mean_ms": self.total_us / self.count / 1000 if self.count else 0.0,
+            "min_ms": (self.min_us or 0) / 1000,
+        }
+        for q in PERCENTILES:
+            summary[f"p{q:g}_ms".replace(".", "")] = self.value_at(q) / 1000
+        summary["max_ms"] = self.max_us / 1000
+        return summary
+
+
+class EndpointStats:
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.requests = 0
+        self.errors: Counter = Counter()
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "rps": self.requests / elapsed if elapsed else 0.0,
+            "errors": sum(self.errors.values()),
+            "error_rate": sum(self.errors.values()) / self.requests if self.requests else 0.0,
+            "errors_by_kind": dict(self.errors),
+            **self.latency.summary(),
+        }
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    """'run=1,state=4' -> {'run': 1.0, 'state': 4.0}. Endpoints left out get no traffic."""
+    mix = {}
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise ValueError(f"Unknown endpoint '{name}' in mix (expected one of {', '.join(ENDPOINTS)}).")
+        mix[name] = float(weight or 1)
+    if not mix or sum(mix.values()) <= 0:
+        raise ValueError("The request mix needs at least one endpoint with a positive weight.")
+    return mix
+
+
+def chain_graph(size: int) -> Dict[str, Any]:
+    """A chain of built-in passthrough nodes, so any server can run it."""
+    return {
+        "nodes": [{"id": f"n{i}", "tool": "passthrough"} for i in range(size)],
+        "edges": [{"from_node": f"n{i}", "to_node": f"n{i + 1}"} for i in range(size - 1)],
+        "start_node": "n0",
+    }
+
+
+class LoadTest:
+    def __init__(self, client: httpx.AsyncClient, args: argparse.Namespace):
+        self.client = client
+        self.args = args
+        self.mix = parse_mix(args.mix)
+        self.stats: Dict[str, EndpointStats] = {name: EndpointStats() for name in (*ENDPOINTS, "state_poll")}
+        self.completion = LatencyHistogram()
+        self.completion_failures: Counter = Counter()
+        self.graph_id: Optional[str] = None
+        self.run_ids: List[str] = []
+        self._trackers: List[asyncio.Task] = []
+
+    async def setup(self):
+        resp = await self.client.post("/graph/create", json=chain_graph(self.args.size))
+        resp.raise_for_status()
+        self.graph_id = resp.json()["graph_id"]
+        for _ in range(self.args.seed_runs):
+            resp = await self.client.post("/graph/run?wait=true", json={"graph_id": self.graph_id})
+            resp.raise_for_status()
+            self.run_ids.append(resp.json()["run_id"])
+
+    async def _send(
+        self, endpoint: str, method: str, url: str, scheduled: Optional[float] = None, **kwargs
+    ) -> Tuple[Optional[httpx.Response], float]:
+        """
+        Sends one request and records its latency and outcome under endpoint,
+        timing from scheduled if given. Returns the response (None on a
+        transport error) and the time the latency was measured from.
+        """
+        stats = self.stats[endpoint]
+        start = time.perf_counter() if scheduled is None else scheduled
+        try:
+            resp = await self.client.request(method, url, **kwargs)
+        except httpx.HTTPError as e:
+            resp = None
+            stats.errors[type(e).__name__] += 1
+        stats.latency.record(time.perf_counter() - start)
+        stats.requests += 1
+        if resp is not None and resp.status_code >= 400:
+            stats.errors[str(resp.status_code)] += 1
+        return resp, start
+
+    async def _request(self, endpoint: str, scheduled: Optional[float]):
+        if endpoint != "run":
+            await self._send(endpoint, "GET", f"/graph/{endpoint}/{random.choice(self.run_ids)}", scheduled)
+            return
+        resp, start = await self._send("run", "POST", "/graph/run", scheduled, json={"graph_id": self.graph_id})
+        if resp is not None and resp.status_code == 200:
+            run_id = resp.json()["run_id"]
+            self.run_ids.append(run_id)
+            if random.random() < self.args.completion_sample:
+                self._trackers.append(asyncio.create_task(self._track_completion(run_id, start)))
+
+    async def _track_completion(self, run_id: str, submitted: float):
+        while True:
+            await asyncio.sleep(self.args.poll_interval)
+            resp, _ = await self._send("state_poll", "GET", f"/graph/state/{run_id}")
+            if resp is None or resp.status_code != 200:
+                self.completion_failures["poll_error"] += 1
+                return
+            status = resp.json()["status"]
+            if status in TERMINAL_STATUSES:
+                if status == "completed":
+                    self.completion.record(time.perf_counter() - submitted)
+                else:
+                    self.completion_failures[status] += 1
+                return
+
+    async def _worker(self, deadline: float, schedule: Optional[itertools.count], started: float):
+        endpoints, weights = list(self.mix), list(self.mix.values())
+        while True:
+            scheduled = None
+            if schedule is not None:
+                scheduled = started + next(schedule) / self.args.rate
+                if scheduled >= deadline:
+                    return
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            elif time.perf_counter() >= deadline:
+                return
+            await self._request(random.choices(endpoints, weights)[0], scheduled)
+
+    async def run(self) -> Dict[str, Any]:
+        await self.setup()
+        schedule = itertools.count() if self.args.rate else None
+        started = time.perf_counter()
+        deadline = started + self.args.duration
+        await asyncio.gather(*(self._worker(deadline, schedule, started) for _ in range(self.args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+        # Let tracked runs finish; give up on stragglers after completion_timeout
+        if self._trackers:
+            _, pending = await asyncio.wait(self._trackers, timeout=self.args.completion_timeout)
+            for task in pending:
+                task.cancel()
+                self.completion_failures["timeout"] += 1
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        totals = EndpointStats()
+        for name in ENDPOINTS:
+            totals.latency.merge(self.stats[name].latency)
+            totals.requests += self.stats[name].requests
+            totals.errors.update(self.stats[name].errors)
+        return {
+            "meta": {
+                "target": self.args.url or "asgi",
+                "storage": None if self.args.url else self.args.storage,
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "duration_s": elapsed,
+                "concurrency": self.args.concurrency,
+                "rate": self.args.rate,
+                "mix": self.mix,
+                "size": self.args.size,
+            },
+            "endpoints": {
+                name: self.stats[name].report(elapsed)
+                for name in (*ENDPOINTS, "state_poll")
+                if self.stats[name].requests
+            },
+            "total": totals.report(elapsed),
+            "run_completion": {**self.completion.summary(), "failures": dict(self.completion_failures)},
+        }
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[Dict[str, Any]]:
+    """
+    Per endpoint (plus total and run_completion latency): baseline and
+    current values, the relative change, and whether it is worse by more than
+    tolerance. A higher error rate than the baseline is always a regression.
+    """
+    def sections(data: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        return {**data["endpoints"], "total": data["total"], "run_completion": data["run_completion"]}
+
+    previous = sections(baseline)
+    rows = []
+    for name, entry in sections(report).items():
+        base = previous.get(name)
+        if base is None:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            if not base.get(metric) or metric not in entry:
+                continue
+            change = (entry[metric] - base[metric]) / base[metric]
+            worse = -change if higher_is_better else change
+            rows.append({
+                "endpoint": name, "metric": metric, "baseline": base[metric], "current": entry[metric],
+                "change": change, "regression": worse > tolerance,
+            })
+        if "error_rate" in entry:
+            rows.append({
+                "endpoint": name, "metric": "error_rate", "baseline": base.get("error_rate", 0.0),
+                "current": entry["error_rate"], "change": entry["error_rate"] - base.get("error_rate", 0.0),
+                "regression": entry["error_rate"] > base.get("error_rate", 0.0),
+            })
+    return rows
+
+
+def print_report(report: Dict[str, Any]):
+    meta = report["meta"]
+    print(
+        f"target={meta['target']}  duration={meta['duration_s']:.1f}s  concurrency={meta['concurrency']}  "
+        f"rate={meta['rate'] or 'closed-loop'}  size={meta['size']}"
+    )
+    print(f"{'endpoint':>14} {'requests':>9} {'rps':>8} {'errors':>7} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'p99.9 ms':>9} {'max ms':>8}")
+    rows = {**report["endpoints"], "total": report["total"], "run_completion": report["run_completion"]}
+    for name, entry in rows.items():
+        requests = entry.get("requests", entry["count"])
+        rps = f"{entry['rps']:>8.0f}" if "rps" in entry else f"{'':>8}"
+        errors = entry["errors"] if "errors" in entry else sum(entry["failures"].values())
+        print(
+            f"{name:>14} {requests:>9} {rps} {errors:>7} {entry['p50_ms']:>8.2f} {entry['p90_ms']:>8.2f} "
+            f"{entry['p99_ms']:>8.2f} {entry['p999_ms']:>9.2f} {entry['max_ms']:>8.2f}"
+        )
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--url", help="Base URL of a running server. Default: the app in-process over ASGI.")
+    parser.add_argument("--storage", choices=("memory", "sqlite"), default="memory", help="In-process only: STORAGE_TYPE for the app.")
+    parser.add_argument("--duration", type=float, default=DURATION, help="Seconds of load.")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="Concurrent requests (workers).")
+    parser.add_argument("--rate", type=float, default=0.0, help="Open loop: total requests per second. 0 = closed loop.")
+    parser.add_argument("--mix", default=MIX, help="Weighted request mix, e.g. run=1,state=4,logs=1.")
+    parser.add_argument("--size", type=int, default=SIZE, help="Nodes in the graph each run executes.")
+    parser.add_argument("--seed-runs", type=int, default=SEED_RUNS, help="Runs completed before the load starts, for state/logs requests.")
+    parser.add_argument("--poll-interval", type=float, default=0.02, help="Seconds between state polls of a started run.")
+    parser.add_argument("--completion-sample", type=float, default=0.1, help="Fraction of started runs followed to completion.")
+    parser.add_argument("--completion-timeout", type=float, default=30.0, help="Seconds to wait for followed runs after the load stops.")
+    parser.add_argument("--json", help="Write the report to this file.")
+    parser.add_argument("--baseline", help="Compare against a report previously written with --json.")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed relative regression against the baseline.")
+    args = parser.parse_args(argv)
+    try:
+        parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.size < 1 or args.concurrency < 1 or args.rate < 0:
+        parser.error("--size and --concurrency must be at least 1, and --rate non-negative")
+    return args
+
+
+async def load_test(args: argparse.Namespace) -> Dict[str, Any]:
+    limits = httpx.Limits(max_connections=args.concurrency * 2, max_keepalive_connections=args.concurrency * 2)
+    if args.url:
+        async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=60) as client:
+            return await LoadTest(client, args).run()
+
+    with tempfile.TemporaryDirectory() as directory:
+        # Read by the app when its storage is first created
+        os.environ["STORAGE_TYPE"] = args.storage
+        os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(directory, 'load.db')}"
+        from app.main import app
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://load-test", timeout=60) as client:
+                return await LoadTest(client, args).run()
+
+
+async def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    report = await load_test(args)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if not args.baseline:
+        return 0
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    rows = compare(report, baseline, args.tolerance)
+    print(f"\nAgainst {args.baseline} (tolerance {args.tolerance:.0%}):")
+    print(f"{'endpoint':>14} {'metric':>10} {'baseline':>10} {'current':>10} {'change':>8}")
+    for row in rows:
+        flag = "  REGRESSION" if row["regression"] else ""
+        print(
+            f"{row['endpoint']:>14} {row['metric']:>10} {row['baseline']:>10.3f} "
+            f"{row['current']:>10.3f} {row['change']:>+8.1%}{flag}"
+        )
+    return 1 if any(row["regression"] for row in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,87 @@
+"""
+Benchmark: steps/sec in full and delta log mode on a large state.
+
+Each run walks a chain of SIZE nodes over a state holding RECORDS records.
+Every step changes one small key, the way most steps touch a small part of
+a large state. Full mode logs the whole state twice per step; delta mode
+logs the changed key, with a full snapshot every SNAPSHOT_EVERY steps.
+
+Run state is checkpointed every SNAPSHOT_EVERY steps in both modes:
+a checkpoint writes the whole state whatever the log mode, so checkpointing
+every step would hide the difference being measured. Each mode is measured
+on both storage backends (batched persistence, the default), as steps/sec
+over RUNS runs executed one at a time.
+
+Usage:
+    python benchmarks/log_modes.py
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.engine import WorkflowEngine
+from app.core.registry import ToolRegistry
+from app.core.storage import BaseStorage, InMemoryStorage, SQLiteStorage
+from app.models.schemas import GraphDefinition, NodeDefinition, EdgeDefinition
+
+RUNS = 5
+SIZE = 50
+RECORDS = 2000
+SNAPSHOT_EVERY = 10
+
+
+@ToolRegistry.register("bench_tick")
+async def bench_tick(state):
+    return {"ticks": state.get("ticks", 0) + 1}
+
+
+def chain_graph(log_mode: str) -> GraphDefinition:
+    return GraphDefinition(
+        nodes=[NodeDefinition(id=f"n{i}", tool="bench_tick") for i in range(SIZE)],
+        edges=[EdgeDefinition(from_node=f"n{i}", to_node=f"n{i + 1}") for i in range(SIZE - 1)],
+        start_node="n0",
+        log_mode=log_mode,
+        log_snapshot_every=SNAPSHOT_EVERY,
+        checkpoint_policy="every_n_steps",
+        checkpoint_every=SNAPSHOT_EVERY,
+    )
+
+
+def initial_state() -> dict:
+    return {"records": [{"id": i, "name": f"record-{i}", "tags": ["a", "b"]} for i in range(RECORDS)]}
+
+
+async def measure(storage: BaseStorage, log_mode: str) -> float:
+    engine = WorkflowEngine(storage)
+    graph_id = await engine.create_graph(chain_graph(log_mode))
+    started = time.perf_counter()
+    for _ in range(RUNS):
+        run_id = await engine.start_run(graph_id, initial_state())
+        final = await engine.wait_for_run(run_id, timeout=120)
+        if final is None or final.status != "completed":
+            raise RuntimeError(f"Benchmark run did not complete: {final and final.message}")
+    elapsed = time.perf_counter() - started
+    await engine.persistence.close()
+    return RUNS * SIZE / elapsed
+
+
+async def main():
+    print(f"runs={RUNS}  size={SIZE}  records={RECORDS}  snapshot_every={SNAPSHOT_EVERY}")
+    print(f"{'storage':>8} {'full steps/s':>13} {'delta steps/s':>14} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as directory:
+        sqlite = SQLiteStorage(f"sqlite+aiosqlite:///{os.path.join(directory, 'runs.db')}")
+        await sqlite.init_db()
+        for name, storage in (("memory", InMemoryStorage()), ("sqlite", sqlite)):
+            await measure(storage, "delta")  # warm up
+            full = await measure(storage, "full")
+            delta = await measure(storage, "delta")
+            print(f"{name:>8} {full:>13.0f} {delta:>14.0f} {delta / full:>7.1f}x")
+        await sqlite.engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,110 @@
+"""
+Benchmark: engine steps/sec on large graphs.
+
+Builds a ring of N nodes (n0 -> n1 -> ... -> n{N-1} -> n0) and loops around it
+until roughly STEPS_TARGET steps have executed. Tools are trivial async
+functions, so the measurement is dominated by the engine's own per-step work
+(node lookup, edge routing, logging).
+
+Each size is measured twice on the same graph:
+- scan: node and edge lookups as before graphs were compiled, a linear scan
+  of the node list and of the edge list on every step
+- plan: the compiled plan's O(1) lookups
+
+Usage:
+    python benchmarks/plan_lookup.py
+"""
+import asyncio
+import dataclasses
+import os
+import sys
+from typing import Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.engine import WorkflowEngine
+from app.core.plan import CompiledEdge, CompiledNode, CompiledPlan
+from app.core.registry import ToolRegistry
+from app.core.storage import InMemoryStorage
+from app.models.schemas import GraphDefinition, NodeDefinition, EdgeDefinition
+
+STEPS_TARGET = 20000
+SIZES = [10, 100, 1000]
+
+
+@ToolRegistry.register("bench_noop")
+async def bench_noop(state):
+    return None
+
+
+@ToolRegistry.register("bench_lap")
+async def bench_lap(state):
+    return {"laps": state.get("laps", 0) + 1}
+
+
+def ring_graph(size: int, laps: int) -> GraphDefinition:
+    nodes = [NodeDefinition(id=f"n{i}", tool="bench_noop") for i in range(size - 1)]
+    nodes.append(NodeDefinition(id=f"n{size - 1}", tool="bench_lap"))
+    edges = [EdgeDefinition(from_node=f"n{i}", to_node=f"n{i + 1}") for i in range(size - 1)]
+    edges.append(EdgeDefinition(from_node=f"n{size - 1}", to_node="n0", condition=f"state.get('laps', 0) < {laps}"))
+    return GraphDefinition(nodes=nodes, edges=edges, start_node="n0", max_loops=laps + 1)
+
+
+@dataclasses.dataclass(frozen=True)
+class ScanningPlan(CompiledPlan):
+    """A plan whose lookups cost what they did before compilation."""
+    node_list: Tuple[CompiledNode, ...] = ()
+    edge_list: Tuple[CompiledEdge, ...] = ()
+
+    def get_node(self, node_id: str) -> Optional[CompiledNode]:
+        node = next((n for n in self.node_list if n.id == node_id), None)
+        if node is not None:
+            # The old routing collected the node's outgoing edges from the full
+            # list on every step; the engine then routes over node.edges
+            [e for e in self.edge_list if e.from_node == node_id]
+        return node
+
+
+def scanning(plan: CompiledPlan) -> ScanningPlan:
+    return ScanningPlan(
+        **{field.name: getattr(plan, field.name) for field in dataclasses.fields(CompiledPlan)},
+        node_list=tuple(plan.nodes.values()),
+        edge_list=tuple(edge for node in plan.nodes.values() for edge in node.edges),
+    )
+
+
+async def measure(size: int, lookup: str = "plan") -> float:
+    storage = InMemoryStorage()
+    engine = WorkflowEngine(storage)
+    laps = max(1, STEPS_TARGET // size)
+    graph_id = await engine.create_graph(ring_graph(size, laps))
+    if lookup == "scan":
+        engine.plans[graph_id] = scanning(engine.plans[graph_id])
+    run_id = await engine.start_run(graph_id, {})
+
+    while True:
+        await asyncio.sleep(0.01)
+        run = await storage.get_run(run_id)
+        if run.status in ("completed", "failed"):
+            break
+    if run.status != "completed":
+        raise RuntimeError(f"Benchmark run failed: {run.message}")
+
+    # Use log timestamps so startup delays are excluded from the measurement
+    logs = await storage.get_logs(run_id)
+    elapsed = (logs[-1].timestamp - logs[0].timestamp).total_seconds()
+    return (len(logs) - 1) / elapsed
+
+
+async def main():
+    await measure(SIZES[0])  # warm up
+    print(f"{'nodes':>8} {'scan steps/s':>13} {'plan steps/s':>13} {'speedup':>8}")
+    for size in SIZES:
+        # Best of three to smooth out scheduler noise
+        scan = max([await measure(size, "scan") for _ in range(3)])
+        plan = max([await measure(size, "plan") for _ in range(3)])
+        print(f"{size:>8} {scan:>13.0f} {plan:>13.0f} {plan / scan:>7.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
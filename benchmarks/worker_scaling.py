@@ -0,0 +1,91 @@
+"""
+Benchmark: run throughput with 1, 2 and 4 worker processes.
+
+Starts WORKER_COUNTS worker processes (python -m app.worker) on a fresh
+SQLite storage and run queue, lets them go idle, then enqueues RUNS runs of
+a SIZE-node chain of passthrough tools and times how long the workers take
+to drain the queue. Engine work is CPU-bound per process, so runs/sec
+should grow roughly with the worker count up to the number of cores (and
+until SQLite writes become the bottleneck).
+
+Usage:
+    python benchmarks/worker_scaling.py
+"""
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.engine import WorkflowEngine
+from app.core.run_queue import RunQueue
+from app.core.storage import SQLiteStorage
+from app.models.schemas import GraphDefinition, NodeDefinition, EdgeDefinition
+
+RUNS = 400
+SIZE = 20
+CONCURRENCY = 32
+WORKER_COUNTS = [1, 2, 4]
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def chain_graph(size: int) -> GraphDefinition:
+    return GraphDefinition(
+        nodes=[NodeDefinition(id=f"n{i}", tool="passthrough") for i in range(size)],
+        edges=[EdgeDefinition(from_node=f"n{i}", to_node=f"n{i + 1}") for i in range(size - 1)],
+        start_node="n0",
+    )
+
+
+async def measure(workers: int) -> float:
+    with tempfile.TemporaryDirectory() as directory:
+        db_url = f"sqlite+aiosqlite:///{os.path.join(directory, 'runs.db')}"
+        queue_path = os.path.join(directory, "queue.db")
+        storage = SQLiteStorage(db_url, wal=True)
+        await storage.init_db()
+        queue = RunQueue(queue_path)
+        front = WorkflowEngine(storage, run_queue=queue)
+        graph_id = await front.create_graph(chain_graph(SIZE))
+
+        env = {**os.environ, "STORAGE_TYPE": "sqlite", "DATABASE_URL": db_url, "RUN_QUEUE_PATH": queue_path}
+        process = subprocess.Popen(
+            [sys.executable, "-m", "app.worker", "--processes", str(workers), "--concurrency", str(CONCURRENCY)],
+            cwd=ROOT, env=env, stderr=subprocess.DEVNULL,
+        )
+        try:
+            await asyncio.sleep(3)  # let the workers start up and go idle
+            started = time.perf_counter()
+            run_ids = await front.start_runs(graph_id, [{} for _ in range(RUNS)])
+            while True:
+                stats = await queue.stats()
+                if stats["queued"] == 0 and stats["leased"] == 0:
+                    break
+                await asyncio.sleep(0.01)
+            elapsed = time.perf_counter() - started
+        finally:
+            process.send_signal(signal.SIGTERM)
+            process.wait()
+
+        for run_id in run_ids[:: max(1, RUNS // 20)]:
+            run = await storage.get_run(run_id)
+            assert run.status == "completed", run.message
+        await front.persistence.close()
+        queue.close()
+        await storage.engine.dispose()
+    return RUNS / elapsed
+
+
+async def main():
+    print(f"cpu_count={os.cpu_count()}  runs={RUNS}  size={SIZE}  concurrency={CONCURRENCY}")
+    print(f"{'workers':>8} {'runs/sec':>10} {'steps/sec':>10}")
+    for workers in WORKER_COUNTS:
+        rate = await measure(workers)
+        print(f"{workers:>8} {rate:>10.1f} {rate * SIZE:>10.0f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,67 @@
+"""Tests for batch run submission."""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+
+from app.core.engine import WorkflowEngine
+from app.core.scheduler import RunScheduler, SchedulerFull
+from app.core.storage import SQLiteStorage
+from app.main import app
+from app.models.schemas import GraphDefinition, NodeDefinition
+
+GRAPH = {"nodes": [{"id": "a", "tool": "passthrough"}], "edges": [], "start_node": "a"}
+
+
+def test_batch_endpoint_preserves_order_and_summarizes():
+    with TestClient(app) as client:
+        graph_id = client.post("/graph/create", json=GRAPH).json()["graph_id"]
+        states = [{"file": f"f{i}.py"} for i in range(20)]
+        body = client.post("/graph/run/batch?wait=true", json={"graph_id": graph_id, "initial_states": states}).json()
+
+        assert body["status"] == "finished" and body["summary"] == {"completed": 20}
+        files = [client.get(f"/graph/state/{run_id}").json()["state"]["file"] for run_id in body["run_ids"]]
+        assert files == [s["file"] for s in states]
+
+        assert client.post("/graph/run/batch", json={"graph_id": "nope", "initial_states": [{}]}).status_code == 404
+        assert client.post("/graph/run/batch", json={"graph_id": graph_id, "initial_states": []}).status_code == 422
+
+
+def test_large_sqlite_batch_admission():
+    async def scenario(db_path):
+        storage = SQLiteStorage(f"sqlite+aiosqlite:///{db_path}")
+        await storage.init_db()
+        engine = WorkflowEngine(storage, RunScheduler(max_concurrent_runs=4, max_queue_size=10000))
+        graph_id = await engine.create_graph(GraphDefinition(
+            nodes=[NodeDefinition(id="a", tool="passthrough")], edges=[], start_node="a"
+        ))
+
+        started = time.perf_counter()
+        run_ids = await engine.start_runs(graph_id, [{"i": i} for i in range(5000)], persist_intermediate=False)
+        admitted = time.perf_counter() - started
+        assert len(run_ids) == 5000 and admitted < 1.0, admitted
+
+        # All-or-nothing: a batch that doesn't fit is rejected before anything is stored
+        try:
+            await engine.start_runs(graph_id, [{}] * 6000)
+        except SchedulerFull:
+            pass
+        else:
+            raise AssertionError("batch should exceed queue capacity")
+
+        await engine.scheduler.shutdown(timeout=0)
+        await storage.engine.dispose()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(scenario(os.path.join(tmp, "batch.db")))
+
+
+if __name__ == "__main__":
+    test_batch_endpoint_preserves_order_and_summarizes()
+    test_large_sqlite_batch_admission()
+    print("=== ALL TESTS PASSED ===")
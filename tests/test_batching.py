@@ -0,0 +1,119 @@
+"""Tests for cross-run micro-batching of batch tools."""
+import asyncio
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.batching import MicroBatcher
+from app.core.engine import WorkflowEngine
+from app.core.registry import ToolRegistry
+from app.core.scheduler import RunScheduler
+from app.core.storage import InMemoryStorage
+from app.models.schemas import GraphDefinition, NodeDefinition
+
+CALLS = []
+
+
+@ToolRegistry.register("batch_test_score", batch=True, inputs=["text"], max_batch_size=16, max_batch_wait_ms=20)
+def batch_test_score(states, weight: int = 1):
+    CALLS.append(len(states))
+    return [{"score": len(state["text"]) * weight} for state in states]
+
+
+@ToolRegistry.register("batch_test_threads", batch=True, max_batch_size=16, max_batch_wait_ms=20)
+def batch_test_threads(states):
+    thread = threading.current_thread().name
+    CALLS.append((thread.rsplit("_", 1)[0], len(states)))
+    return [{"thread": thread} for _ in states]
+
+
+@ToolRegistry.register("batch_test_broken", batch=True, max_batch_size=4, max_batch_wait_ms=5)
+async def batch_test_broken(states):
+    return [{}]
+
+
+def single_node_graph(tool: str, **node) -> GraphDefinition:
+    return GraphDefinition(nodes=[NodeDefinition(id="n", tool=tool, **node)], edges=[], start_node="n")
+
+
+async def run_many(engine: WorkflowEngine, graph_id: str, states):
+    run_ids = [await engine.start_run(graph_id, state) for state in states]
+    return [await engine.wait_for_run(run_id, timeout=5) for run_id in run_ids]
+
+
+def test_concurrent_runs_share_batches():
+    async def scenario():
+        CALLS.clear()
+        engine = WorkflowEngine(InMemoryStorage(), RunScheduler(max_concurrent_runs=100), batcher=MicroBatcher())
+        graph_id = await engine.create_graph(single_node_graph("batch_test_score"))
+        texts = ["x" * i for i in range(40)]
+        finals = await run_many(engine, graph_id, [{"text": text} for text in texts])
+        assert [final.state["score"] for final in finals] == [len(text) for text in texts]
+        assert sum(CALLS) == 40 and len(CALLS) < 10 and max(CALLS) <= 16
+
+        stats = engine.batcher.stats()["batch_test_score"]
+        assert stats["batches"] == len(CALLS) and stats["items"] == 40
+        assert stats["full_batches"] == CALLS.count(16)
+        assert sum(stats["batch_size_histogram"].values()) == stats["batches"]
+        assert stats["batch_size_histogram"]["16"] == len([size for size in CALLS if 8 < size <= 16])
+
+    asyncio.run(scenario())
+
+
+def test_params_split_batches_and_bad_results_fail_every_caller():
+    async def scenario():
+        CALLS.clear()
+        engine = WorkflowEngine(InMemoryStorage(), RunScheduler(max_concurrent_runs=100), batcher=MicroBatcher())
+        plain = await engine.create_graph(single_node_graph("batch_test_score"))
+        weighted = await engine.create_graph(single_node_graph("batch_test_score", params={"weight": 10}))
+        run_ids = [await engine.start_run(graph_id, {"text": "abc"}) for graph_id in (plain, weighted, plain)]
+        finals = [await engine.wait_for_run(run_id, timeout=5) for run_id in run_ids]
+        assert [final.state["score"] for final in finals] == [3, 30, 3]
+        assert sorted(CALLS) == [1, 2]
+
+        broken = await engine.create_graph(single_node_graph("batch_test_broken"))
+        finals = await run_many(engine, broken, [{}, {}, {}])
+        assert all(final.status == "failed" for final in finals)
+        assert "returned 1 results for 3 states" in finals[0].message
+
+    asyncio.run(scenario())
+
+
+def test_node_executor_overrides_split_batches():
+    async def scenario():
+        CALLS.clear()
+        engine = WorkflowEngine(InMemoryStorage(), RunScheduler(max_concurrent_runs=100), batcher=MicroBatcher())
+        default = await engine.create_graph(single_node_graph("batch_test_threads"))
+        pinned = await engine.create_graph(single_node_graph("batch_test_threads", executor="batch_test_pool"))
+        run_ids = [await engine.start_run(graph_id, {}) for graph_id in (pinned, default, pinned, default)]
+        finals = [await engine.wait_for_run(run_id, timeout=5) for run_id in run_ids]
+        threads = [final.state["thread"] for final in finals]
+        assert all(thread.startswith("pool-batch_test_pool") for thread in threads[0::2])
+        assert not any(thread.startswith("pool-batch_test_pool") for thread in threads[1::2])
+        assert len(CALLS) == 2 and all(size == 2 for _, size in CALLS)
+
+    asyncio.run(scenario())
+
+
+def test_map_node_items_are_batched():
+    async def scenario():
+        CALLS.clear()
+        engine = WorkflowEngine(InMemoryStorage(), batcher=MicroBatcher())
+        graph_id = await engine.create_graph(
+            single_node_graph("batch_test_score", map_over="texts", map_item_key="text", map_concurrency=16)
+        )
+        final = (await run_many(engine, graph_id, [{"texts": ["a", "bb", "ccc"] * 10}]))[0]
+        assert [result["score"] for result in final.state["texts_results"]] == [1, 2, 3] * 10
+        assert CALLS == [16, 14]
+
+    asyncio.run(scenario())
+
+
+if __name__ == "__main__":
+    test_concurrent_runs_share_batches()
+    test_params_split_batches_and_bad_results_fail_every_caller()
+    test_node_executor_overrides_split_batches()
+    test_map_node_items_are_batched()
+    print("=== ALL TESTS PASSED ===")
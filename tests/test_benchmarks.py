@@ -0,0 +1,59 @@
+"""Tests for the engine throughput benchmark and its graph generators."""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.engine_throughput import compare, main, measure, parse_args, percentile
+from benchmarks.graphs import GENERATORS
+
+
+def test_every_scenario_completes_on_both_storages():
+    async def scenario():
+        args = parse_args(["--size", "4", "--runs", "5", "--latency-runs", "2"])
+        for name in GENERATORS:
+            for storage in ("memory", "sqlite"):
+                result = await measure(name, storage, args)
+                assert result["runs"] == 5 and result["steps"] >= 5 * 4, (name, storage)
+                assert result["runs_per_sec"] > 0 and result["peak_rss_mb"] > 0
+                assert 0 <= result["overhead_p50_ms"] <= result["overhead_p95_ms"] <= result["overhead_p99_ms"]
+
+    asyncio.run(scenario())
+
+
+def test_percentile_and_baseline_comparison():
+    assert percentile(list(range(1, 101)), 50) == 50 and percentile(list(range(1, 101)), 99) == 99
+    assert percentile([], 95) == 0.0
+
+    baseline = [{"scenario": "chain", "storage": "memory", "runs_per_sec": 100.0, "overhead_p50_ms": 1.0}]
+    current = [{"scenario": "chain", "storage": "memory", "runs_per_sec": 80.0, "steps_per_sec": 5.0, "overhead_p50_ms": 1.05}]
+    rows = {row["metric"]: row for row in compare(current, baseline, 0.10)}
+    # steps_per_sec has no baseline value and is skipped
+    assert set(rows) == {"runs_per_sec", "overhead_p50_ms"}
+    assert rows["runs_per_sec"]["regression"] and abs(rows["runs_per_sec"]["change"] + 0.2) < 1e-9
+    assert not rows["overhead_p50_ms"]["regression"]
+
+
+def test_cli_writes_json_and_fails_on_regression():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "results.json")
+        argv = ["--scenarios", "chain", "--storage", "memory", "--size", "3", "--runs", "5", "--latency-runs", "1"]
+        assert asyncio.run(main(argv + ["--json", path])) == 0
+        with open(path) as f:
+            report = json.load(f)
+        assert report["meta"]["runs"] == 5 and report["results"][0]["scenario"] == "chain"
+
+        report["results"][0]["runs_per_sec"] *= 1000
+        with open(path, "w") as f:
+            json.dump(report, f)
+        assert asyncio.run(main(argv + ["--baseline", path])) == 1
+
+
+if __name__ == "__main__":
+    test_every_scenario_completes_on_both_storages()
+    test_percentile_and_baseline_comparison()
+    test_cli_writes_json_and_fails_on_regression()
+    print("=== ALL TESTS PASSED ===")
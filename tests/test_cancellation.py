@@ -0,0 +1,115 @@
+"""Tests for node timeouts and run cancellation."""
+import asyncio
+import os
+import pickle
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+
+from app.core.cancellation import CancelToken, ToolCancelled
+from app.core.engine import WorkflowEngine
+from app.core.executors import executor_pools
+from app.core.registry import ToolRegistry
+from app.core.scheduler import RunScheduler
+from app.core.storage import InMemoryStorage
+from app.main import app
+from app.models.schemas import GraphDefinition, NodeDefinition
+
+THREAD_EXITS = []
+
+
+@ToolRegistry.register("cancel_test_sleep")
+async def cancel_test_sleep(state, seconds: float = 10.0):
+    await asyncio.sleep(seconds)
+    return {"slept": True}
+
+
+@ToolRegistry.register("cancel_test_spin", executor="cancel-test")
+def cancel_test_spin(state, seconds: float = 10.0, cancel_token=None):
+    started = time.time()
+    try:
+        while time.time() - started < seconds:
+            cancel_token.raise_if_cancelled()
+            time.sleep(0.005)
+    except ToolCancelled:
+        THREAD_EXITS.append(time.time() - started)
+        raise
+    return {"spun": True}
+
+
+def single_node_graph(tool: str, **node) -> GraphDefinition:
+    return GraphDefinition(nodes=[NodeDefinition(id="n", tool=tool, **node)], edges=[], start_node="n")
+
+
+def test_timeouts_fail_the_run_and_free_threads():
+    async def scenario():
+        THREAD_EXITS.clear()
+        engine = WorkflowEngine(InMemoryStorage())
+        async_graph = await engine.create_graph(single_node_graph("cancel_test_sleep", timeout_ms=50))
+        final = await engine.wait_for_run(await engine.start_run(async_graph, {}), timeout=2)
+        assert final.status == "failed" and "timed out after 50 ms" in final.message
+
+        started = time.perf_counter()
+        sync_graph = await engine.create_graph(single_node_graph("cancel_test_spin", timeout_ms=50))
+        final = await engine.wait_for_run(await engine.start_run(sync_graph, {}), timeout=2)
+        assert final.status == "failed" and time.perf_counter() - started < 1
+        # The thread noticed its token and gave the worker back
+        await asyncio.sleep(0.1)
+        assert len(THREAD_EXITS) == 1 and THREAD_EXITS[0] < 1
+        assert executor_pools.stats()["cancel-test"]["active"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_cancel_running_and_queued_runs():
+    async def scenario():
+        THREAD_EXITS.clear()
+        engine = WorkflowEngine(InMemoryStorage(), RunScheduler(max_concurrent_runs=1))
+        graph_id = await engine.create_graph(single_node_graph("cancel_test_spin"))
+        running = await engine.start_run(graph_id, {})
+        queued = await engine.start_run(graph_id, {})
+        await asyncio.sleep(0.05)
+
+        final = await engine.cancel_run(queued)
+        assert final.status == "cancelled" and engine.scheduler.queue_depth == 0
+        final = await engine.cancel_run(running)
+        assert final.status == "cancelled" and final.message == "Run cancelled"
+        assert (await engine.storage.get_run(running)).status == "cancelled"
+        await asyncio.sleep(0.1)
+        assert len(THREAD_EXITS) == 1
+        assert engine.scheduler.active_count == 0 and not engine.live_runs
+
+    asyncio.run(scenario())
+
+
+def test_cancel_endpoint():
+    with TestClient(app) as client:
+        graph = {"nodes": [{"id": "n", "tool": "cancel_test_sleep"}], "edges": [], "start_node": "n"}
+        graph_id = client.post("/graph/create", json=graph).json()["graph_id"]
+        run_id = client.post("/graph/run", json={"graph_id": graph_id}).json()["run_id"]
+
+        resp = client.post(f"/graph/run/{run_id}/cancel")
+        assert resp.status_code == 200 and resp.json()["status"] == "cancelled"
+        assert client.get(f"/graph/state/{run_id}").json()["status"] == "cancelled"
+        assert client.post(f"/graph/run/{run_id}/cancel").status_code == 409
+        assert client.post("/graph/run/missing/cancel").status_code == 404
+
+
+def test_token_deadline_survives_pickling():
+    parent = CancelToken(deadline=time.time() + 60)
+    child = CancelToken(parent=parent)
+    copy = pickle.loads(pickle.dumps(child))
+    assert copy.deadline == parent.deadline and not copy.cancelled
+    parent.cancel()
+    assert child.cancelled and not copy.cancelled
+
+
+if __name__ == "__main__":
+    test_timeouts_fail_the_run_and_free_threads()
+    test_cancel_running_and_queued_runs()
+    test_cancel_endpoint()
+    test_token_deadline_survives_pickling()
+    print("=== ALL TESTS PASSED ===")
@@ -0,0 +1,57 @@
+"""Tests for pre-parsed edge conditions."""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app.examples.code_review  # noqa: F401  (registers tools)
+from app.core.conditions import compile_condition, parse_condition
+from app.core.engine import WorkflowEngine
+from app.core.storage import InMemoryStorage
+from app.models.schemas import GraphDefinition, NodeDefinition, EdgeDefinition
+
+
+def test_condition_is_parsed_once_and_shared():
+    first = compile_condition("state.get('quality_score', 0) < 8")
+    second = compile_condition("state.get('quality_score', 0) < 8")
+    assert first is second
+
+    assert first.evaluate({"quality_score": 3})
+    assert not first.evaluate({"quality_score": 9})
+    assert compile_condition("len(state['issues']) > max(1, 0)").evaluate({"issues": [1, 2]})
+
+
+def test_blocked_constructs_still_rejected():
+    condition = parse_condition("__import__('os')")
+    try:
+        condition.evaluate({})
+    except Exception:
+        pass
+    else:
+        raise AssertionError("__import__ should not be callable from a condition")
+
+
+def test_syntax_error_reported_at_validation():
+    graph = GraphDefinition(
+        nodes=[
+            NodeDefinition(id="a", tool="extract_functions"),
+            NodeDefinition(id="b", tool="check_complexity"),
+        ],
+        edges=[EdgeDefinition(from_node="a", to_node="b", condition="state['x'] <")],
+        start_node="a",
+    )
+    engine = WorkflowEngine(InMemoryStorage())
+    try:
+        asyncio.run(engine.validate_graph(graph))
+    except ValueError as e:
+        assert "a->b" in str(e)
+    else:
+        raise AssertionError("Malformed condition should fail validation")
+
+
+if __name__ == "__main__":
+    test_condition_is_parsed_once_and_shared()
+    test_blocked_constructs_still_rejected()
+    test_syntax_error_reported_at_validation()
+    print("=== ALL TESTS PASSED ===")
@@ -0,0 +1,217 @@
+"""Tests for delta-encoded execution logs."""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app.examples.code_review  # noqa: F401  (registers tools)
+from app.core.deltas import advance_baseline, delta_baseline, state_delta
+from app.core.engine import WorkflowEngine
+from app.core.persistence import PersistenceQueue
+from app.core.registry import ToolRegistry
+from app.core.storage import InMemoryStorage, SQLiteStorage
+from app.models.schemas import GraphDefinition, NodeDefinition, EdgeDefinition
+
+CODE = "def bad_code():\n    print('test')\n" + "    x = 1\n" * 2000
+
+
+def review_graph(log_mode: str) -> GraphDefinition:
+    return GraphDefinition(
+        nodes=[
+            NodeDefinition(id="extract", tool="extract_functions"),
+            NodeDefinition(id="complexity", tool="check_complexity"),
+            NodeDefinition(id="detect", tool="detect_issues"),
+            NodeDefinition(id="suggest", tool="suggest_improvements"),
+        ],
+        edges=[
+            EdgeDefinition(from_node="extract", to_node="complexity"),
+            EdgeDefinition(from_node="complexity", to_node="detect"),
+            EdgeDefinition(from_node="detect", to_node="suggest"),
+            EdgeDefinition(from_node="suggest", to_node="detect", condition="state.get('iteration', 0) < 12"),
+        ],
+        start_node="extract",
+        log_mode=log_mode,
+        log_snapshot_every=4,
+    )
+
+
+async def run_to_completion(engine: WorkflowEngine, graph: GraphDefinition) -> str:
+    graph_id = await engine.create_graph(graph)
+    run_id = await engine.start_run(graph_id, {"code": CODE})
+    for _ in range(200):
+        await asyncio.sleep(0.02)
+        run = await engine.storage.get_run(run_id)
+        if run.status in ("completed", "failed"):
+            break
+    assert run.status == "completed", run.message
+    return run_id
+
+
+GATE = {}
+
+
+@ToolRegistry.register("delta_test_append")
+async def delta_test_append(state, item: str = ""):
+    # Changes the state in place and returns nothing
+    state["items"].append(item)
+    state["seen"][item] = True
+
+
+@ToolRegistry.register("delta_test_gate")
+async def delta_test_gate(state):
+    await GATE["event"].wait()
+    state["items"].append("gate")
+
+
+def append_graph() -> GraphDefinition:
+    names = ["a", "b", "gate", "c"]
+    return GraphDefinition(
+        nodes=[
+            NodeDefinition(id=name, tool="delta_test_gate")
+            if name == "gate" else NodeDefinition(id=name, tool="delta_test_append", params={"item": name})
+            for name in names
+        ],
+        edges=[EdgeDefinition(from_node=a, to_node=b) for a, b in zip(names, names[1:])],
+        start_node="a",
+        log_mode="delta",
+        log_snapshot_every=100,
+    )
+
+
+def test_state_delta():
+    before = {"a": 1, "b": [1], "gone": True}
+    after = {"a": 1, "b": [1], "c": 3}
+    changed, removed = state_delta(before, after, returned={"a": 1})
+    assert changed == {"c": 3}
+    assert removed == ["gone"]
+
+    same_list = [1]
+    changed, removed = state_delta({"b": same_list}, {"b": same_list}, returned={"b": same_list})
+    assert changed == {"b": same_list}
+    before = {"a": 1, "b": [1], "gone": True}
+    changed, removed = state_delta(before, after)
+    assert removed == ["gone"]
+
+
+def test_advance_baseline_copies_only_changed_values():
+    state = {"a": 1, "items": [1], "big": list(range(1000)), "gone": True}
+    baseline = delta_baseline(state)
+    big = baseline["big"]
+    state["items"].append(2)
+    del state["gone"]
+    changed, removed = advance_baseline(baseline, state)
+    assert changed == {"items": [1, 2]} and removed == ["gone"]
+    assert baseline == state and baseline["big"] is big
+    state["items"].append(3)
+    assert changed["items"] == [1, 2] and baseline["items"] == [1, 2]
+
+
+def test_logged_deltas_keep_what_each_step_changed():
+    async def scenario():
+        storage = InMemoryStorage()
+        # Write-through: the stored steps are the engine's own objects
+        engine = WorkflowEngine(storage, persistence=PersistenceQueue(storage, mode="sync"))
+        names = list("abcd")
+        graph_id = await engine.create_graph(GraphDefinition(
+            nodes=[NodeDefinition(id=name, tool="delta_test_append", params={"item": name}) for name in names],
+            edges=[EdgeDefinition(from_node=a, to_node=b) for a, b in zip(names, names[1:])],
+            start_node="a",
+            log_mode="delta",
+            log_snapshot_every=3,
+        ))
+        run_id = await engine.start_run(graph_id, {"items": [], "seen": {}})
+        final = await engine.wait_for_run(run_id, timeout=5)
+        assert final.status == "completed"
+
+        compact = await storage.get_logs(run_id)
+        assert [s.output_state is not None for s in compact] == [True, False, False, True]
+        assert compact[0].output_state["items"] == ["a"]
+        assert [s.delta["items"] for s in compact[1:3]] == [["a", "b"], ["a", "b", "c"]]
+        assert compact[3].input_state["items"] == ["a", "b", "c"]
+        expanded = await storage.get_logs(run_id, expand=True)
+        assert [s.output_state["items"] for s in expanded] == [names[:i + 1] for i in range(4)]
+
+    asyncio.run(scenario())
+
+
+def test_delta_logs_expand_to_full_snapshots():
+    async def scenario(storage):
+        engine = WorkflowEngine(storage)
+        full_run = await run_to_completion(engine, review_graph("full"))
+        delta_run = await run_to_completion(engine, review_graph("delta"))
+
+        full_logs = await storage.get_logs(full_run)
+        compact = await storage.get_logs(delta_run)
+        expanded = await storage.get_logs(delta_run, expand=True)
+
+        assert len(full_logs) == len(compact) == len(expanded)
+        assert [s.step_index for s in compact] == list(range(len(compact)))
+        # Snapshots only every 4th step; the rest carry deltas
+        assert [s.output_state is not None for s in compact][:5] == [True, False, False, False, True]
+        for full, rebuilt in zip(full_logs, expanded):
+            assert full.node_id == rebuilt.node_id
+            assert full.input_state == rebuilt.input_state
+            assert full.output_state == rebuilt.output_state
+
+        compact_size = sum(len(s.model_dump_json(exclude_none=True)) for s in compact)
+        full_size = sum(len(s.model_dump_json(exclude_none=True)) for s in full_logs)
+        assert compact_size < full_size / 2
+
+    asyncio.run(scenario(InMemoryStorage()))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = SQLiteStorage(f"sqlite+aiosqlite:///{tmp}/workflow.db")
+
+        async def sqlite_scenario():
+            await storage.init_db()
+            await scenario(storage)
+            await storage.engine.dispose()
+
+        asyncio.run(sqlite_scenario())
+
+
+def test_in_place_changes_are_logged_and_resume_starts_with_a_snapshot():
+    async def scenario(storage):
+        GATE["event"] = asyncio.Event()
+        engine = WorkflowEngine(storage)
+        graph_id = await engine.create_graph(append_graph())
+        run_id = await engine.start_run(graph_id, {"items": [], "seen": {}})
+        while len(await storage.get_logs(run_id)) < 2:
+            await asyncio.sleep(0.01)
+        # Drop the engine mid-run, as if the process died, and resume elsewhere
+        await engine.scheduler.shutdown(timeout=0)
+        GATE["event"].set()
+        fresh = WorkflowEngine(storage)
+        assert await fresh.recover_runs() == [run_id]
+        final = await fresh.wait_for_run(run_id, timeout=2)
+        assert final.state == {"items": ["a", "b", "gate", "c"], "seen": {"a": True, "b": True, "c": True}}
+
+        compact = await storage.get_logs(run_id)
+        assert [(s.node_id, s.output_state is not None) for s in compact] == [
+            ("a", True), ("b", False), ("gate", True), ("c", False)
+        ]
+        assert compact[1].delta == {"items": ["a", "b"], "seen": {"a": True, "b": True}}
+        expanded = await storage.get_logs(run_id, expand=True)
+        assert expanded[-1].output_state == final.state
+
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = SQLiteStorage(f"sqlite+aiosqlite:///{tmp}/workflow.db")
+
+        async def sqlite_scenario():
+            await storage.init_db()
+            await scenario(storage)
+            await storage.engine.dispose()
+
+        asyncio.run(sqlite_scenario())
+
+
+if __name__ == "__main__":
+    test_state_delta()
+    test_advance_baseline_copies_only_changed_values()
+    test_logged_deltas_keep_what_each_step_changed()
+    test_delta_logs_expand_to_full_snapshots()
+    test_in_place_changes_are_logged_and_resume_starts_with_a_snapshot()
+    print("=== ALL TESTS PASSED ===")
@@ -0,0 +1,135 @@
+"""Tests for buffered WebSocket event delivery."""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from app.core.engine import WorkflowEngine
+from app.core.storage import InMemoryStorage
+from app.core.websocket_manager import ConnectionManager, RunEventBuffer, manager as ws_manager
+from app.main import app
+from app.models.schemas import GraphDefinition, NodeDefinition, EdgeDefinition
+
+GRAPH = {
+    "nodes": [
+        {"id": "extract", "tool": "extract_functions"},
+        {"id": "complexity", "tool": "check_complexity"},
+    ],
+    "edges": [{"from_node": "extract", "to_node": "complexity"}],
+    "start_node": "extract",
+}
+
+
+def test_ring_buffer_reports_gaps():
+    buffer = RunEventBuffer(maxlen=3)
+    for i in range(5):
+        buffer.append({"type": "log", "i": i})
+    entries, complete = buffer.since(3)
+    assert [e[0] for e in entries] == [4, 5] and complete
+    entries, complete = buffer.since(0)
+    assert [e[0] for e in entries] == [3, 4, 5] and not complete
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text):
+        self.sent.append(text)
+
+
+def test_buffers_bounded_by_tail_and_bytes():
+    async def scenario():
+        manager = ConnectionManager(buffer_size=64, tail_size=4, max_buffered_bytes=4000)
+        watcher = FakeWebSocket()
+        assert not await manager.connect(watcher, "watched")  # Nothing broadcast yet
+        for i in range(30):
+            for run_id in ("watched", "a", "b", "c"):
+                if i == 0:
+                    await manager.broadcast_status(run_id, "running")
+                await manager.broadcast_log(run_id, {"type": "log", "run_id": run_id, "data": "x" * 50, "i": i})
+
+        # Unwatched runs keep a short tail; the watched one keeps everything
+        assert all(len(manager.buffers[run_id].events) <= 4 for run_id in ("a", "b", "c") if run_id in manager.buffers)
+        assert len(manager.buffers["watched"].events) == 31 and len(watcher.sent) == 31
+        assert manager.buffered_bytes == sum(buffer.bytes for buffer in manager.buffers.values())
+
+        # Over the byte budget, unwatched runs go first
+        for i in range(30):
+            await manager.broadcast_log("d", {"type": "log", "run_id": "d", "data": "y" * 500, "i": i})
+        assert manager.buffered_bytes <= 4000
+        assert "watched" in manager.buffers and "a" not in manager.buffers
+        # A buffer recreated after eviction doesn't claim to hold the run's first events
+        await manager.broadcast_log("a", {"type": "log", "run_id": "a", "i": 30})
+        assert manager.buffers["a"].since(0) == ([manager.buffers["a"].events[0]], False)
+
+    asyncio.run(scenario())
+
+
+def test_unknown_run_gets_no_buffer():
+    with TestClient(app) as client:
+        try:
+            with client.websocket_connect("/graph/ws/run/no-such-run") as ws:
+                ws.receive_json()
+        except WebSocketDisconnect as e:
+            assert e.code == 1008
+        else:
+            raise AssertionError("connecting to an unknown run should be refused")
+        assert "no-such-run" not in ws_manager.buffers
+
+
+def test_late_subscriber_gets_replay():
+    with TestClient(app) as client:
+        graph_id = client.post("/graph/create", json=GRAPH).json()["graph_id"]
+        run_id = client.post("/graph/run", json={"graph_id": graph_id, "initial_state": {"code": "def a(): pass"}}).json()["run_id"]
+        for _ in range(100):
+            if client.get(f"/graph/state/{run_id}").json()["status"] == "completed":
+                break
+            time.sleep(0.01)
+
+        # Connect only after the run finished: every event is replayed in order
+        with client.websocket_connect(f"/graph/ws/run/{run_id}") as ws:
+            events = [ws.receive_json() for _ in range(4)]
+            greeting = ws.receive_json()
+        assert [e["seq"] for e in events] == [1, 2, 3, 4]
+        assert [e.get("status") or e["node_id"] for e in events] == ["running", "extract", "complexity", "completed"]
+        assert greeting["status"] == "completed" and "seq" not in greeting
+
+        # Reconnect resuming after seq 2
+        with client.websocket_connect(f"/graph/ws/run/{run_id}?last_seq=2") as ws:
+            assert ws.receive_json()["seq"] == 3
+
+
+def test_short_run_has_no_startup_delay():
+    async def scenario():
+        engine = WorkflowEngine(InMemoryStorage())
+        graph_id = await engine.create_graph(GraphDefinition(
+            nodes=[NodeDefinition(id="a", tool="passthrough"), NodeDefinition(id="b", tool="passthrough")],
+            edges=[EdgeDefinition(from_node="a", to_node="b")],
+            start_node="a",
+        ))
+        started = time.perf_counter()
+        run_id = await engine.start_run(graph_id, {})
+        await engine.scheduler.get_task(run_id)
+        elapsed = time.perf_counter() - started
+        assert (await engine.storage.get_run(run_id)).status == "completed"
+        assert elapsed < 0.05, elapsed
+
+    asyncio.run(scenario())
+
+
+if __name__ == "__main__":
+    test_ring_buffer_reports_gaps()
+    test_buffers_bounded_by_tail_and_bytes()
+    test_unknown_run_gets_no_buffer()
+    test_late_subscriber_gets_replay()
+    test_short_run_has_no_startup_delay()
+    print("=== ALL TESTS PASSED ===")
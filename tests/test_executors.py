@@ -0,0 +1,72 @@
+"""Tests for named executor pools."""
+import asyncio
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.executors import ExecutorPools
+from app.core.plan import compile_graph
+from app.core.registry import ToolRegistry
+from app.models.schemas import GraphDefinition, NodeDefinition
+
+
+@ToolRegistry.register("slow_io_tool", executor="io")
+def slow_io_tool(state):
+    return {}
+
+
+def test_pool_stats_and_isolation():
+    async def scenario():
+        pools = ExecutorPools()
+        pools.configure("io", 1, thread_name_prefix="io-worker")
+        release = threading.Event()
+        names = []
+
+        def blocking():
+            names.append(threading.current_thread().name)
+            release.wait(5)
+
+        slow = [pools.run("io", blocking) for _ in range(3)]
+        await asyncio.sleep(0.05)
+        assert pools.stats()["io"] == {"max_workers": 1, "active": 1, "queued": 2, "completed": 0}
+
+        # A saturated 'io' pool doesn't delay work on another pool
+        assert await asyncio.wait_for(pools.run("fast", lambda: 42), timeout=1) == 42
+
+        release.set()
+        await asyncio.gather(*slow)
+        assert pools.stats()["io"]["completed"] == 3
+        assert names[0].startswith("io-worker")
+        pools.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_configure_from_spec():
+    pools = ExecutorPools()
+    pools.configure_from_spec("io:8, cpu:2:cpu-thread")
+    assert pools.get("io").max_workers == 8
+    assert pools.get("cpu").max_workers == 2
+    try:
+        pools.configure_from_spec("broken")
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("invalid spec should be rejected")
+    pools.shutdown()
+
+
+def test_plan_carries_tool_pool():
+    plan = compile_graph("g", GraphDefinition(
+        nodes=[NodeDefinition(id="a", tool="slow_io_tool")], edges=[], start_node="a"
+    ))
+    assert plan.get_node("a").executor == "io"
+
+
+if __name__ == "__main__":
+    test_pool_stats_and_isolation()
+    test_configure_from_spec()
+    test_plan_carries_tool_pool()
+    print("=== ALL TESTS PASSED ===")
@@ -0,0 +1,152 @@
+"""Tests for fast_loop cycles."""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.engine import WorkflowEngine
+from app.core.metrics import TOOL_DURATION
+from app.core.persistence import PersistenceQueue
+from app.core.registry import ToolRegistry
+from app.core.storage import InMemoryStorage
+from app.models.schemas import GraphDefinition, NodeDefinition, EdgeDefinition
+
+
+@ToolRegistry.register("fast_loop_test_inc")
+async def fast_loop_test_inc(state):
+    return {"i": state.get("i", 0) + 1}
+
+
+@ToolRegistry.register("fast_loop_test_score")
+async def fast_loop_test_score(state):
+    return {"score": state["i"] * 2}
+
+
+def refine_graph(iterations: int, fast: bool, **graph) -> GraphDefinition:
+    return GraphDefinition(
+        nodes=[
+            NodeDefinition(id="inc", tool="fast_loop_test_inc", fast_loop=fast),
+            NodeDefinition(id="score", tool="fast_loop_test_score"),
+            NodeDefinition(id="done", tool="passthrough"),
+        ],
+        edges=[
+            EdgeDefinition(from_node="inc", to_node="score"),
+            EdgeDefinition(from_node="score", to_node="inc", condition=f"state['i'] < {iterations}"),
+            EdgeDefinition(from_node="score", to_node="done"),
+        ],
+        start_node="inc",
+        max_loops=iterations + 1,
+        **graph,
+    )
+
+
+async def timed_run(engine: WorkflowEngine, definition: GraphDefinition):
+    graph_id = await engine.create_graph(definition)
+    started = time.perf_counter()
+    final = await engine.wait_for_run(await engine.start_run(graph_id, {}), timeout=30)
+    return final, time.perf_counter() - started
+
+
+def test_fast_loop_logs_one_aggregated_step():
+    async def scenario():
+        engine = WorkflowEngine(InMemoryStorage())
+        observed = TOOL_DURATION.count("fast_loop_test_score")
+        final, _ = await timed_run(engine, refine_graph(50, fast=True, log_mode="delta"))
+        assert final.status == "completed" and final.state == {"i": 50, "score": 100}
+
+        logs = await engine.storage.get_logs(final.run_id)
+        assert [log.node_id for log in logs] == ["inc", "done"]
+        loop = logs[0].loop
+        assert loop["iterations"] == 50 and loop["exit_node"] == "done"
+        assert loop["nodes"]["inc"]["calls"] == 50 and loop["nodes"]["score"]["calls"] == 50
+        # Step 0 is a snapshot in delta mode; its output is the state at loop exit
+        assert logs[0].output_state == {"i": 50, "score": 100}
+        # Calls inside the loop still reach the tool duration metric
+        assert TOOL_DURATION.count("fast_loop_test_score") == observed + 50
+
+    asyncio.run(scenario())
+
+
+class CountingStorage(InMemoryStorage):
+    def __init__(self):
+        super().__init__()
+        self.writes = {"save_run": 0, "add_log": 0}
+
+    async def save_run(self, run):
+        self.writes["save_run"] += 1
+        await super().save_run(run)
+
+    async def add_log(self, log):
+        self.writes["add_log"] += 1
+        await super().add_log(log)
+
+
+def test_fast_loop_skips_per_iteration_writes():
+    async def scenario():
+        storage = CountingStorage()
+        # Write-through, so every write the engine makes reaches the storage
+        engine = WorkflowEngine(storage, persistence=PersistenceQueue(storage, mode="sync"))
+        final, _ = await timed_run(engine, refine_graph(100, fast=False))
+        assert final.status == "completed"
+        assert storage.writes == {"save_run": 203, "add_log": 201}
+
+        storage.writes = {"save_run": 0, "add_log": 0}
+        final, _ = await timed_run(engine, refine_graph(100, fast=True))
+        assert final.status == "completed" and final.state == {"i": 100, "score": 200}
+        # Created, running, after the loop, final; one log for the loop and one for 'done'
+        assert storage.writes == {"save_run": 4, "add_log": 2}
+        assert (await storage.get_logs(final.run_id))[0].loop["iterations"] == 100
+
+    asyncio.run(scenario())
+
+
+@ToolRegistry.register("fast_loop_test_pure_score", pure=True, inputs=["i"])
+async def fast_loop_test_pure_score(state):
+    return {"score": state["i"] * 2}
+
+
+def test_pure_tools_in_fast_loops_use_the_result_cache():
+    async def scenario():
+        engine = WorkflowEngine(InMemoryStorage())
+        definition = refine_graph(20, fast=True)
+        definition.nodes[1].tool = "fast_loop_test_pure_score"
+        for _ in range(2):
+            final, _ = await timed_run(engine, definition)
+            assert final.status == "completed" and final.state == {"i": 20, "score": 40}
+        stats = engine.cache.stats()["fast_loop_test_pure_score"]
+        assert stats["misses"] == 20 and stats["hits"] == 20
+
+    asyncio.run(scenario())
+
+
+def test_fast_loop_enforces_max_loops_and_rejects_bad_cycles():
+    async def scenario():
+        engine = WorkflowEngine(InMemoryStorage())
+        definition = refine_graph(50, fast=True)
+        definition.max_loops = 10
+        final, _ = await timed_run(engine, definition)
+        assert final.status == "failed" and "Max loops exceeded" in final.message
+
+        not_a_cycle = GraphDefinition(
+            nodes=[NodeDefinition(id="a", tool="passthrough", fast_loop=True), NodeDefinition(id="b", tool="passthrough")],
+            edges=[EdgeDefinition(from_node="a", to_node="b")],
+            start_node="a",
+        )
+        try:
+            await engine.create_graph(not_a_cycle)
+        except ValueError as e:
+            assert "not part of a cycle" in str(e)
+        else:
+            raise AssertionError("fast_loop outside a cycle should be rejected")
+
+    asyncio.run(scenario())
+
+
+if __name__ == "__main__":
+    test_fast_loop_logs_one_aggregated_step()
+    test_fast_loop_skips_per_iteration_writes()
+    test_pure_tools_in_fast_loops_use_the_result_cache()
+    test_fast_loop_enforces_max_loops_and_rejects_bad_cycles()
+    print("=== ALL TESTS PASSED ===")
@@ -0,0 +1,78 @@
+"""Tests for the HTTP load generator and its latency histograms."""
+import asyncio
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+from app.main import app
+from benchmarks.http_load import LatencyHistogram, LoadTest, compare, parse_args, parse_mix
+
+
+def test_histogram_percentiles_within_precision():
+    histogram, other = LatencyHistogram(), LatencyHistogram()
+    samples = [random.uniform(0.0001, 2.0) for _ in range(20000)]
+    for value in samples[:10000]:
+        histogram.record(value)
+    for value in samples[10000:]:
+        other.record(value)
+    histogram.merge(other)
+
+    ordered = sorted(samples)
+    assert histogram.count == len(samples)
+    for q in (50, 90, 99, 99.9):
+        exact = ordered[int(len(ordered) * q / 100) - 1] * 1e6
+        assert abs(histogram.value_at(q) - exact) / exact < 0.01, q
+    summary = histogram.summary()
+    assert summary["max_ms"] == int(max(samples) * 1e6) / 1000
+    assert set(summary) >= {"p50_ms", "p90_ms", "p99_ms", "p999_ms"}
+
+
+def test_mix_parsing_and_comparison():
+    assert parse_mix("run=1, state=3") == {"run": 1.0, "state": 3.0}
+    for bad in ("graph=1", "run=0"):
+        try:
+            parse_mix(bad)
+            assert False, bad
+        except ValueError:
+            pass
+
+    def report(rps, p99, error_rate):
+        entry = {"rps": rps, "p50_ms": 1.0, "p99_ms": p99, "error_rate": error_rate}
+        return {"endpoints": {"state": entry}, "total": entry, "run_completion": {"p50_ms": 5.0, "p99_ms": 9.0}}
+
+    rows = compare(report(950, 2.5, 0.01), report(1000, 2.0, 0.0), 0.10)
+    regressions = {(row["endpoint"], row["metric"]) for row in rows if row["regression"]}
+    assert regressions == {("state", "p99_ms"), ("state", "error_rate"), ("total", "p99_ms"), ("total", "error_rate")}
+
+
+def test_load_test_in_process():
+    async def scenario():
+        args = parse_args([
+            "--duration", "0.5", "--concurrency", "4", "--seed-runs", "3", "--size", "2",
+            "--mix", "run=1,state=1,logs=1", "--completion-sample", "1",
+        ])
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://load-test") as client:
+                report = await LoadTest(client, args).run()
+
+        endpoints = report["endpoints"]
+        assert {"run", "state", "logs", "state_poll"} <= set(endpoints)
+        assert all(entry["errors"] == 0 and entry["requests"] > 0 for entry in endpoints.values())
+        assert report["total"]["requests"] == sum(endpoints[name]["requests"] for name in ("run", "state", "logs"))
+        # Every run started was followed to completion
+        assert report["run_completion"]["count"] == endpoints["run"]["requests"]
+        assert report["run_completion"]["p50_ms"] >= endpoints["run"]["p50_ms"] / 2
+
+    asyncio.run(scenario())
+
+
+if __name__ == "__main__":
+    test_histogram_percentiles_within_precision()
+    test_mix_parsing_and_comparison()
+    test_load_test_in_process()
+    print("=== ALL TESTS PASSED ===")
@@ -0,0 +1,130 @@
+"""Tests for map nodes (one tool call per list item)."""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app.examples.code_review  # noqa: F401  (registers tools)
+from app.core.engine import WorkflowEngine
+from app.core.executors import process_pool
+from app.core.registry import ToolRegistry
+from app.core.storage import InMemoryStorage
+from app.models.schemas import GraphDefinition, NodeDefinition
+
+IN_FLIGHT = {"now": 0, "max": 0}
+
+
+@ToolRegistry.register("map_test_length")
+async def map_test_length(state, fail_on: str = ""):
+    IN_FLIGHT["now"] += 1
+    IN_FLIGHT["max"] = max(IN_FLIGHT["max"], IN_FLIGHT["now"])
+    try:
+        await asyncio.sleep(0.01)
+        if state["item"] == fail_on:
+            raise ValueError(f"can't measure {fail_on}")
+        return {"length": len(state["item"])}
+    finally:
+        IN_FLIGHT["now"] -= 1
+
+
+def map_graph(**node) -> GraphDefinition:
+    return GraphDefinition(nodes=[NodeDefinition(id="each", **node)], edges=[], start_node="each")
+
+
+async def run(engine: WorkflowEngine, definition: GraphDefinition, state):
+    graph_id = await engine.create_graph(definition)
+    return await engine.wait_for_run(await engine.start_run(graph_id, state), timeout=30)
+
+
+def test_map_collects_ordered_results_and_item_errors():
+    async def scenario():
+        IN_FLIGHT.update(now=0, max=0)
+        engine = WorkflowEngine(InMemoryStorage())
+        files = [f"file_{i}" + "x" * i for i in range(40)]
+        final = await run(
+            engine,
+            map_graph(tool="map_test_length", map_over="files", map_concurrency=4, params={"fail_on": files[7]}),
+            {"files": files},
+        )
+        assert final.status == "completed", final.message
+        results = final.state["files_results"]
+        assert results[7] is None
+        assert [r["length"] for i, r in enumerate(results) if i != 7] == [len(f) for i, f in enumerate(files) if i != 7]
+        assert final.state["files_results_errors"] == [{"index": 7, "error": f"can't measure {files[7]}"}]
+        assert IN_FLIGHT["max"] == 4
+        # The whole map is one step
+        assert [log.node_id for log in await engine.storage.get_logs(final.run_id)] == ["each"]
+
+    asyncio.run(scenario())
+
+
+def test_map_in_worker_processes():
+    async def scenario():
+        process_pool.configure(2)
+        engine = WorkflowEngine(InMemoryStorage())
+        sources = ["def f():\n    return 1", "x = 1", "def g(a, b):\n    return a + b"]
+        final = await run(
+            engine,
+            map_graph(tool="analyze_token_complexity", map_over="sources", map_item_key="code",
+                      map_output="scores", params={"rounds": 2}),
+            {"sources": sources},
+        )
+        assert final.status == "completed", final.message
+        assert len(final.state["scores"]) == 3 and final.state["scores_errors"] == []
+        assert all(isinstance(score["token_complexity"], int) for score in final.state["scores"])
+        process_pool.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_map_timeout_bounds_the_whole_node():
+    async def scenario():
+        engine = WorkflowEngine(InMemoryStorage())
+        # Each item takes about 10 ms, well inside the timeout; all twenty in a row don't
+        files = [f"file_{i}" for i in range(20)]
+        final = await run(
+            engine, map_graph(tool="map_test_length", map_over="files", map_concurrency=1, timeout_ms=100), {"files": files}
+        )
+        assert final.status == "failed"
+        assert final.message == "Node each timed out after 100 ms"
+
+        final = await run(
+            engine, map_graph(tool="map_test_length", map_over="files", map_concurrency=20, timeout_ms=1000), {"files": files}
+        )
+        assert final.status == "completed", final.message
+        assert final.state["files_results_errors"] == []
+
+    asyncio.run(scenario())
+
+
+def test_map_rejects_bad_input():
+    async def scenario():
+        engine = WorkflowEngine(InMemoryStorage())
+        final = await run(engine, map_graph(tool="map_test_length", map_over="files"), {"files": "not a list"})
+        assert final.status == "failed" and "is not a list" in final.message
+
+        # The item must reach tools that only receive their declared inputs
+        try:
+            await engine.create_graph(map_graph(tool="analyze_token_complexity", map_over="sources"))
+        except ValueError as e:
+            assert "doesn't declare 'item'" in str(e)
+        else:
+            raise AssertionError("a map item key outside the tool's inputs should be rejected")
+
+        try:
+            await engine.create_graph(map_graph(tool="map_test_length", execution="process"))
+        except ValueError as e:
+            assert "async tools cannot use execution='process'" in str(e)
+        else:
+            raise AssertionError("async tools can't be moved to a worker process")
+
+    asyncio.run(scenario())
+
+
+if __name__ == "__main__":
+    test_map_collects_ordered_results_and_item_errors()
+    test_map_in_worker_processes()
+    test_map_timeout_bounds_the_whole_node()
+    test_map_rejects_bad_input()
+    print("=== ALL TESTS PASSED ===")
@@ -0,0 +1,93 @@
+"""Tests for the Prometheus metrics endpoint."""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+
+from app.core.metrics import MetricsRegistry, RUNS_FINISHED, STORAGE_LATENCY, TOOL_DURATION
+from app.core.storage import InMemoryStorage
+from app.main import app
+from app.models.schemas import ExecutionStep, WorkflowState
+
+
+def test_histogram_and_counter_exposition():
+    registry = MetricsRegistry()
+    latency = registry.histogram("demo_seconds", "Demo latency.", ("op",), buckets=(0.1, 1.0))
+    total = registry.counter("demo_total", "Demo count.", ("op",))
+    depth = registry.gauge("demo_depth", "Demo depth.")
+    for value in (0.05, 0.5, 0.5, 3.0):
+        latency.observe(value, "read")
+    total.inc("read", amount=2)
+    depth.set_function(lambda: {(): 7})
+
+    lines = registry.render().splitlines()
+    assert "# TYPE demo_seconds histogram" in lines
+    # Buckets are cumulative and end with +Inf
+    assert 'demo_seconds_bucket{op="read",le="0.1"} 1' in lines
+    assert 'demo_seconds_bucket{op="read",le="1"} 3' in lines
+    assert 'demo_seconds_bucket{op="read",le="+Inf"} 4' in lines
+    assert 'demo_seconds_sum{op="read"} 4.05' in lines
+    assert 'demo_seconds_count{op="read"} 4' in lines
+    assert 'demo_total{op="read"} 2' in lines
+    assert "demo_depth 7" in lines
+
+
+def test_metrics_endpoint_reports_runs_tools_and_storage():
+    with TestClient(app) as client:
+        completed = RUNS_FINISHED.value("completed")
+        tool_calls = TOOL_DURATION.count("passthrough")
+        graph = {"nodes": [{"id": "n", "tool": "passthrough"}], "edges": [], "start_node": "n"}
+        graph_id = client.post("/graph/create", json=graph).json()["graph_id"]
+        run_id = client.post("/graph/run", json={"graph_id": graph_id}).json()["run_id"]
+        for _ in range(50):
+            if client.get(f"/graph/state/{run_id}").json()["status"] == "completed":
+                break
+            time.sleep(0.02)
+
+        resp = client.get("/metrics")
+        assert resp.status_code == 200 and resp.headers["content-type"].startswith("text/plain; version=0.0.4")
+        assert RUNS_FINISHED.value("completed") == completed + 1
+        assert TOOL_DURATION.count("passthrough") == tool_calls + 1
+        assert STORAGE_LATENCY.count("InMemoryStorage", "save_graph") >= 1
+        for name in (
+            "workflow_run_queue_wait_seconds_count", "workflow_runs_active", "workflow_runs_queued",
+            "workflow_websocket_connections", 'workflow_executor_queued{pool="process"}',
+            "workflow_websocket_broadcast_seconds_count",
+        ):
+            assert name in resp.text, name
+
+
+class MetricsTestStorage(InMemoryStorage):
+    async def save_run(self, run):
+        await super().save_run(run)
+
+
+def test_nested_storage_calls_are_timed_once():
+    async def scenario():
+        storage = MetricsTestStorage()
+        series = [(backend, method) for backend in ("MetricsTestStorage", "InMemoryStorage") for method in ("write_batch", "save_run", "add_logs", "add_log")]
+        before = {key: STORAGE_LATENCY.count(*key) for key in series}
+        # The default write_batch calls save_run and add_logs, which call add_log.
+        # Inherited, it keeps the label of the class that wrapped it.
+        await storage.write_batch(
+            [WorkflowState(run_id="r", graph_id="g")], [ExecutionStep(run_id="r", node_id="a")]
+        )
+        # An override calling super() is one operation too
+        await storage.save_run(WorkflowState(run_id="r", graph_id="g"))
+        timed = {key: STORAGE_LATENCY.count(*key) - before[key] for key in series}
+        assert {key: n for key, n in timed.items() if n} == {
+            ("InMemoryStorage", "write_batch"): 1, ("MetricsTestStorage", "save_run"): 1,
+        }
+
+    asyncio.run(scenario())
+
+
+if __name__ == "__main__":
+    test_histogram_and_counter_exposition()
+    test_metrics_endpoint_reports_runs_tools_and_storage()
+    test_nested_storage_calls_are_timed_once()
+    print("=== ALL TESTS PASSED ===")
@@ -0,0 +1,105 @@
+"""Tests for parallel fan-out / fan-in execution."""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.engine import WorkflowEngine
+from app.core.parallel import merge_branches, MergeConflictError
+from app.core.registry import ToolRegistry
+from app.core.storage import InMemoryStorage
+from app.models.schemas import GraphDefinition, NodeDefinition, EdgeDefinition
+
+
+@ToolRegistry.register("test_slow_set")
+async def slow_set(state, key: str, value, delay: float = 0.2):
+    await asyncio.sleep(delay)
+    return {key: value}
+
+
+def fan_graph(left: dict, right: dict, merge_policy: str = "error") -> GraphDefinition:
+    return GraphDefinition(
+        nodes=[
+            NodeDefinition(id="start", tool="passthrough", fan_out=True),
+            NodeDefinition(id="left", tool="test_slow_set", params=left),
+            NodeDefinition(id="right", tool="test_slow_set", params=right),
+            NodeDefinition(id="join", tool="passthrough", join=True, merge_policy=merge_policy),
+            NodeDefinition(id="after", tool="test_slow_set", params={"key": "done", "value": True, "delay": 0}),
+        ],
+        edges=[
+            EdgeDefinition(from_node="start", to_node="left"),
+            EdgeDefinition(from_node="start", to_node="right"),
+            EdgeDefinition(from_node="left", to_node="join"),
+            EdgeDefinition(from_node="right", to_node="join"),
+            EdgeDefinition(from_node="join", to_node="after"),
+        ],
+        start_node="start",
+        log_mode="delta",
+    )
+
+
+async def run_graph(graph: GraphDefinition):
+    engine = WorkflowEngine(InMemoryStorage())
+    graph_id = await engine.create_graph(graph)
+    run_id = await engine.start_run(graph_id, {"seed": 1})
+    while True:
+        await asyncio.sleep(0.01)
+        run = await engine.storage.get_run(run_id)
+        if run.status in ("completed", "failed"):
+            return run, await engine.storage.get_logs(run_id, expand=True)
+
+
+def test_branches_run_concurrently_and_merge():
+    async def scenario():
+        run, logs = await run_graph(fan_graph(
+            {"key": "complexity", "value": 3},
+            {"key": "issues", "value": ["long"]},
+        ))
+        assert run.status == "completed", run.message
+        assert run.state == {"seed": 1, "complexity": 3, "issues": ["long"], "done": True}
+        by_node = {log.node_id: log for log in logs}
+        assert sorted(by_node) == ["after", "join", "left", "right", "start"]
+        # Two 200 ms branches should take ~200 ms between fan-out and join, not ~400 ms
+        elapsed = (by_node["join"].timestamp - by_node["start"].timestamp).total_seconds()
+        assert elapsed < 0.35, elapsed
+        assert logs[-1].output_state == run.state
+
+    asyncio.run(scenario())
+
+
+def test_conflicting_branches():
+    async def scenario():
+        left = {"key": "score", "value": 1, "delay": 0.05}
+        right = {"key": "score", "value": 2, "delay": 0.01}
+
+        run, _ = await run_graph(fan_graph(left, right))
+        assert run.status == "failed" and "score" in run.message
+
+        run, _ = await run_graph(fan_graph(left, right, merge_policy="first_wins"))
+        assert run.state["score"] == 1
+        run, _ = await run_graph(fan_graph(left, right, merge_policy="last_wins"))
+        assert run.state["score"] == 2
+        run, _ = await run_graph(fan_graph(left, right, merge_policy="collect"))
+        assert run.state["score"] == [1, 2]
+
+    asyncio.run(scenario())
+
+
+def test_merge_branches_removals():
+    fork = {"a": 1, "b": 2}
+    changed, removed = merge_branches(fork, [{"a": 1}, {"a": 1, "b": 2, "c": 3}], ["x", "y"])
+    assert changed == {"c": 3} and removed == ["b"]
+    try:
+        merge_branches(fork, [{"a": 5, "b": 2}, {"b": 2}], ["x", "y"])
+    except MergeConflictError:
+        pass
+    else:
+        raise AssertionError("set vs. remove should conflict")
+
+
+if __name__ == "__main__":
+    test_branches_run_concurrently_and_merge()
+    test_conflicting_branches()
+    test_merge_branches_removals()
+    print("=== ALL TESTS PASSED ===")
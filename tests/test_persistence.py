@@ -0,0 +1,201 @@
+"""Tests for the write-behind persistence queue."""
+import asyncio
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.engine import WorkflowEngine
+from app.core.persistence import PersistenceQueue
+from app.core.registry import ToolRegistry
+from app.core.storage import InMemoryStorage, SQLiteStorage
+from app.models.schemas import GraphDefinition, NodeDefinition, EdgeDefinition, WorkflowState, ExecutionStep
+
+
+class CountingStorage(InMemoryStorage):
+    def __init__(self):
+        super().__init__()
+        self.batches = 0
+        self.direct_writes = 0
+        self._in_batch = False
+
+    async def add_log(self, log):
+        self.direct_writes += not self._in_batch
+        await super().add_log(log)
+
+    async def write_batch(self, runs, logs):
+        self.batches += 1
+        self._in_batch = True
+        try:
+            await super().write_batch(runs, logs)
+        finally:
+            self._in_batch = False
+
+
+class FlakyStorage(InMemoryStorage):
+    """Fails its first `failures` batch writes."""
+
+    def __init__(self, failures: int):
+        super().__init__()
+        self.failures = failures
+
+    async def write_batch(self, runs, logs):
+        if self.failures:
+            self.failures -= 1
+            raise OSError("disk unavailable")
+        await super().write_batch(runs, logs)
+
+
+@ToolRegistry.register("persistence_test_append")
+async def persistence_test_append(state):
+    # Changes the list in place and returns nothing
+    state.setdefault("items", []).append(state["next"].pop(0))
+    return {}
+
+
+def chain_graph(length: int) -> GraphDefinition:
+    return GraphDefinition(
+        nodes=[NodeDefinition(id=f"n{i}", tool="passthrough") for i in range(length)],
+        edges=[EdgeDefinition(from_node=f"n{i}", to_node=f"n{i + 1}") for i in range(length - 1)],
+        start_node="n0",
+    )
+
+
+def test_batched_mode_groups_writes_and_flushes_on_finish():
+    async def scenario():
+        storage = CountingStorage()
+        engine = WorkflowEngine(storage, persistence=PersistenceQueue(storage, mode="batched", flush_interval=1.0))
+        graph_id = await engine.create_graph(chain_graph(20))
+        run_ids = [await engine.start_run(graph_id, {"i": i}) for i in range(5)]
+        for run_id in run_ids:
+            final = await engine.wait_for_run(run_id, timeout=2)
+            assert final.status == "completed"
+            # The terminal state and every log are durable once the run is reported finished
+            assert (await storage.get_run(run_id)).status == "completed"
+            assert [log.node_id for log in await storage.get_logs(run_id)] == [f"n{i}" for i in range(20)]
+        assert storage.direct_writes == 0
+        assert storage.batches < 10
+        assert engine.persistence.stats()["pending"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_none_mode_reads_queued_state_until_flushed():
+    async def scenario():
+        storage = InMemoryStorage()
+        queue = PersistenceQueue(storage, mode="none", flush_interval=10)
+        run = WorkflowState(run_id="r1", graph_id="g", status="running", state={"a": 1})
+        await queue.save_run(run, final=True)
+        run.state["a"] = 2  # the queue holds a snapshot
+        assert await storage.get_run("r1") is None
+        assert (await queue.get_run("r1")).state == {"a": 1}
+        await queue.close()
+        assert (await storage.get_run("r1")).state == {"a": 1}
+
+    asyncio.run(scenario())
+
+
+def test_sqlite_write_batch_upserts_in_one_transaction():
+    async def scenario():
+        with tempfile.TemporaryDirectory() as directory:
+            storage = SQLiteStorage(f"sqlite+aiosqlite:///{directory}/wb.db")
+            await storage.init_db()
+            await storage.save_run(WorkflowState(run_id="old", graph_id="g"))
+            await storage.write_batch(
+                [
+                    WorkflowState(run_id="old", graph_id="g", status="completed", state={"x": 1}),
+                    WorkflowState(run_id="new", graph_id="g", status="running"),
+                ],
+                [ExecutionStep(run_id="old", node_id="a", step_index=0), ExecutionStep(run_id="old", node_id="b", step_index=1)],
+            )
+            old = await storage.get_run("old")
+            assert old.status == "completed" and old.state == {"x": 1}
+            assert (await storage.get_run("new")).status == "running"
+            assert [log.node_id for log in await storage.get_logs("old")] == ["a", "b"]
+            await storage.engine.dispose()
+
+    asyncio.run(scenario())
+
+
+def test_queued_writes_keep_what_each_step_produced():
+    async def scenario():
+        with tempfile.TemporaryDirectory() as directory:
+            storage = SQLiteStorage(f"sqlite+aiosqlite:///{directory}/steps.db")
+            await storage.init_db()
+            engine = WorkflowEngine(storage, persistence=PersistenceQueue(storage, mode="batched", flush_interval=1.0))
+            graph_id = await engine.create_graph(GraphDefinition(
+                nodes=[NodeDefinition(id=n, tool="persistence_test_append") for n in "abcd"],
+                edges=[EdgeDefinition(from_node=a, to_node=b) for a, b in ["ab", "bc", "cd"]],
+                start_node="a",
+            ))
+            run_id = await engine.start_run(graph_id, {"next": list("abcd")})
+            assert (await engine.wait_for_run(run_id, timeout=5)).status == "completed"
+            logs = await storage.get_logs(run_id)
+            assert [log.output_state["items"] for log in logs] == [["a"], ["a", "b"], ["a", "b", "c"], ["a", "b", "c", "d"]]
+
+            # Checkpointed states too
+            queue = PersistenceQueue(storage, mode="none", flush_interval=10)
+            run = WorkflowState(run_id="r1", graph_id="g", status="running", state={"items": ["a"]})
+            await queue.save_run(run)
+            run.state["items"].append("b")
+            await queue.close()
+            assert (await storage.get_run("r1")).state == {"items": ["a"]}
+            await engine.persistence.close()
+            await storage.engine.dispose()
+
+    asyncio.run(scenario())
+
+
+def test_failed_batches_are_retried_and_reported_to_final_writes():
+    async def scenario():
+        storage = FlakyStorage(failures=2)
+        queue = PersistenceQueue(storage, mode="batched", flush_interval=0.01)
+        await queue.add_log(ExecutionStep(run_id="r1", node_id="a"))
+        await queue.save_run(WorkflowState(run_id="r1", graph_id="g", status="running", state={"step": 1}))
+        try:
+            await queue.save_run(WorkflowState(run_id="r1", graph_id="g", status="completed", state={"step": 2}), final=True)
+        except OSError:
+            pass
+        else:
+            raise AssertionError("a failed final write should be raised")
+        # Kept and retried in the background, the newest state winning
+        for _ in range(100):
+            if not queue.stats()["pending"]:
+                break
+            await asyncio.sleep(0.01)
+        run = await storage.get_run("r1")
+        assert run.status == "completed" and run.state == {"step": 2}
+        assert [log.node_id for log in await storage.get_logs("r1")] == ["a"]
+        assert queue.stats()["errors"] == 2 and queue.stats()["dropped"] == 0
+
+        # A batch that keeps failing is eventually dropped, and counted
+        storage.failures = 100
+        queue.max_attempts = 3
+        await queue.add_log(ExecutionStep(run_id="r2", node_id="a"))
+        for _ in range(200):
+            if queue.stats()["dropped"]:
+                break
+            await asyncio.sleep(0.01)
+        assert queue.stats()["dropped"] == 1 and queue.stats()["pending"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_unknown_mode_rejected():
+    try:
+        PersistenceQueue(InMemoryStorage(), mode="eventually")
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("unknown durability mode should be rejected")
+
+
+if __name__ == "__main__":
+    test_batched_mode_groups_writes_and_flushes_on_finish()
+    test_none_mode_reads_queued_state_until_flushed()
+    test_sqlite_write_batch_upserts_in_one_transaction()
+    test_queued_writes_keep_what_each_step_produced()
+    test_failed_batches_are_retried_and_reported_to_final_writes()
+    test_unknown_mode_rejected()
+    print("=== ALL TESTS PASSED ===")
@@ -0,0 +1,63 @@
+"""Tests for compiled execution plans."""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app.examples.code_review  # noqa: F401  (registers tools)
+from app.core.engine import WorkflowEngine
+from app.core.plan import compile_graph
+from app.core.storage import InMemoryStorage
+from app.models.schemas import GraphDefinition, NodeDefinition, EdgeDefinition
+
+
+def review_graph() -> GraphDefinition:
+    return GraphDefinition(
+        nodes=[
+            NodeDefinition(id="extract", tool="extract_functions"),
+            NodeDefinition(id="detect", tool="detect_issues"),
+            NodeDefinition(id="suggest", tool="suggest_improvements"),
+        ],
+        edges=[
+            EdgeDefinition(from_node="extract", to_node="detect"),
+            EdgeDefinition(from_node="detect", to_node="suggest"),
+            EdgeDefinition(from_node="suggest", to_node="detect", condition="state.get('quality_score', 0) < 8"),
+            EdgeDefinition(from_node="suggest", to_node="extract"),
+        ],
+        start_node="extract",
+    )
+
+
+def test_compile_graph_indexes_nodes_and_edges():
+    plan = compile_graph("g1", review_graph())
+
+    assert plan.start_node == "extract"
+    assert set(plan.nodes) == {"extract", "detect", "suggest"}
+    suggest = plan.get_node("suggest")
+    assert suggest.tool_name == "suggest_improvements"
+    assert suggest.is_async is False
+    # Adjacency keeps declaration order so routing semantics are unchanged
+    assert [e.to_node for e in suggest.edges] == ["detect", "extract"]
+    assert plan.get_node("missing") is None
+
+
+def test_create_graph_caches_plan():
+    async def scenario():
+        engine = WorkflowEngine(InMemoryStorage())
+        graph_id = await engine.create_graph(review_graph())
+        assert graph_id in engine.plans
+
+        # A fresh engine over the same storage compiles lazily on first use
+        other = WorkflowEngine(engine.storage)
+        plan = await other.get_plan(graph_id)
+        assert plan is not None and other.plans[graph_id] is plan
+        assert await other.get_plan("unknown") is None
+
+    asyncio.run(scenario())
+
+
+if __name__ == "__main__":
+    test_compile_graph_indexes_nodes_and_edges()
+    test_create_graph_caches_plan()
+    print("=== ALL TESTS PASSED ===")
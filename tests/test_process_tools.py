@@ -0,0 +1,61 @@
+"""Tests for process-pool tool execution."""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app.examples.code_review  # noqa: F401  (registers tools)
+from app.core.engine import WorkflowEngine
+from app.core.executors import process_pool
+from app.core.registry import ToolRegistry
+from app.core.storage import InMemoryStorage
+from app.models.schemas import GraphDefinition, NodeDefinition
+
+
+def test_process_tool_runs_with_declared_inputs_only():
+    async def scenario():
+        process_pool.configure(1)
+        engine = WorkflowEngine(InMemoryStorage())
+        graph_id = await engine.create_graph(GraphDefinition(
+            nodes=[NodeDefinition(id="analyze", tool="analyze_token_complexity", params={"rounds": 3})],
+            edges=[],
+            start_node="analyze",
+        ))
+        plan = await engine.get_plan(graph_id)
+        node = plan.get_node("analyze")
+        assert node.execution == "process" and node.inputs == ("code",)
+        # Un-picklable keys the tool doesn't read never leave the process
+        assert engine._tool_inputs(node, {"code": "x", "lock": asyncio.Lock()}) == {"code": "x"}
+
+        run_id = await engine.start_run(graph_id, {"code": "def f():\n    return 1", "note": "kept"})
+        for _ in range(300):
+            await asyncio.sleep(0.05)
+            run = await engine.storage.get_run(run_id)
+            if run.status in ("completed", "failed"):
+                break
+        assert run.status == "completed", run.message
+        assert isinstance(run.state["token_complexity"], int)
+        assert run.state["note"] == "kept"
+        assert process_pool.stats()["completed"] >= 1
+        process_pool.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_process_mode_rejects_unimportable_tools():
+    def local_tool(state):
+        return {}
+
+    try:
+        ToolRegistry.register("bad_process_tool", execution="process")(local_tool)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("nested functions can't be imported by worker processes")
+
+
+if __name__ == "__main__":
+    test_process_tool_runs_with_declared_inputs_only()
+    test_process_mode_rejects_unimportable_tools()
+    print("=== ALL TESTS PASSED ===")
@@ -0,0 +1,185 @@
+"""Tests for on-demand profiling of tool calls."""
+import asyncio
+import os
+import pstats
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+
+import app.examples.code_review  # noqa: F401  (registers tools)
+from app.core.engine import WorkflowEngine
+from app.core.executors import process_pool
+from app.core import profiling
+from app.core.profiling import ProfileStore, RunProfiler
+from app.core.registry import ToolRegistry
+from app.core.storage import InMemoryStorage
+from app.main import app
+from app.models.schemas import GraphDefinition, NodeDefinition, EdgeDefinition
+
+
+def profile_test_crunch(n: int) -> int:
+    return sum(i * i for i in range(n))
+
+
+def profile_test_bystander(n: int) -> int:
+    return sum(i for i in range(n))
+
+
+@ToolRegistry.register("profile_test_async")
+async def profile_test_async(state):
+    first = profile_test_crunch(20000)
+    await asyncio.sleep(0.02)
+    return {"async_total": first + profile_test_crunch(20000)}
+
+
+@ToolRegistry.register("profile_test_sync")
+def profile_test_sync(state):
+    return {"sync_total": profile_test_crunch(30000)}
+
+
+def profiled_graph() -> GraphDefinition:
+    return GraphDefinition(
+        nodes=[
+            NodeDefinition(id="async_node", tool="profile_test_async"),
+            NodeDefinition(id="sync_node", tool="profile_test_sync"),
+            NodeDefinition(id="process_node", tool="analyze_token_complexity", params={"rounds": 5}),
+        ],
+        edges=[
+            EdgeDefinition(from_node="async_node", to_node="sync_node"),
+            EdgeDefinition(from_node="sync_node", to_node="process_node"),
+        ],
+        start_node="async_node",
+    )
+
+
+def test_profiles_async_thread_and_process_tools():
+    async def scenario(directory):
+        process_pool.configure(1)
+        engine = WorkflowEngine(InMemoryStorage(), profiles=ProfileStore(directory))
+        graph_id = await engine.create_graph(profiled_graph())
+
+        async def bystander():
+            # Runs on the loop while the async tool sleeps; must not be charged to it
+            await asyncio.sleep(0.005)
+            profile_test_bystander(50000)
+
+        run_id = await engine.start_run(graph_id, {"code": "def f(a):\n    return a * 2"}, profile=True)
+        await bystander()
+        final = await engine.wait_for_run(run_id, timeout=30)
+        assert final.status == "completed", final.message
+        process_pool.shutdown()
+
+        summary = engine.profiles.get_summary(run_id)
+        assert set(summary["nodes"]) == {"async_node", "sync_node", "process_node"}
+        assert all(node["calls"] == 1 for node in summary["nodes"].values())
+        async_functions = [f["function"] for f in summary["nodes"]["async_node"]["top_functions"]]
+        assert any("profile_test_crunch" in name for name in async_functions)
+        assert not any("profile_test_bystander" in name for name in async_functions)
+
+        # The pstats artifact covers every node, including what ran in the worker process
+        stats = pstats.Stats(engine.profiles.path(run_id, "pstats"))
+        profiled = {func[2] for func in stats.stats}
+        assert {"profile_test_crunch", "analyze_token_complexity"} <= profiled
+        with open(engine.profiles.path(run_id, "collapsed")) as f:
+            lines = f.read().splitlines()
+        assert any(line.startswith("sync_node;") and "profile_test_crunch" in line for line in lines)
+        assert all(int(line.rsplit(" ", 1)[1]) > 0 for line in lines)
+
+    with tempfile.TemporaryDirectory() as directory:
+        asyncio.run(scenario(directory))
+
+
+def test_unprofiled_runs_write_nothing():
+    async def scenario(directory):
+        engine = WorkflowEngine(InMemoryStorage(), profiles=ProfileStore(directory))
+        graph_id = await engine.create_graph(
+            GraphDefinition(nodes=[NodeDefinition(id="n", tool="profile_test_sync")], edges=[], start_node="n")
+        )
+        run_id = await engine.start_run(graph_id, {})
+        assert (await engine.wait_for_run(run_id, timeout=5)).status == "completed"
+        assert engine.profiles.get_summary(run_id) is None and os.listdir(directory) == []
+
+    with tempfile.TemporaryDirectory() as directory:
+        asyncio.run(scenario(directory))
+
+
+def test_concurrent_profiled_runs_share_one_profiler():
+    async def scenario(directory):
+        # The slot Python 3.12+ uses: one profiler active in the interpreter
+        default_slot, profiling._slot = profiling._slot, profiling._ProfilerSlot(exclusive=True)
+        try:
+            engine = WorkflowEngine(InMemoryStorage(), profiles=ProfileStore(directory))
+            graph_id = await engine.create_graph(GraphDefinition(
+                nodes=[
+                    NodeDefinition(id="async_node", tool="profile_test_async"),
+                    NodeDefinition(id="sync_node", tool="profile_test_sync"),
+                ],
+                edges=[EdgeDefinition(from_node="async_node", to_node="sync_node")],
+                start_node="async_node",
+            ))
+            run_ids = [await engine.start_run(graph_id, {}, profile=True) for _ in range(4)]
+            finals = [await engine.wait_for_run(run_id, timeout=10) for run_id in run_ids]
+            assert all(final.status == "completed" for final in finals), [final.message for final in finals]
+            for run_id in run_ids:
+                nodes = engine.profiles.get_summary(run_id)["nodes"]
+                assert all(node["calls"] == 1 for node in nodes.values())
+
+            # Another profiler holds the slot: calls run unprofiled and are counted
+            held = profiling.cProfile.Profile()
+            assert profiling._slot.enable(held)
+            try:
+                run_id = await engine.start_run(graph_id, {}, profile=True)
+                assert (await engine.wait_for_run(run_id, timeout=10)).status == "completed"
+            finally:
+                profiling._slot.disable(held)
+            nodes = engine.profiles.get_summary(run_id)["nodes"]
+            assert all(node["unprofiled_calls"] == 1 and node["top_functions"] == [] for node in nodes.values())
+        finally:
+            profiling._slot = default_slot
+
+    with tempfile.TemporaryDirectory() as directory:
+        asyncio.run(scenario(directory))
+
+
+def test_store_keeps_the_newest_runs():
+    with tempfile.TemporaryDirectory() as directory:
+        store = ProfileStore(directory, max_runs=2)
+        now = time.time()
+        for age, run_id in [(2, "oldest"), (1, "older"), (0, "newest")]:
+            profiler = RunProfiler(run_id)
+            profiler.add("n", 0.001, None, complete=False)
+            store.save(profiler)
+            os.utime(store.path(run_id, "json"), (now - age * 60, now - age * 60))
+        assert store.get_summary("newest") and store.get_summary("older")
+        assert store.get_summary("oldest") is None
+        assert sorted(os.listdir(directory)) == ["newest.collapsed", "newest.json", "older.collapsed", "older.json"]
+
+
+def test_profile_endpoints():
+    with tempfile.TemporaryDirectory() as directory, TestClient(app) as client:
+        from app.api.routes import get_engine
+        get_engine().profiles.configure(directory)
+        graph = {"nodes": [{"id": "n", "tool": "profile_test_sync"}], "edges": [], "start_node": "n"}
+        graph_id = client.post("/graph/create", json=graph).json()["graph_id"]
+        run_id = client.post("/graph/run?wait=true&profile=true", json={"graph_id": graph_id}).json()["run_id"]
+
+        assert client.get(f"/graph/profile/{run_id}").json()["nodes"]["n"]["calls"] == 1
+        collapsed = client.get(f"/graph/profile/{run_id}/collapsed")
+        assert collapsed.status_code == 200 and "profile_test_crunch" in collapsed.text
+        assert client.get(f"/graph/profile/{run_id}/pstats").status_code == 200
+        assert client.get(f"/graph/profile/{run_id}/other").status_code == 404
+        assert client.get("/graph/profile/missing").status_code == 404
+        get_engine().profiles.configure(None)
+
+
+if __name__ == "__main__":
+    test_profiles_async_thread_and_process_tools()
+    test_unprofiled_runs_write_nothing()
+    test_concurrent_profiled_runs_share_one_profiler()
+    test_store_keeps_the_newest_runs()
+    test_profile_endpoints()
+    print("=== ALL TESTS PASSED ===")
@@ -0,0 +1,166 @@
+"""Tests for resuming runs left behind by a previous process."""
+import asyncio
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.engine import WorkflowEngine
+from app.core.persistence import PersistenceQueue
+from app.core.registry import ToolRegistry
+from app.core.storage import SQLiteStorage
+from app.models.schemas import GraphDefinition, NodeDefinition, EdgeDefinition
+
+CALLS = []
+GATE = {}
+
+
+@ToolRegistry.register("recovery_test_step")
+async def recovery_test_step(state, name: str = ""):
+    CALLS.append(name)
+    return {name: True}
+
+
+@ToolRegistry.register("recovery_test_gate")
+async def recovery_test_gate(state):
+    CALLS.append("gate")
+    await GATE["event"].wait()
+    return {"gate": True}
+
+
+@ToolRegistry.register("recovery_test_pure_gate", pure=True, inputs=["a"])
+async def recovery_test_pure_gate(state):
+    CALLS.append("pure_gate")
+    await GATE["event"].wait()
+    return {"gate": True}
+
+
+def gated_graph(gate_tool: str) -> GraphDefinition:
+    # No intermediate checkpoints: only the logs say how far the run got
+    return GraphDefinition(
+        nodes=[
+            NodeDefinition(id="a", tool="recovery_test_step", params={"name": "a"}),
+            NodeDefinition(id="gate", tool=gate_tool),
+            NodeDefinition(id="c", tool="recovery_test_step", params={"name": "c"}),
+        ],
+        edges=[EdgeDefinition(from_node="a", to_node="gate"), EdgeDefinition(from_node="gate", to_node="c")],
+        start_node="a",
+        checkpoint_policy="terminal",
+    )
+
+
+async def crash_mid_run(storage, gate_tool: str, mark_running: bool = True):
+    """Starts a run, lets it block in the gate node, then drops the engine as if the process died."""
+    CALLS.clear()
+    GATE["event"] = asyncio.Event()
+    engine = WorkflowEngine(storage, persistence=PersistenceQueue(storage, mode="sync"))
+    graph_id = await engine.create_graph(gated_graph(gate_tool))
+    run_id = await engine.start_run(graph_id, {"x": 1})
+    await asyncio.sleep(0.05)
+    if mark_running:
+        # Mark it running the way an older checkpoint would have
+        run = await storage.get_run(run_id)
+        run.status = "running"
+        await storage.save_run(run)
+    await engine.scheduler.shutdown(timeout=0)
+    assert (await storage.get_run(run_id)).status == ("running" if mark_running else "pending")
+    return run_id
+
+
+def with_storage(scenario):
+    async def wrapper():
+        with tempfile.TemporaryDirectory() as directory:
+            storage = SQLiteStorage(f"sqlite+aiosqlite:///{directory}/recovery.db")
+            await storage.init_db()
+            try:
+                await scenario(storage)
+            finally:
+                await storage.engine.dispose()
+    asyncio.run(wrapper())
+
+
+def test_at_least_once_resumes_after_last_logged_node():
+    async def scenario(storage):
+        run_id = await crash_mid_run(storage, "recovery_test_gate")
+        assert CALLS == ["a", "gate"]
+
+        engine = WorkflowEngine(storage)
+        GATE["event"].set()
+        assert await engine.recover_runs("at_least_once") == [run_id]
+        final = await engine.wait_for_run(run_id, timeout=2)
+        assert final.status == "completed"
+        assert final.state == {"x": 1, "a": True, "gate": True, "c": True}
+        # 'a' was logged as done, so only the interrupted node runs again
+        assert CALLS == ["a", "gate", "gate", "c"]
+        logs = await storage.get_logs(run_id)
+        assert [(log.node_id, log.step_index) for log in logs] == [("a", 0), ("gate", 1), ("c", 2)]
+
+    with_storage(scenario)
+
+
+def test_pending_run_with_logged_steps_resumes_after_them():
+    async def scenario(storage):
+        # The terminal policy never saves the "running" status, so the stored
+        # run stays pending while its steps are logged
+        run_id = await crash_mid_run(storage, "recovery_test_gate", mark_running=False)
+        assert CALLS == ["a", "gate"]
+
+        engine = WorkflowEngine(storage)
+        GATE["event"].set()
+        assert await engine.recover_runs("at_least_once") == [run_id]
+        final = await engine.wait_for_run(run_id, timeout=2)
+        assert final.status == "completed"
+        assert CALLS == ["a", "gate", "gate", "c"]
+        logs = await storage.get_logs(run_id)
+        assert [(log.node_id, log.step_index) for log in logs] == [("a", 0), ("gate", 1), ("c", 2)]
+
+        failed = await crash_mid_run(storage, "recovery_test_gate", mark_running=False)
+        assert await engine.recover_runs("at_most_once") == []
+        assert (await storage.get_run(failed)).status == "failed"
+
+    with_storage(scenario)
+
+
+def test_at_most_once_fails_unless_next_node_is_pure():
+    async def scenario(storage):
+        run_id = await crash_mid_run(storage, "recovery_test_gate")
+        engine = WorkflowEngine(storage)
+        assert await engine.recover_runs("at_most_once") == []
+        final = await storage.get_run(run_id)
+        assert final.status == "failed"
+
+        pure_run = await crash_mid_run(storage, "recovery_test_pure_gate")
+        GATE["event"].set()
+        assert await engine.recover_runs("at_most_once") == [pure_run]
+        assert (await engine.wait_for_run(pure_run, timeout=2)).status == "completed"
+
+    with_storage(scenario)
+
+
+def test_pending_runs_are_resubmitted():
+    async def scenario(storage):
+        CALLS.clear()
+        GATE["event"] = asyncio.Event()
+        GATE["event"].set()
+        engine = WorkflowEngine(storage)
+        graph_id = await engine.create_graph(gated_graph("recovery_test_gate"))
+        # Admitted but never started before the "crash"
+        engine.scheduler.check_capacity = lambda count=1: None
+        engine.scheduler.submit = lambda *args, **kwargs: None
+        run_id = await engine.start_run(graph_id, {})
+
+        fresh = WorkflowEngine(storage)
+        assert await fresh.recover_runs() == [run_id]
+        assert (await fresh.wait_for_run(run_id, timeout=2)).status == "completed"
+        assert CALLS == ["a", "gate", "c"]
+
+    with_storage(scenario)
+
+
+if __name__ == "__main__":
+    test_at_least_once_resumes_after_last_logged_node()
+    test_pending_run_with_logged_steps_resumes_after_them()
+    test_at_most_once_fails_unless_next_node_is_pure()
+    test_pending_runs_are_resubmitted()
+    print("=== ALL TESTS PASSED ===")
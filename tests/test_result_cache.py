@@ -0,0 +1,183 @@
+"""Tests for the pure tool result cache."""
+import asyncio
+import os
+import pickle
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.cache import ResultCache, MemoryCacheTier, DiskCacheTier
+from app.core.engine import WorkflowEngine
+from app.core.registry import ToolRegistry
+from app.core.storage import InMemoryStorage
+from app.models.schemas import GraphDefinition, NodeDefinition, EdgeDefinition
+
+CALLS = []
+
+
+@ToolRegistry.register("cache_test_square", pure=True, inputs=["x"])
+def cache_test_square(state, offset: int = 0):
+    CALLS.append(state["x"])
+    return {"square": state["x"] ** 2 + offset, "items": [state["x"]]}
+
+
+def square_graph(offset: int = 0) -> GraphDefinition:
+    return GraphDefinition(
+        nodes=[
+            NodeDefinition(id="sq", tool="cache_test_square", params={"offset": offset}),
+            NodeDefinition(id="end", tool="passthrough"),
+        ],
+        edges=[EdgeDefinition(from_node="sq", to_node="end")],
+        start_node="sq",
+    )
+
+
+def test_pure_tool_results_are_reused():
+    async def scenario():
+        CALLS.clear()
+        cache = ResultCache()
+        engine = WorkflowEngine(InMemoryStorage(), cache=cache)
+        graph_id = await engine.create_graph(square_graph())
+        other_id = await engine.create_graph(square_graph(offset=1))
+
+        async def run(graph, state):
+            final = await engine.wait_for_run(await engine.start_run(graph, state), timeout=2)
+            assert final.status == "completed"
+            return final
+
+        first = await run(graph_id, {"x": 3, "noise": 1})
+        # Undeclared keys don't affect the key; the cached value is a copy
+        first.state["items"].append("mutated")
+        second = await run(graph_id, {"x": 3, "noise": 2})
+        assert second.state["square"] == 9 and second.state["items"] == [3]
+        # Different inputs or params miss
+        await run(graph_id, {"x": 4})
+        assert (await run(other_id, {"x": 3})).state["square"] == 10
+
+        assert CALLS == [3, 4, 3]
+        assert cache.stats()["cache_test_square"] == {"hits": 1, "misses": 3, "evictions": 0}
+        logs = await engine.storage.get_logs(second.run_id)
+        assert logs[0].cached is True and logs[1].cached is None
+
+    asyncio.run(scenario())
+
+
+def test_register_pure_requires_inputs():
+    try:
+        ToolRegistry.register("cache_test_undeclared", pure=True)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("pure tools must declare inputs")
+
+
+def test_version_changes_key():
+    key = ResultCache.make_key("t", "1", {"a": 1}, {"x": [1, 2]})
+    assert key == ResultCache.make_key("t", "1", {"a": 1}, {"x": [1, 2]})
+    assert key != ResultCache.make_key("t", "2", {"a": 1}, {"x": [1, 2]})
+    # Values that only differ in type get different keys
+    assert ResultCache.make_key("t", "1", {}, {"x": {1: "a"}}) != ResultCache.make_key("t", "1", {}, {"x": {"1": "a"}})
+    assert ResultCache.make_key("t", "1", {}, {"x": (1, 2)}) != ResultCache.make_key("t", "1", {}, {"x": [1, 2]})
+    assert ResultCache.make_key("t", "1", {}, {"x": 1}) != ResultCache.make_key("t", "1", {}, {"x": 1.0})
+    # Key and set order don't matter
+    assert ResultCache.make_key("t", "1", {}, {"x": {2: 1, "a": 0}, "s": {3, 1}}) == ResultCache.make_key(
+        "t", "1", {}, {"s": {1, 3}, "x": {"a": 0, 2: 1}}
+    )
+    # Other objects fall back to pickle
+    assert ResultCache.make_key("t", "1", {}, {"x": datetime(2024, 1, 1)}) is not None
+
+
+def test_memory_tier_byte_bound_and_ttl():
+    cache = ResultCache([MemoryCacheTier(max_bytes=200)])
+    blob_size = len(pickle.dumps("x" * 50, protocol=4))
+    for i in range(200 // blob_size + 2):
+        cache.set("tool", f"k{i}", "x" * 50)
+    assert cache.tiers[0].size <= 200
+    assert cache.get("tool", "k0") == (False, None)
+    assert cache.stats()["tool"]["evictions"] >= 2
+
+    expiring = ResultCache([MemoryCacheTier(ttl=0.01)])
+    expiring.set("tool", "k", 1)
+    assert expiring.get("tool", "k") == (True, 1)
+    time.sleep(0.02)
+    assert expiring.get("tool", "k") == (False, None)
+
+
+def test_disk_tier_survives_memory_and_promotes():
+    with tempfile.TemporaryDirectory() as directory:
+        ResultCache([MemoryCacheTier(), DiskCacheTier(directory)]).set("tool", "k", {"v": 1})
+
+        # A fresh cache (e.g. after a restart) finds the entry on disk
+        cache = ResultCache([MemoryCacheTier(), DiskCacheTier(directory)])
+        assert cache.get("tool", "k") == (True, {"v": 1})
+        assert cache.tiers[0].get("k") is not None
+
+
+def test_disk_tier_byte_bound_evicts_least_recently_used():
+    with tempfile.TemporaryDirectory() as directory:
+        blob = b"x" * 100
+        tier = DiskCacheTier(directory, max_bytes=1000)
+        for i in range(9):
+            tier.set(f"k{i}", "tool", blob)
+            os.utime(os.path.join(directory, f"k{i}"), (i, i))
+        # Reading k0 makes it the most recently used
+        assert tier.get("k0") == blob
+        for i in range(9, 12):
+            tier.set(f"k{i}", "tool", blob)
+        files = sorted(name for name in os.listdir(directory))
+        assert tier.size <= 1000 and tier.size == 100 * len(files)
+        assert "k0" in files and "k1" not in files and "k11" in files
+
+        # A new tier over the same directory starts from its size
+        assert DiskCacheTier(directory, max_bytes=1000).size == tier.size
+
+    # Rewriting a key replaces its size rather than adding to it
+    with tempfile.TemporaryDirectory() as directory:
+        tier = DiskCacheTier(directory, max_bytes=1000)
+        for size in (100, 300, 200):
+            tier.set("k", "tool", b"x" * size)
+        assert tier.size == 200 and len(os.listdir(directory)) == 1
+
+
+class ThreadRecordingDiskTier(DiskCacheTier):
+    def __init__(self, directory: str):
+        super().__init__(directory)
+        self.threads = set()
+
+    def get(self, key):
+        self.threads.add(threading.current_thread())
+        return super().get(key)
+
+    def set(self, key, tool, blob):
+        self.threads.add(threading.current_thread())
+        super().set(key, tool, blob)
+
+
+def test_engine_reads_and_writes_the_disk_tier_off_the_event_loop():
+    async def scenario(directory):
+        disk = ThreadRecordingDiskTier(directory)
+        engine = WorkflowEngine(InMemoryStorage(), cache=ResultCache([disk]))
+        graph_id = await engine.create_graph(square_graph())
+        for _ in range(2):
+            final = await engine.wait_for_run(await engine.start_run(graph_id, {"x": 5}), timeout=2)
+            assert final.status == "completed" and final.state["square"] == 25
+        assert engine.cache.stats()["cache_test_square"] == {"hits": 1, "misses": 1, "evictions": 0}
+        assert disk.threads and threading.main_thread() not in disk.threads
+
+    with tempfile.TemporaryDirectory() as directory:
+        asyncio.run(scenario(directory))
+
+
+if __name__ == "__main__":
+    test_pure_tool_results_are_reused()
+    test_register_pure_requires_inputs()
+    test_version_changes_key()
+    test_memory_tier_byte_bound_and_ttl()
+    test_disk_tier_survives_memory_and_promotes()
+    test_disk_tier_byte_bound_evicts_least_recently_used()
+    test_engine_reads_and_writes_the_disk_tier_off_the_event_loop()
+    print("=== ALL TESTS PASSED ===")
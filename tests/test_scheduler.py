@@ -0,0 +1,97 @@
+"""Tests for the bounded run scheduler."""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.scheduler import RunScheduler, SchedulerFull
+
+
+def test_concurrency_limit_and_priority_order():
+    async def scenario():
+        scheduler = RunScheduler(max_concurrent_runs=2, max_queue_size=10)
+        running = 0
+        peak = 0
+        order = []
+
+        def job(name):
+            async def run():
+                nonlocal running, peak
+                running += 1
+                peak = max(peak, running)
+                order.append(name)
+                await asyncio.sleep(0.01)
+                running -= 1
+            return run
+
+        for i in range(4):
+            scheduler.submit(f"low{i}", "g-low", job(f"low{i}"))
+        scheduler.submit("high", "g-high", job("high"), priority=5)
+        assert scheduler.active_count == 2 and scheduler.queue_depth == 3
+
+        while scheduler.active_count or scheduler.queue_depth:
+            await asyncio.sleep(0.005)
+
+        assert peak == 2
+        # The first two started immediately; the high-priority run jumps the queue
+        assert order[:3] == ["low0", "low1", "high"]
+        stats = scheduler.stats()
+        assert stats["started"] == stats["finished"] == 5
+        assert stats["wait_ms"]["max"] > 0
+
+    asyncio.run(scenario())
+
+
+def test_admission_rejected_when_queue_full():
+    async def scenario():
+        scheduler = RunScheduler(max_concurrent_runs=1, max_queue_size=1)
+        gate = asyncio.Event()
+        scheduler.submit("a", "g", gate.wait)
+        scheduler.submit("b", "g", gate.wait)
+        try:
+            scheduler.check_capacity()
+        except SchedulerFull:
+            pass
+        else:
+            raise AssertionError("queue should be full")
+        assert scheduler.stats()["rejected"] == 1
+        gate.set()
+        await scheduler.shutdown(timeout=1)
+        assert scheduler.active_count == 0
+        # Admission stays closed after shutdown until the scheduler is reopened
+        try:
+            scheduler.check_capacity()
+        except SchedulerFull as e:
+            assert "shutting down" in str(e)
+        else:
+            raise AssertionError("scheduler should be closed")
+        scheduler.open()
+        scheduler.check_capacity()
+
+    asyncio.run(scenario())
+
+
+def test_cancelling_a_queued_run_keeps_it_counted_as_submitted():
+    async def scenario():
+        scheduler = RunScheduler(max_concurrent_runs=1, max_queue_size=10)
+        gate = asyncio.Event()
+        for run_id in ("a", "b", "c"):
+            scheduler.submit(run_id, "g", gate.wait)
+        assert scheduler.cancel("b") and not scheduler.cancel("missing")
+        stats = scheduler.stats()
+        assert stats["submitted"] == 3 and stats["cancelled"] == 1
+        assert stats["submitted"] == stats["started"] + stats["queue_depth"] + stats["cancelled"]
+        gate.set()
+        while scheduler.active_count or scheduler.queue_depth:
+            await asyncio.sleep(0.005)
+        assert scheduler.stats()["finished"] == 2
+
+    asyncio.run(scenario())
+
+
+if __name__ == "__main__":
+    test_concurrency_limit_and_priority_order()
+    test_admission_rejected_when_queue_full()
+    test_cancelling_a_queued_run_keeps_it_counted_as_submitted()
+    print("=== ALL TESTS PASSED ===")
@@ -0,0 +1,117 @@
+"""Tests for subgraph nodes run inline in the parent run."""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.deltas import expand_steps
+from app.core.engine import WorkflowEngine
+from app.core.storage import InMemoryStorage
+from app.core.registry import ToolRegistry
+from app.models.schemas import GraphDefinition, NodeDefinition, EdgeDefinition
+
+
+@ToolRegistry.register("subgraph_test_double")
+async def subgraph_test_double(state):
+    return {"value": state["value"] * 2}
+
+
+@ToolRegistry.register("subgraph_test_slow")
+async def subgraph_test_slow(state):
+    await asyncio.sleep(10)
+    return {}
+
+
+def child_graph(**graph) -> GraphDefinition:
+    return GraphDefinition(
+        nodes=[
+            NodeDefinition(id="double", tool="subgraph_test_double"),
+            NodeDefinition(id="again", tool="subgraph_test_double"),
+        ],
+        edges=[EdgeDefinition(from_node="double", to_node="again")],
+        start_node="double",
+        **graph,
+    )
+
+
+def parent_graph(child_id: str, **sub) -> GraphDefinition:
+    return GraphDefinition(
+        nodes=[
+            NodeDefinition(id="prep", tool="passthrough"),
+            NodeDefinition(id="sub", subgraph=child_id, **sub),
+            NodeDefinition(id="done", tool="passthrough"),
+        ],
+        edges=[EdgeDefinition(from_node="prep", to_node="sub"), EdgeDefinition(from_node="sub", to_node="done")],
+        start_node="prep",
+        log_mode="delta",
+        log_snapshot_every=100,
+    )
+
+
+def test_subgraph_maps_state_and_prefixes_logs():
+    async def scenario():
+        engine = WorkflowEngine(InMemoryStorage())
+        child_id = await engine.create_graph(child_graph(log_mode="delta", log_snapshot_every=100))
+        graph_id = await engine.create_graph(
+            parent_graph(child_id, input_map={"value": "n"}, output_map={"value": "result"})
+        )
+        final = await engine.wait_for_run(await engine.start_run(graph_id, {"n": 3}), timeout=2)
+        assert final.status == "completed"
+        # Only mapped keys cross the boundary
+        assert final.state == {"n": 3, "result": 12}
+
+        logs = await engine.storage.get_logs(final.run_id)
+        assert [log.node_id for log in logs] == ["prep", "sub/double", "sub/again", "sub", "done"]
+        assert [log.step_index for log in logs] == [0, 1, 2, 3, 4]
+        expanded = expand_steps(logs)
+        assert expanded[2].output_state == {"value": 12}
+        # Nested steps don't leak into the parent's reconstructed state
+        assert expanded[3].input_state == {"n": 3} and expanded[4].output_state == {"n": 3, "result": 12}
+
+    asyncio.run(scenario())
+
+
+def test_subgraph_without_maps_shares_whole_state():
+    async def scenario():
+        engine = WorkflowEngine(InMemoryStorage())
+        child_id = await engine.create_graph(child_graph())
+        graph_id = await engine.create_graph(parent_graph(child_id))
+        final = await engine.wait_for_run(await engine.start_run(graph_id, {"value": 1, "other": "x"}), timeout=2)
+        assert final.status == "completed" and final.state == {"value": 4, "other": "x"}
+
+    asyncio.run(scenario())
+
+
+def test_unknown_subgraph_and_timeout():
+    async def scenario():
+        engine = WorkflowEngine(InMemoryStorage())
+        try:
+            await engine.create_graph(parent_graph("missing"))
+        except ValueError as e:
+            assert "Subgraph 'missing' not found" in str(e)
+        else:
+            raise AssertionError("a missing subgraph should be rejected")
+
+        slow_id = await engine.create_graph(
+            GraphDefinition(nodes=[NodeDefinition(id="slow", tool="subgraph_test_slow")], edges=[], start_node="slow")
+        )
+        graph_id = await engine.create_graph(parent_graph(slow_id, timeout_ms=50))
+        final = await engine.wait_for_run(await engine.start_run(graph_id, {}), timeout=2)
+        assert final.status == "failed" and "Node sub timed out after 50 ms" in final.message
+
+        try:
+            NodeDefinition(id="both", tool="passthrough", subgraph=slow_id)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("a node can't have both a tool and a subgraph")
+
+    asyncio.run(scenario())
+
+
+if __name__ == "__main__":
+    test_subgraph_maps_state_and_prefixes_logs()
+    test_subgraph_without_maps_shares_whole_state()
+    test_unknown_subgraph_and_timeout()
+    print("=== ALL TESTS PASSED ===")
@@ -0,0 +1,146 @@
+"""Tests for per-run tracing and span exporters."""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+
+from app.core.engine import WorkflowEngine
+from app.core.registry import ToolRegistry
+from app.core.storage import InMemoryStorage
+from app.core.tracing import JsonlExporter, OtlpJsonExporter, Tracer
+from app.main import app
+from app.models.schemas import GraphDefinition, NodeDefinition, EdgeDefinition
+
+
+@ToolRegistry.register("trace_test_count")
+def trace_test_count(state):
+    return {"count": state.get("count", 0) + 1}
+
+
+def counting_graph() -> GraphDefinition:
+    return GraphDefinition(
+        nodes=[NodeDefinition(id="count", tool="trace_test_count"), NodeDefinition(id="done", tool="passthrough")],
+        edges=[
+            EdgeDefinition(from_node="count", to_node="count", condition="state['count'] < 3"),
+            EdgeDefinition(from_node="count", to_node="done"),
+        ],
+        start_node="count",
+    )
+
+
+def walk(node):
+    yield node
+    for child in node["children"]:
+        yield from walk(child)
+
+
+def test_run_trace_tree_and_file_exporters():
+    async def scenario(directory):
+        jsonl, otlp = os.path.join(directory, "spans.jsonl"), os.path.join(directory, "otlp.json")
+        tracer = Tracer(sample_rate=1.0, exporters=[JsonlExporter(jsonl), OtlpJsonExporter(otlp)])
+        engine = WorkflowEngine(InMemoryStorage(), tracer=tracer)
+        graph_id = await engine.create_graph(counting_graph())
+        final = await engine.wait_for_run(await engine.start_run(graph_id, {}), timeout=2)
+        assert final.status == "completed"
+
+        root = tracer.get_trace(final.run_id)
+        assert root["name"] == "run" and root["attributes"]["status"] == "completed"
+        nodes = [child for child in root["children"] if child["name"] == "node"]
+        assert [node["attributes"]["node_id"] for node in nodes] == ["count", "count", "count", "done"]
+        tool = next(child for child in nodes[0]["children"] if child["name"] == "tool")
+        assert tool["attributes"]["executor"] == "default" and tool["attributes"]["queue_ms"] >= 0
+        names = {span["name"] for span in walk(root)}
+        assert {"condition", "save_run", "add_log", "broadcast_log"} <= names
+        conditions = [span["attributes"]["matched"] for span in walk(root) if span["name"] == "condition"]
+        assert conditions == [True, True, False]
+        # Every span ends within its parent
+        for parent in walk(root):
+            for child in parent["children"]:
+                assert parent["start_time_ns"] <= child["start_time_ns"] <= child["end_time_ns"] <= parent["end_time_ns"]
+
+        # Written by a background thread; close() writes out what is queued
+        tracer.close()
+        with open(jsonl) as f:
+            lines = [json.loads(line) for line in f]
+        assert len(lines) == len(list(walk(root))) and lines[0]["parent_id"] is None
+        assert lines[0]["attributes"]["status"] == "completed"
+        with open(otlp) as f:
+            request = json.loads(f.readline())
+        spans = request["resourceSpans"][0]["scopeSpans"][0]["spans"]
+        span_ids = {span["spanId"] for span in spans}
+        assert all(span["parentSpanId"] in span_ids for span in spans if "parentSpanId" in span)
+        assert len({span["traceId"] for span in spans}) == 1
+
+    with tempfile.TemporaryDirectory() as directory:
+        asyncio.run(scenario(directory))
+
+
+def test_file_exporter_writes_off_the_calling_thread():
+    class RecordingExporter(JsonlExporter):
+        def _format(self, run_id, spans):
+            threads.add(threading.current_thread())
+            return super()._format(run_id, spans)
+
+    async def scenario(directory):
+        exporter = RecordingExporter(os.path.join(directory, "spans.jsonl"), max_pending=1)
+        tracer = Tracer(sample_rate=1.0, exporters=[exporter])
+        engine = WorkflowEngine(InMemoryStorage(), tracer=tracer)
+        graph_id = await engine.create_graph(counting_graph())
+        for _ in range(3):
+            await engine.wait_for_run(await engine.start_run(graph_id, {}), timeout=2)
+        tracer.flush(timeout=2)
+        assert threads and threading.current_thread() not in threads
+        with open(exporter.path) as f:
+            runs = {json.loads(line)["run_id"] for line in f}
+        # A trace is dropped, not queued, while max_pending traces wait
+        assert len(runs) + exporter.dropped == 3
+        tracer.close()
+
+    threads = set()
+    with tempfile.TemporaryDirectory() as directory:
+        asyncio.run(scenario(directory))
+
+
+def test_sampling_and_span_limit():
+    async def scenario():
+        tracer = Tracer(sample_rate=0.0)
+        engine = WorkflowEngine(InMemoryStorage(), tracer=tracer)
+        graph_id = await engine.create_graph(counting_graph())
+        final = await engine.wait_for_run(await engine.start_run(graph_id, {}), timeout=2)
+        assert tracer.get_trace(final.run_id) is None
+
+        tracer.configure(sample_rate=1.0, max_spans=5)
+        final = await engine.wait_for_run(await engine.start_run(graph_id, {}), timeout=2)
+        root = tracer.get_trace(final.run_id)
+        assert len(list(walk(root))) == 5 and root["attributes"]["dropped_spans"] > 0
+
+    asyncio.run(scenario())
+
+
+def test_trace_endpoint():
+    with TestClient(app) as client:
+        from app.api.routes import get_engine
+        get_engine().tracer.configure(sample_rate=1.0)
+        try:
+            graph = {"nodes": [{"id": "n", "tool": "passthrough"}], "edges": [], "start_node": "n"}
+            graph_id = client.post("/graph/create", json=graph).json()["graph_id"]
+            run_id = client.post("/graph/run?wait=true", json={"graph_id": graph_id}).json()["run_id"]
+            resp = client.get(f"/graph/trace/{run_id}")
+            assert resp.status_code == 200 and resp.json()["attributes"]["run_id"] == run_id
+            assert client.get("/graph/trace/missing").status_code == 404
+        finally:
+            get_engine().tracer.configure(sample_rate=0.0)
+
+
+if __name__ == "__main__":
+    test_run_trace_tree_and_file_exporters()
+    test_file_exporter_writes_off_the_calling_thread()
+    test_sampling_and_span_limit()
+    test_trace_endpoint()
+    print("=== ALL TESTS PASSED ===")
@@ -0,0 +1,250 @@
+"""Tests for the shared run queue and worker processes."""
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.engine import WorkflowEngine
+from app.core.registry import ToolRegistry
+from app.core.run_queue import QueuedRun, RunQueue
+from app.core.storage import SQLiteStorage
+from app.models.schemas import GraphDefinition, NodeDefinition, EdgeDefinition
+from app.worker import RunWorker
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@ToolRegistry.register("worker_test_step")
+async def worker_test_step(state):
+    return {"steps": state.get("steps", 0) + 1}
+
+
+@ToolRegistry.register("worker_test_gate")
+async def worker_test_gate(state):
+    # Holds the run until the file named in the state exists
+    while not os.path.exists(state["gate"]):
+        await asyncio.sleep(0.02)
+    return {"gate_passed": True}
+
+
+def gated_graph() -> GraphDefinition:
+    return GraphDefinition(
+        nodes=[
+            NodeDefinition(id="first", tool="worker_test_step"),
+            NodeDefinition(id="gate", tool="worker_test_gate"),
+            NodeDefinition(id="last", tool="worker_test_step"),
+        ],
+        edges=[EdgeDefinition(from_node="first", to_node="gate"), EdgeDefinition(from_node="gate", to_node="last")],
+        start_node="first",
+    )
+
+
+async def open_storage(directory: str) -> SQLiteStorage:
+    storage = SQLiteStorage(f"sqlite+aiosqlite:///{os.path.join(directory, 'runs.db')}", wal=True)
+    await storage.init_db()
+    return storage
+
+
+async def wait_until(predicate, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while not await predicate():
+        assert time.monotonic() < deadline, "timed out"
+        await asyncio.sleep(0.02)
+
+
+def test_queue_leases_and_cancel_requests():
+    async def scenario(directory):
+        queue = RunQueue(os.path.join(directory, "queue.db"), lease_seconds=0.2)
+        await queue.enqueue([QueuedRun("a", "g"), QueuedRun("b", "g", priority=5), QueuedRun("c", "g")])
+
+        # Highest priority first, FIFO within a priority
+        assert [run.run_id for run in await queue.claim("w1", 2)] == ["b", "a"]
+        assert [run.run_id for run in await queue.claim("w2", 5)] == ["c"]
+        assert await queue.heartbeat("w1", ["a", "b"]) == (set(), set())
+
+        # w1 stops heartbeating: its leases expire and w2 takes the runs over
+        await asyncio.sleep(0.3)
+        await queue.heartbeat("w2", ["c"])
+        reclaimed = await queue.claim("w2", 5)
+        assert sorted(run.run_id for run in reclaimed) == ["a", "b"] and all(run.attempts == 2 for run in reclaimed)
+        lost, _ = await queue.heartbeat("w1", ["a", "b"])
+        assert lost == {"a", "b"}
+        assert not await queue.complete("w1", "a") and await queue.complete("w2", "a")
+
+        assert await queue.request_cancel("b") == "leased"
+        assert await queue.heartbeat("w2", ["b", "c"]) == (set(), {"b"})
+        assert await queue.release("w2") == 2
+        assert await queue.request_cancel("c") == "queued" and await queue.request_cancel("c") is None
+        stats = await queue.stats()
+        assert stats["queued"] == 1 and stats["leased"] == 0
+        queue.close()
+
+    with tempfile.TemporaryDirectory() as directory:
+        asyncio.run(scenario(directory))
+
+
+def test_front_end_enqueues_and_worker_executes():
+    async def scenario(directory):
+        storage = await open_storage(directory)
+        queue_path = os.path.join(directory, "queue.db")
+        front = WorkflowEngine(storage, run_queue=RunQueue(queue_path, lease_seconds=0.3))
+        worker = RunWorker(WorkflowEngine(storage), RunQueue(queue_path, lease_seconds=0.3), concurrency=4)
+        worker_task = asyncio.create_task(worker.run())
+
+        graph_id = await front.create_graph(GraphDefinition(
+            nodes=[NodeDefinition(id="a", tool="worker_test_step"), NodeDefinition(id="b", tool="worker_test_step")],
+            edges=[EdgeDefinition(from_node="a", to_node="b")],
+            start_node="a",
+        ))
+        run_ids = await front.start_runs(graph_id, [{} for _ in range(10)])
+        finals = [await front.wait_for_run(run_id, timeout=10) for run_id in run_ids]
+        assert all(final.status == "completed" and final.state["steps"] == 2 for final in finals)
+        assert not front.live_runs and worker.stats()["completed"] == 10
+
+        # Cancelling a run a worker holds reaches it through the heartbeat
+        gate = os.path.join(directory, "never")
+        gated_id = await front.create_graph(gated_graph())
+        run_id = await front.start_run(gated_id, {"gate": gate})
+        await wait_until(lambda: _at_node(storage, run_id, "gate"))
+        assert (await front.cancel_run(run_id)).status == "cancelled"
+        assert (await front.run_queue.stats())["leased"] == 0
+
+        worker.stop()
+        await asyncio.wait_for(worker_task, 5)
+        await front.persistence.close()
+        await worker.engine.persistence.close()
+        await storage.engine.dispose()
+
+    with tempfile.TemporaryDirectory() as directory:
+        asyncio.run(scenario(directory))
+
+
+async def _at_node(storage, run_id: str, node_id: str) -> bool:
+    run = await storage.get_run(run_id)
+    return run is not None and run.status == "running" and run.current_node == node_id
+
+
+def test_crashed_worker_process_runs_are_taken_over():
+    async def scenario(directory):
+        storage = await open_storage(directory)
+        queue_path = os.path.join(directory, "queue.db")
+        env = {
+            **os.environ,
+            "STORAGE_TYPE": "sqlite",
+            "DATABASE_URL": f"sqlite+aiosqlite:///{os.path.join(directory, 'runs.db')}",
+            "RUN_QUEUE_PATH": queue_path,
+            "RUN_LEASE_SECONDS": "1",
+            "TOOL_MODULES": "tests.test_workers",
+            "PYTHONPATH": ROOT,
+        }
+        process = subprocess.Popen([sys.executable, "-m", "app.worker"], cwd=ROOT, env=env)
+        try:
+            front = WorkflowEngine(storage, run_queue=RunQueue(queue_path, lease_seconds=1))
+            gate = os.path.join(directory, "gate")
+            run_id = await front.start_run(await front.create_graph(gated_graph()), {"gate": gate})
+            await wait_until(lambda: _at_node(storage, run_id, "gate"), timeout=30)
+            process.send_signal(signal.SIGKILL)
+            process.wait()
+        finally:
+            if process.poll() is None:
+                process.kill()
+
+        # A second worker claims the run once the dead worker's lease expires
+        # and resumes it after its last logged step
+        open(gate, "w").close()
+        worker = RunWorker(WorkflowEngine(storage), RunQueue(queue_path, lease_seconds=1))
+        worker_task = asyncio.create_task(worker.run())
+        final = await front.wait_for_run(run_id, timeout=10)
+        assert final.status == "completed" and final.state["steps"] == 2 and final.state["gate_passed"]
+        logs = await storage.get_logs(run_id)
+        assert [log.node_id for log in logs] == ["first", "gate", "last"]
+        assert worker.stats()["claimed"] == 1
+
+        worker.stop()
+        await asyncio.wait_for(worker_task, 5)
+        await front.persistence.close()
+        await worker.engine.persistence.close()
+        await storage.engine.dispose()
+
+    with tempfile.TemporaryDirectory() as directory:
+        asyncio.run(scenario(directory))
+
+
+def test_websocket_relay_follows_worker_runs():
+    async def scenario(directory):
+        from app.api.routes import _relay_stored_events
+        from app.core.websocket_manager import ConnectionManager
+
+        storage = await open_storage(directory)
+        queue_path = os.path.join(directory, "queue.db")
+        front = WorkflowEngine(storage, run_queue=RunQueue(queue_path, poll_interval=0.01))
+        worker = RunWorker(WorkflowEngine(storage), RunQueue(queue_path, poll_interval=0.01))
+        worker_task = asyncio.create_task(worker.run())
+
+        gate = os.path.join(directory, "gate")
+        run_id = await front.start_run(await front.create_graph(gated_graph()), {"gate": gate})
+        # Its own manager: the in-process worker broadcasts to the global one
+        manager = ConnectionManager()
+        relay = asyncio.create_task(_relay_stored_events(run_id, front, manager))
+        await wait_until(lambda: _at_node(storage, run_id, "gate"))
+        open(gate, "w").close()
+        await asyncio.wait_for(relay, 10)
+
+        events = [entry[1] for entry in manager.buffers[run_id].events]
+        assert [event.get("node_id") or event["status"] for event in events] == ["running", "first", "gate", "last", "completed"]
+        assert [event["seq"] for event in events] == [1, 2, 3, 4, 5]
+
+        worker.stop()
+        await asyncio.wait_for(worker_task, 5)
+        for engine in (front, worker.engine):
+            await engine.persistence.close()
+        await storage.engine.dispose()
+
+    with tempfile.TemporaryDirectory() as directory:
+        asyncio.run(scenario(directory))
+
+
+def test_stopped_worker_releases_unfinished_runs():
+    async def scenario(directory):
+        storage = await open_storage(directory)
+        queue_path = os.path.join(directory, "queue.db")
+        front = WorkflowEngine(storage, run_queue=RunQueue(queue_path))
+        gate = os.path.join(directory, "gate")
+        run_id = await front.start_run(await front.create_graph(gated_graph()), {"gate": gate})
+
+        first = RunWorker(WorkflowEngine(storage), RunQueue(queue_path))
+        first_task = asyncio.create_task(first.run(drain_timeout=0.1))
+        await wait_until(lambda: _at_node(storage, run_id, "gate"))
+        first.stop()
+        await asyncio.wait_for(first_task, 5)
+        # Released at once rather than after the 30s lease
+        assert (await front.run_queue.stats())["queued"] == 1
+
+        open(gate, "w").close()
+        second = RunWorker(WorkflowEngine(storage), RunQueue(queue_path))
+        second_task = asyncio.create_task(second.run())
+        final = await front.wait_for_run(run_id, timeout=10)
+        assert final.status == "completed" and [log.node_id for log in await storage.get_logs(run_id)] == ["first", "gate", "last"]
+
+        second.stop()
+        await asyncio.wait_for(second_task, 5)
+        for engine in (front, first.engine, second.engine):
+            await engine.persistence.close()
+        await storage.engine.dispose()
+
+    with tempfile.TemporaryDirectory() as directory:
+        asyncio.run(scenario(directory))
+
+
+if __name__ == "__main__":
+    test_queue_leases_and_cancel_requests()
+    test_front_end_enqueues_and_worker_executes()
+    test_crashed_worker_process_runs_are_taken_over()
+    test_websocket_relay_follows_worker_runs()
+    test_stopped_worker_releases_unfinished_runs()
+    print("=== ALL TESTS PASSED ===")